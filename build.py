@@ -1,8 +1,10 @@
 from conan.packager import ConanMultiPackager
-import os, re, platform
+import os, re, platform, subprocess
 from distutils.util import strtobool
 
 from collections import defaultdict
+import build_plan
+import build_history
 
 def get_value_from_recipe(search_string):
     with open("conanfile.py", "r") as conanfile:
@@ -57,6 +59,10 @@ if __name__ == "__main__":
 
     reference = "{0}/{1}".format(name, version)
 
+    # the recipe drops the per-phase build metrics of every package it builds in there
+    if "CONAN_ICU_METRICS_DIR" not in os.environ:
+        os.environ["CONAN_ICU_METRICS_DIR"] = os.path.join(os.getcwd(), "metrics")
+
     builder = ConanMultiPackager(args="--build missing",
                                  username=username,
                                  channel=channel,
@@ -69,6 +75,9 @@ if __name__ == "__main__":
     if "CONAN_ICU_SHARED" in os.environ:
         conan_build_options.update({"icu:shared": True if strtobool(os.environ["CONAN_ICU_SHARED"]) else False})
 
+    if "CONAN_ICU_SHARED_AND_STATIC" in os.environ:
+        conan_build_options.update({"icu:shared_and_static": True if strtobool(os.environ["CONAN_ICU_SHARED_AND_STATIC"]) else False})
+
     if "CONAN_ICU_DATA_PACKAGING" in os.environ:
         conan_build_options.update({"icu:data_packaging": os.environ["CONAN_ICU_DATA_PACKAGING"]})
 
@@ -84,5 +93,23 @@ if __name__ == "__main__":
 
     builder.add(settings=conan_build_settings, options=conan_build_options)
 
+    # drops the builds whose package already exists (in the local cache or on CONAN_ICU_PLAN_REMOTE)
+    # or duplicates another one's package id, unless CONAN_ICU_REBUILD is set
+    if not strtobool(os.environ.get("CONAN_ICU_REBUILD", "False")):
+        # the existing packages are outdated against the exported recipe, not the one in this folder
+        if subprocess.call("conan export {0}/{1}".format(username, channel), shell=True) != 0:
+            raise Exception("exporting the recipe to {0}/{1} failed".format(username, channel))
+        configs = []
+        for settings, options, env_vars, build_requires in builder.items:
+            args = " ".join(["-s {0}={1}".format(k, v) for k, v in sorted(settings.items())] +
+                            ["-o {0}={1}".format(k, v) for k, v in sorted(options.items())])
+            configs.append({'name': args or 'default', 'args': args, 'item': (settings, options, env_vars, build_requires)})
+        remotes = [os.environ["CONAN_ICU_PLAN_REMOTE"]] if os.environ.get("CONAN_ICU_PLAN_REMOTE") else []
+        to_build, skipped = build_plan.plan(configs, os.getcwd(), "{0}@{1}/{2}".format(reference, username, channel), remotes)
+        build_plan.print_plan(to_build, skipped)
+        builder.items = [config['item'] for config in to_build]
+
     builder.run()
 
+    build_history.collect_metrics(os.environ["CONAN_ICU_METRICS_DIR"], "build_metrics.json")
+
@@ -1,6 +1,43 @@
-import subprocess, os, sys
+import subprocess, os, sys, time, argparse, multiprocessing, threading
+from multiprocessing.pool import ThreadPool
+import build_plan
+import build_history
+from conanfile import IcuConan
 
-# python build_all.py > build_all.log
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+# python build_all_local.py linux --jobs 64 --parallel 8 > build_all.log
+#
+# The recipe is exported once, then every configuration of the matrix is a separate 'conan create' that
+# doesn't export it again (-ne) and logs to its own file.
+# The configurations are run concurrently under a global budget of make jobs (--jobs, defaults
+# to the number of cpus), which is split evenly between the builds running at the same time
+# (--parallel) and handed to the recipe through CONAN_CPU_COUNT. The number of concurrent builds
+# is also capped by the available memory divided by --mem-per-build, which is also the memory limit
+# (CONAN_ICU_MEM_LIMIT) of builds with -o icu:jobs=auto.
+#
+# The per-phase build metrics written by the recipe to CONAN_ICU_METRICS_DIR (./metrics by default)
+# are merged into build_metrics.json at the end of the run. The library sizes and benchmark results of
+# the packages built by the run are appended to build_history.jsonl, 'python build_history.py compare'
+# flags the regressions against the previous run.
+#
+# --shared-and-static builds every configuration once with -o icu:shared_and_static=True instead of
+# building the shared and the static libraries separately.
+#
+# Before building, the package id of every configuration is computed (see build_plan.py): configurations
+# whose binary is already in the local cache or on --remote (sigmoidal by default) are skipped, as are
+# those that collapse onto the package id of another one, i.e. msvc_platform=cygwin next to msys. The
+# others run longest first by their durations in build_durations.json. --rebuild builds everything.
+#
+# --upload REMOTE (sigmoidal for the Windows matrix) uploads the package of every configuration that
+# passed as soon as it is built, in a background worker while the following configurations build.
+# Only the new package id is uploaded (the recipe once before it), failed uploads are retried
+# --upload-retries times and --upload-limit KB/s caps the bandwidth through trickle, if installed (not
+# on Windows, which has no trickle).
+# The queue is drained before the summary, which lists what was uploaded.
 #
 # MSVC++ 4.x  _MSC_VER == 1000
 # MSVC++ 5.0  _MSC_VER == 1100
@@ -14,149 +51,419 @@ import subprocess, os, sys
 # MSVC++ 12.0 _MSC_VER == 1800 (Visual Studio 2013)
 # MSVC++ 14.0 _MSC_VER == 1900 (Visual Studio 2015)
 # MSVC++ 14.1 _MSC_VER >= 1910 (Visual Studio 2017)
-#  
+#
 
 def usage():
-    print("Usage: %s [win | linux | macosx]" % sys.argv[0]) 
-    
-def main(target_os):
+    print("Usage: %s [win | linux | macosx] [--jobs N] [--parallel N] [--mem-per-build MB] [--shared-and-static] "
+          "[--remote NAME] [--rebuild] [--upload REMOTE] [--upload-retries N] [--upload-limit KB/s]" % sys.argv[0])
+
+def link_options(link):
+    if link == 'both':
+        return '-o icu:shared_and_static=True'
+    return '-o icu:shared={0}'.format(link)
+
+def link_name(link):
+    if link == 'both':
+        return link
+    return 'shared' if link else 'static'
+
+def plan_budget(configs, jobs, parallel, mem_per_build):
+    if not parallel:
+        parallel = max(1, jobs // 8)
+
+    mem = IcuConan.available_memory_mb()
+    if mem is not None and mem_per_build:
+        parallel = min(parallel, max(1, mem // mem_per_build))
+
+    parallel = max(1, min(parallel, len(configs)))
+    return parallel, max(1, jobs // parallel)
+
+def run_config(config):
+    env = dict(os.environ)
+    env.update(config['env'])
+
+    cmdstr = " ".join(config['cmd'].split())
+    print("[{os}] {cmdstr} > {log}".format(os=config['os'], cmdstr=cmdstr, log=config['log']))
+    sys.stdout.flush()
+
+    start = time.time()
+    with open(config['log'], 'w') as log:
+        retcode = subprocess.call(cmdstr, shell=True, env=env, stdout=log, stderr=subprocess.STDOUT)
+    config['retcode'] = retcode
+    config['duration'] = time.time() - start
+
+    print("[{os}] {status} {name} ({duration:.0f}s)".format(os=config['os'],
+                                                             status='PASS' if retcode == 0 else 'FAIL',
+                                                             name=config['name'],
+                                                             duration=config['duration']))
+    sys.stdout.flush()
+    return config
+
+def run_matrix(configs, jobs, parallel, mem_per_build, after_each=None):
+    if not configs:
+        return []
+
+    parallel, jobs_per_build = plan_budget(configs, jobs, parallel, mem_per_build)
+    print("Running {n} configurations, {parallel} at a time with -j {jobs_per_build} each".format(n=len(configs),
+                                                                                             parallel=parallel,
+                                                                                             jobs_per_build=jobs_per_build))
+    for config in configs:
+        config['env']['CONAN_CPU_COUNT'] = str(jobs_per_build)
+        # caps the recipe's jobs=auto budget to this build's share of the memory
+        if mem_per_build:
+            config['env']['CONAN_ICU_MEM_LIMIT'] = str(mem_per_build)
+
+    # The first configuration runs alone, so that the sources are retrieved once instead of
+    # concurrently by every build in the conan cache. The quickest one by the planned durations
+    # keeps the others waiting the least.
+    known = [config for config in configs if config.get('expected') is not None]
+    first = min(known, key=lambda config: config['expected']) if known else configs[0]
+    others = [config for config in configs if config is not first]
+
+    done = [run_config(first)]
+    if after_each:
+        after_each(first)
+
+    pool = ThreadPool(parallel)
+    try:
+        for config in pool.imap_unordered(run_config, others):
+            if after_each:
+                after_each(config)
+            done.append(config)
+    finally:
+        pool.close()
+        pool.join()
+
+    return done
+
+class UploadQueue(object):
+    """Uploads the packages of the finished configurations one at a time in a background thread."""
+
+    def __init__(self, reference, remote, retries=3, limit_kbps=0):
+        self.reference = reference
+        self.remote = remote
+        self.retries = retries
+        self.queue = Queue()
+        self.results = []
+        self.recipe_uploaded = False
+        self.wrapper = ''
+        if limit_kbps:
+            if any(os.path.isfile(os.path.join(path, 'trickle')) for path in os.environ.get('PATH', '').split(os.pathsep)):
+                self.wrapper = 'trickle -s -u {0} '.format(limit_kbps)
+            else:
+                print("WARNING: trickle is not installed, uploading without the --upload-limit of {0} KB/s".format(limit_kbps))
+        self.thread = threading.Thread(target=self.worker)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, config):
+        if config['retcode'] == 0:
+            self.queue.put(config)
+
+    def worker(self):
+        while True:
+            config = self.queue.get()
+            try:
+                if config is None:
+                    return
+                self.results.append(self.upload(config))
+            except Exception as e:
+                # a broken upload must not stop the worker, close() would wait for it forever
+                print("[upload] FAIL {0}: {1}".format(config['name'], e))
+                sys.stdout.flush()
+                self.results.append({'name': config['name'], 'package_id': config.get('package_id'), 'uploaded': False,
+                                     'error': str(e)})
+            finally:
+                self.queue.task_done()
+
+    def run(self, cmd, log):
+        for attempt in range(1, self.retries + 1):
+            with open(log, 'a') as f:
+                f.write("\n[upload attempt {0}] {1}\n".format(attempt, cmd))
+                f.flush()
+                if subprocess.call(cmd, shell=True, stdout=f, stderr=subprocess.STDOUT) == 0:
+                    return True
+            if attempt < self.retries:
+                time.sleep(min(60, 5 * 2 ** (attempt - 1)))
+        return False
+
+    def upload(self, config):
+        start = time.time()
+        result = {'name': config['name'], 'package_id': config.get('package_id'), 'uploaded': False}
+        try:
+            if not result['package_id']:
+                result['package_id'] = config['package_id'] = build_plan.package_id(
+                    os.path.dirname(os.path.abspath(__file__)), config['args'])
+        except Exception as e:
+            print("[upload] FAIL {0}: {1}".format(config['name'], e))
+            return result
+
+        if not self.recipe_uploaded:
+            self.recipe_uploaded = self.run('{0}conan upload {1} -r {2}'.format(self.wrapper, self.reference, self.remote),
+                                            config['log'])
+        if self.recipe_uploaded:
+            result['uploaded'] = self.run('{0}conan upload {1} -p {2} -r {3}'.format(self.wrapper, self.reference,
+                                                                                      result['package_id'], self.remote),
+                                          config['log'])
+        result['duration'] = time.time() - start
+
+        print("[upload] {status} {name} {package_id} to {remote} ({duration:.0f}s)".format(
+            status='DONE' if result['uploaded'] else 'FAIL', remote=self.remote, **result))
+        sys.stdout.flush()
+        return result
+
+    # Waits for the queued uploads and stops the worker
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        return self.results
+
+def print_uploads(uploads, remote):
+    if not uploads:
+        return
+    print("")
+    print("Uploaded to {0}:".format(remote))
+    for upload in sorted(uploads, key=lambda u: u['name']):
+        print("  {0:<6} {1} {2}".format('DONE' if upload['uploaded'] else 'FAIL', upload['package_id'], upload['name']))
+    failed = len([upload for upload in uploads if not upload['uploaded']])
+    print("{0} uploaded, {1} failed".format(len(uploads) - failed, failed))
+
+def print_summary(results):
+    if not results:
+        return
+
+    width = max(len(config['name']) for config in results)
+    print("")
+    print("{0:<{width}}  {1:<6}  {2:>9}".format("configuration", "result", "wall time", width=width))
+    print("{0}  {1}  {2}".format("-" * width, "-" * 6, "-" * 9))
+    for config in sorted(results, key=lambda c: c['name']):
+        minutes, seconds = divmod(int(config['duration']), 60)
+        print("{0:<{width}}  {1:<6}  {2:>6}:{3:02d}".format(config['name'],
+                                                          'PASS' if config['retcode'] == 0 else 'FAIL',
+                                                          minutes, seconds, width=width))
+    failed = len([config for config in results if config['retcode'] != 0])
+    print("{0} passed, {1} failed".format(len(results) - failed, failed))
+
+def main(target_os, jobs, parallel, mem_per_build, shared_and_static, remote, rebuild, upload_remote, upload_retries,
+         upload_limit):
     name = "icu"
     version = "60.1"
     channel = "sigmoidal/testing"
     archs = [ "x86", "x86_64" ]
     build_types = ["Release", "Debug"]
-    shared = [ True, False ]
+    shared = [ True, False ] if not shared_and_static else [ 'both' ]
     compiler_versions = [ "15", "14" ]
     msvc_platforms = [ "msys", "cygwin" ]
 
+    # trickle, which --upload-limit runs the uploads through, doesn't exist on Windows
+    if upload_limit and os.name == 'nt':
+        print("ERROR: --upload-limit is not supported on Windows")
+        return 1
+
+    results = []
+    run_start = time.time()
+
+    if 'CONAN_ICU_METRICS_DIR' not in os.environ:
+        os.environ['CONAN_ICU_METRICS_DIR'] = os.path.join(os.getcwd(), 'metrics')
+
     os.system('conan remote add sigmoidal "https://api.bintray.com/conan/sigmoidal/public-conan"')
 
+    # concurrent 'conan create' would each export the recipe to the same reference at the same time
+    if subprocess.call('conan export {channel} -k'.format(channel=channel), shell=True) != 0:
+        print("ERROR: exporting the recipe to {0} failed".format(channel))
+        return 1
+
+    reference = "{name}/{version}@{channel}".format(name=name, version=version, channel=channel)
+    recipe_dir = os.path.dirname(os.path.abspath(__file__))
+
+    def plan(configs):
+        if rebuild:
+            return configs
+        to_build, skipped = build_plan.plan(configs, recipe_dir, reference, remotes=[remote])
+        build_plan.print_plan(to_build, skipped)
+        return to_build
+
+    if upload_remote is None:
+        upload_remote = 'sigmoidal' if target_os == 'win' else ''
+    uploads = UploadQueue(reference, upload_remote, upload_retries, upload_limit) if upload_remote else None
+
+    def after_build(config):
+        build_plan.record_duration(config)
+        if uploads:
+            uploads.put(config)
+
     if target_os == 'win':
+        configs = []
         for msvc_platform in msvc_platforms:
-            source_clear_cmd = "conan remove {name}/{version}@{channel} -s -f".format(name=name, version=version, channel=channel)
-            os.system( source_clear_cmd )
-
             for arch in archs:
                 for compiler_version in compiler_versions:
                     for build_type in build_types:
                         for link in shared:
-                            if shared:
+                            if link:
                                 win_runtime = "MD" if build_type == "Release" else "MDd"
                             else:
                                 win_runtime = "MT" if build_type == "Release" else "MTd"
 
-                            cmd = 'conan create {channel} -k \
-                                   -s arch={arch} \
-                                   -s build_type={build_type} \
-                                   -s compiler.version={compiler} \
-                                   -s compiler.runtime={compiler_runtime} \
-                                   -o icu:with_unit_tests=True \
-                                   -o icu:msvc_platform={msvc_platform} \
-                                   -o icu:shared={link} > {name}-{version}-{arch}-{build_type}-{link_str}-{compiler_runtime}-{msvc_platform}-{used_compiler}.log'.format(name=name,
-                                                                                                                                                                         version=version,
-                                                                                                                                                                         channel=channel,
-                                                                                                                                                                         arch=arch,
-                                                                                                                                                                         compiler=compiler_version,
-                                                                                                                                                                         compiler_runtime=win_runtime,
-                                                                                                                                                                         used_compiler="vs2017" if compiler_version == "15" else "vs2015",
-                                                                                                                                                                         build_type=build_type,
-                                                                                                                                                                         link=str(link),
-                                                                                                                                                                         link_str='shared' if link else 'static',
-                                                                                                                                                                         msvc_platform=msvc_platform)
-                            print("[{os}] {cmdstr}".format(os=target_os, cmdstr=" ".join(cmd.split())))
-                            os.system( cmd )
-
-                            os.system('conan upload {name}/{version}@{channel} --all -r sigmoidal'.format(name=name, version=version, channel=channel))
-
-                            
+                            config_name = '{name}-{version}-{arch}-{build_type}-{link_str}-{compiler_runtime}-{msvc_platform}-{used_compiler}'.format(name=name,
+                                                                                                                                                     version=version,
+                                                                                                                                                     arch=arch,
+                                                                                                                                                     compiler_runtime=win_runtime,
+                                                                                                                                                     used_compiler="vs2017" if compiler_version == "15" else "vs2015",
+                                                                                                                                                     build_type=build_type,
+                                                                                                                                                     link_str=link_name(link),
+                                                                                                                                                     msvc_platform=msvc_platform)
+                            args = '-s arch={arch} \
+                                    -s build_type={build_type} \
+                                    -s compiler.version={compiler} \
+                                    -s compiler.runtime={compiler_runtime} \
+                                    -o icu:with_unit_tests=True \
+                                    -o icu:msvc_platform={msvc_platform} \
+                                    {link_options}'.format(arch=arch,
+                                                                 compiler=compiler_version,
+                                                                 compiler_runtime=win_runtime,
+                                                                 build_type=build_type,
+                                                                 link_options=link_options(link),
+                                                                 msvc_platform=msvc_platform)
+                            cmd = 'conan create {channel} -ne -k {args}'.format(channel=channel, args=args)
+                            configs.append({'os': target_os, 'name': config_name, 'log': config_name + '.log', 'cmd': cmd, 'args': args,
+                                            'env': {}, 'msvc_platform': msvc_platform})
+
+        configs = plan(configs)
+        for msvc_platform in msvc_platforms:
+            platform_configs = [config for config in configs if config['msvc_platform'] == msvc_platform]
+            if not platform_configs:
+                continue
+
+            source_clear_cmd = "conan remove {name}/{version}@{channel} -s -f".format(name=name, version=version, channel=channel)
+            os.system( source_clear_cmd )
+
+            # the sources are cleared between msvc platforms, so only the configurations of one platform run together
+            results += run_matrix(platform_configs, jobs, parallel, mem_per_build, after_each=after_build)
+
     elif target_os == 'linux':
-    
+
         compiler_versions = [ "5.4", "6.3" ]
-    
+
+        configs = []
         for arch in archs:
             for compiler_version in compiler_versions:
-                                    
+
                 compiler_major_version = compiler_version.split('.')[0]
-            
+
                 cc = "gcc-%s" % compiler_major_version
                 cxx = "g++-%s" % compiler_major_version
-                
+
                 try:
                     output = subprocess.check_output("which %s" % cc, shell=True).decode('utf-8').strip()
                     cc = output
                 except subprocess.CalledProcessError as e:
                     print("ERROR: CC Compiler \"%s\" is not installed!" % cc)
                     continue
-                
+
                 try:
                     output = subprocess.check_output("which %s" % cxx, shell=True).decode('utf-8').strip()
                     cxx = output
                 except subprocess.CalledProcessError as e:
                     print("ERROR: CXX Compiler \"%s\" is not installed!" % cxx)
                     continue
-                            
-                os.environ['CC'] = cc
-                os.environ['CXX'] = cxx
-                        
+
                 for build_type in build_types:
                     for link in shared:
-                        cmd = 'conan create {channel} -k \
-                               --profile {profile} \
-                               -s arch={arch} \
-                               -s build_type={build_type} \
-                               -o icu:shared={link} 2>&1 | tee {name}-{version}-{arch}-{build_type}-{link_str}-{used_compiler}.log'.format(name=name,
-                                                                                                                                           version=version,
-                                                                                                                                           channel=channel, 
-                                                                                                                                           profile='gcc%s' % compiler_major_version,
-                                                                                                                                           arch=arch, 
-                                                                                                                                           used_compiler="gcc" + compiler_version,
-                                                                                                                                           build_type=build_type,
-                                                                                                                                           link=str(link),
-                                                                                                                                           link_str='shared' if link else 'static')
-                        print("[{os}] {cmdstr}".format(os=target_os, cmdstr=" ".join(cmd.split())))
-                        os.system( cmd )
-                            
+                        config_name = '{name}-{version}-{arch}-{build_type}-{link_str}-{used_compiler}'.format(name=name,
+                                                                                                              version=version,
+                                                                                                              arch=arch,
+                                                                                                              used_compiler="gcc" + compiler_version,
+                                                                                                              build_type=build_type,
+                                                                                                              link_str=link_name(link))
+                        args = '--profile {profile} \
+                                -s arch={arch} \
+                                -s build_type={build_type} \
+                                {link_options}'.format(profile='gcc%s' % compiler_major_version,
+                                                             arch=arch,
+                                                             build_type=build_type,
+                                                             link_options=link_options(link))
+                        cmd = 'conan create {channel} -ne -k {args}'.format(channel=channel, args=args)
+                        configs.append({'os': target_os, 'name': config_name, 'log': config_name + '.log', 'cmd': cmd, 'args': args,
+                                        'env': {'CC': cc, 'CXX': cxx}})
+
+        results += run_matrix(plan(configs), jobs, parallel, mem_per_build, after_each=after_build)
+
     elif target_os == 'macosx':
-    
+
         compiler = "apple-clang"
         compiler_versions = [ "9.0" ]
 
+        configs = []
         for arch in archs:
             for compiler_version in compiler_versions:
                 for build_type in build_types:
                     for link in shared:
-                        cmd = 'conan create {channel} -k \
-                               -s arch={arch} \
-                               -s build_type={build_type} \
-                               -s compiler={compiler} \
-                               -s compiler.version={compiler_v} \
-                               -o icu:shared={link} 2>&1 | tee {name}-{version}-{arch}-{build_type}-{link_str}-{used_compiler}.log'.format(name=name,
-                                                                                                                                           version=version,
-                                                                                                                                           channel=channel, 
-                                                                                                                                           arch=arch, 
-                                                                                                                                           compiler=compiler,
-                                                                                                                                           compiler_v=compiler_version,
-                                                                                                                                           used_compiler=compiler + '-' + compiler_version,
-                                                                                                                                           build_type=build_type,
-                                                                                                                                           link=str(link),
-                                                                                                                                           link_str='shared' if link else 'static')
-                        print("[{os}] {cmdstr}".format(os=target_os, cmdstr=" ".join(cmd.split())))
-                        os.system( cmd )
+                        config_name = '{name}-{version}-{arch}-{build_type}-{link_str}-{used_compiler}'.format(name=name,
+                                                                                                              version=version,
+                                                                                                              arch=arch,
+                                                                                                              used_compiler=compiler + '-' + compiler_version,
+                                                                                                              build_type=build_type,
+                                                                                                              link_str=link_name(link))
+                        args = '-s arch={arch} \
+                                -s build_type={build_type} \
+                                -s compiler={compiler} \
+                                -s compiler.version={compiler_v} \
+                                {link_options}'.format(arch=arch,
+                                                             compiler=compiler,
+                                                             compiler_v=compiler_version,
+                                                             build_type=build_type,
+                                                             link_options=link_options(link))
+                        cmd = 'conan create {channel} -ne -k {args}'.format(channel=channel, args=args)
+                        configs.append({'os': target_os, 'name': config_name, 'log': config_name + '.log', 'cmd': cmd, 'args': args,
+                                        'env': {}})
+
+        results += run_matrix(plan(configs), jobs, parallel, mem_per_build, after_each=after_build)
     else:
         usage()
         exit(1)
-        
+
     os.system("conan search {name}/{version}@{channel} --table=file.html".format(name=name, version=version, channel=channel) )
 
+    if uploads:
+        if not uploads.queue.empty():
+            print("Waiting for the queued uploads to {0}".format(upload_remote))
+        uploaded = uploads.close()
+    else:
+        uploaded = []
+
+    build_history.collect_metrics(os.environ['CONAN_ICU_METRICS_DIR'], 'build_metrics.json')
+    build_history.record(os.environ['CONAN_ICU_METRICS_DIR'], since=run_start)
+    print_summary(results)
+    print_uploads(uploaded, upload_remote)
+    return 0 if all(config['retcode'] == 0 for config in results) and all(u['uploaded'] for u in uploaded) else 1
 
-if len(sys.argv) < 2:
-    usage()
-    exit(1)
 
-target_os=sys.argv[1]
+parser = argparse.ArgumentParser(add_help=False)
+parser.add_argument('target_os', nargs='?')
+parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(),
+                    help='total number of make jobs shared by all concurrent builds')
+parser.add_argument('--parallel', type=int, default=0,
+                    help='number of configurations built at the same time (default: jobs / 8)')
+parser.add_argument('--mem-per-build', type=int, default=4096,
+                    help='memory in MB reserved for each concurrent build')
+parser.add_argument('--shared-and-static', action='store_true',
+                    help='build the shared and static libraries of a configuration in a single package')
+parser.add_argument('--remote', default='sigmoidal',
+                    help='remote whose packages are not built again, empty for the local cache only')
+parser.add_argument('--rebuild', action='store_true',
+                    help='build every configuration, even if its package already exists')
+parser.add_argument('--upload', default=None,
+                    help='remote the new packages are uploaded to while the matrix builds (default: sigmoidal for win)')
+parser.add_argument('--upload-retries', type=int, default=3,
+                    help='attempts per upload')
+parser.add_argument('--upload-limit', type=int, default=0,
+                    help='upload bandwidth cap in KB/s, needs trickle (not on Windows)')
+args = parser.parse_args()
 
-if target_os == 'win' or target_os == 'linux' or target_os == 'macosx':
-    main(target_os)
+if args.target_os == 'win' or args.target_os == 'linux' or args.target_os == 'macosx':
+    exit(main(args.target_os, args.jobs, args.parallel, args.mem_per_build, args.shared_and_static, args.remote, args.rebuild,
+              args.upload, args.upload_retries, args.upload_limit))
 else:
     usage()
-    
+    exit(1)
+
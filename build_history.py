@@ -0,0 +1,249 @@
+import os, json, glob, time, argparse
+
+# python build_history.py record [--metrics-dir metrics] [--label NAME] [--since SECONDS]
+# python build_history.py list
+# python build_history.py compare [OLD] [NEW] [--size-threshold 2] [--perf-threshold 5] [--key-settings LIST]
+#
+# Keeps a history of what every package build produced in build_history.jsonl (CONAN_ICU_HISTORY), one
+# JSON line per build: the reference, settings and options, the sizes, section sizes and exported symbol
+# counts of the libraries recorded by the recipe's package() and the results of the test_package
+# benchmarks, if any were run (CONAN_ICU_BENCHMARK, CONAN_ICU_SCALABILITY).
+#
+# 'record' appends the build metrics of CONAN_ICU_METRICS_DIR (./metrics by default) under a label, the
+# time of the recording by default. build_all_local.py records every matrix run this way. --since leaves
+# out the metrics and benchmark results written before that time.
+#
+# 'compare' compares the builds of two labels configuration by configuration, or two single builds given
+# as #<line> of 'list', i.e. the same configuration built with gcc 5.4 and 6.3. Without arguments the last
+# two labels are compared, with one label that one against the last (the last against the one before).
+# The builds of two labels are paired by their options and settings, or by the options and the comma
+# separated --key-settings only. compiler.version is left out when each label was built with a single
+# compiler, so that a compiler upgrade still pairs. Builds that match more than one build of the other
+# side are reported as ambiguous rather than compared. Libraries or sections that grew by more than
+# --size-threshold percent and benchmarks whose throughput dropped by more than --perf-threshold percent
+# are flagged as regressions, and the command exits with 1, as it does when builds are ambiguous or none
+# pair up.
+
+history_file = os.environ.get('CONAN_ICU_HISTORY', 'build_history.jsonl')
+
+# The throughput figure of every benchmark, higher is better, from the results written since that time
+def benchmark_figures(results_dir, since=None):
+    def current(results_file):
+        return os.path.isfile(results_file) and (since is None or os.path.getmtime(results_file) >= since)
+
+    figures = {}
+    throughput_file = os.path.join(results_dir, 'throughput.json')
+    if current(throughput_file):
+        with open(throughput_file, 'r') as f:
+            for benchmark in json.load(f)['benchmarks']:
+                figures['throughput/' + benchmark['name']] = benchmark['mb_per_s']
+    scalability_file = os.path.join(results_dir, 'scalability.json')
+    if current(scalability_file):
+        with open(scalability_file, 'r') as f:
+            for step in json.load(f)['steps']:
+                figures['scalability/{0}/{1}'.format(step['workload'], step['threads'])] = step['ops_per_s']
+    return figures
+
+# Merges the build metrics of every package in metrics_dir into one list in output_file, for build.py
+# and build_all_local.py
+def collect_metrics(metrics_dir, output_file):
+    metrics = []
+    for metrics_file in sorted(glob.glob(os.path.join(metrics_dir, '*.json'))):
+        with open(metrics_file, 'r') as f:
+            metrics.append(json.load(f))
+
+    with open(output_file, 'w') as f:
+        json.dump(metrics, f, indent=2, sort_keys=True)
+    print("Collected the build metrics of {0} packages in {1}".format(len(metrics), output_file))
+
+def load_history(path=history_file):
+    if not os.path.isfile(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def record(metrics_dir, label=None, since=None, path=history_file):
+    label = label or time.strftime('%Y%m%d-%H%M%S')
+    entries = []
+    for metrics_file in sorted(glob.glob(os.path.join(metrics_dir, '*.json'))):
+        # the metrics of configurations that weren't built again are left from earlier runs
+        if since is not None and os.path.getmtime(metrics_file) < since:
+            continue
+        with open(metrics_file, 'r') as f:
+            metrics = json.load(f)
+        if 'binaries' not in metrics:
+            continue
+        entries.append({ 'label': label,
+                         'time': os.path.getmtime(metrics_file),
+                         'reference': metrics.get('reference'),
+                         'key': metrics.get('key'),
+                         'package_id': metrics.get('package_id'),
+                         'settings': metrics.get('settings', {}),
+                         'options': metrics.get('options', {}),
+                         'binaries': metrics['binaries'],
+                         'benchmarks': benchmark_figures(os.path.join(metrics_dir, 'benchmarks',
+                                                                      metrics.get('package_id') or ''), since) })
+
+    with open(path, 'a') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, sort_keys=True) + '\n')
+    print("Recorded {0} builds as '{1}' in {2}".format(len(entries), label, path))
+    return entries
+
+def describe(entry):
+    settings, options = entry['settings'], entry['options']
+    return "{0} {1}-{2} {3} {4}".format(settings.get('arch', ''), settings.get('compiler', ''),
+                                        settings.get('compiler.version', ''), settings.get('build_type', ''),
+                                        'shared' if options.get('shared') == 'True' else 'static')
+
+def list_history(history):
+    for index, entry in enumerate(history):
+        total = sum(binary['bytes'] for binary in entry['binaries'].values())
+        print("#{0:<4} {1:<16} {2:<10} {3:<40} {4:>10.1f} MB  {5} benchmarks".format(
+            index, entry['label'], (entry['key'] or '')[:8], describe(entry), total / 1048576.0, len(entry['benchmarks'])))
+
+# The builds of a label, or the single build of a #<line> of 'list'; raises ValueError for a line that
+# doesn't exist
+def select(history, selector):
+    if selector.startswith('#'):
+        try:
+            index = int(selector[1:])
+        except ValueError:
+            raise ValueError("{0} is not a line of the history, use #<line>".format(selector))
+        if not 0 <= index < len(history):
+            raise ValueError("{0} is not a line of the history, which has {1} builds".format(selector, len(history)))
+        return [history[index]]
+    return [entry for entry in history if entry['label'] == selector]
+
+# What the builds of two labels are paired on: the options and the given settings, or all the settings,
+# without compiler.version when drop_compiler_version is set
+def pair_key(entry, key_settings=None, drop_compiler_version=False):
+    settings = entry['settings']
+    names = key_settings if key_settings else [name for name in settings
+                                               if not (drop_compiler_version and name == 'compiler.version')]
+    return json.dumps([sorted((name, settings.get(name)) for name in names), sorted(entry['options'].items())])
+
+# The builds of one side by pair key, more than one build under a key makes it ambiguous
+def group_by_key(entries, key_settings, drop_compiler_version):
+    groups = {}
+    for entry in entries:
+        groups.setdefault(pair_key(entry, key_settings, drop_compiler_version), []).append(entry)
+    return groups
+
+def change(old, new):
+    return (new - old) * 100.0 / old if old else (0.0 if new == old else float('inf'))
+
+# Returns the lines describing the differences of two builds and whether any of them is a regression
+def compare_entries(old, new, size_threshold, perf_threshold):
+    lines, regressed = [], False
+    for name in sorted(set(old['binaries']) | set(new['binaries'])):
+        if name not in old['binaries'] or name not in new['binaries']:
+            lines.append("  {0:<44} {1}".format(name, 'added' if name in new['binaries'] else 'removed'))
+            continue
+        before, after = old['binaries'][name], new['binaries'][name]
+        pct = change(before['bytes'], after['bytes'])
+        flag = pct > size_threshold
+        regressed = regressed or flag
+        line = "  {0:<44} {1:>12} -> {2:>12} bytes {3:>+7.2f}%".format(name, before['bytes'], after['bytes'], pct)
+        if before.get('exported_symbols') != after.get('exported_symbols'):
+            line += "  exported symbols {0} -> {1}".format(before.get('exported_symbols'), after.get('exported_symbols'))
+        lines.append(line + ("  REGRESSION" if flag else ""))
+        for section in sorted(set(before.get('sections', {})) & set(after.get('sections', {}))):
+            old_size, new_size = before['sections'][section], after['sections'][section]
+            # small sections swing by large percentages without mattering
+            if old_size >= 4096 and change(old_size, new_size) > size_threshold:
+                lines.append("      {0:<40} {1:>12} -> {2:>12} bytes {3:>+7.2f}%  REGRESSION".format(
+                    section, old_size, new_size, change(old_size, new_size)))
+                regressed = True
+
+    for name in sorted(set(old['benchmarks']) & set(new['benchmarks'])):
+        pct = change(old['benchmarks'][name], new['benchmarks'][name])
+        flag = -pct > perf_threshold
+        regressed = regressed or flag
+        lines.append("  {0:<44} {1:>12.1f} -> {2:>12.1f}       {3:>+7.2f}%{4}".format(
+            name, old['benchmarks'][name], new['benchmarks'][name], pct, "  REGRESSION" if flag else ""))
+    return lines, regressed
+
+def compare(history, old_selector, new_selector, size_threshold, perf_threshold, key_settings=None):
+    labels = []
+    for entry in history:
+        if entry['label'] not in labels:
+            labels.append(entry['label'])
+    if old_selector is None or not labels:
+        if len(labels) < 2:
+            print("Nothing to compare, the history holds {0} labels".format(len(labels)))
+            return 0
+        old_selector, new_selector = labels[-2], labels[-1]
+    elif new_selector is None:
+        if old_selector == labels[-1] and len(labels) > 1:
+            old_selector, new_selector = labels[-2], labels[-1]
+        else:
+            new_selector = labels[-1]
+
+    try:
+        old_entries, new_entries = select(history, old_selector), select(history, new_selector)
+    except ValueError as e:
+        print("ERROR: {0}".format(e))
+        return 1
+
+    ambiguous = 0
+    if old_selector.startswith('#') and new_selector.startswith('#'):
+        pairs = [(old_entries[0], new_entries[0])]
+    else:
+        # a compiler upgrade pairs up as long as each side was built with a single compiler
+        compilers = [set((entry['settings'].get('compiler'), entry['settings'].get('compiler.version')) for entry in entries)
+                     for entries in (old_entries, new_entries)]
+        drop_compiler_version = all(len(side) == 1 for side in compilers)
+        old_by_key = group_by_key(old_entries, key_settings, drop_compiler_version)
+        new_by_key = group_by_key(new_entries, key_settings, drop_compiler_version)
+        pairs = []
+        for key in sorted(set(old_by_key) & set(new_by_key)):
+            old, new = old_by_key[key], new_by_key[key]
+            if len(old) > 1 or len(new) > 1:
+                print("AMBIGUOUS: {0} matches {1} builds of {2} and {3} of {4}, narrow it down with --key-settings "
+                      "or #<line>".format(describe(old[0]), len(old), old_selector, len(new), new_selector))
+                ambiguous += 1
+            elif old[0] is not new[0]:
+                pairs.append((old[0], new[0]))
+    if not pairs and not ambiguous:
+        print("WARNING: no builds of {0} and {1} have the same configuration{2}".format(
+            old_selector, new_selector, ", try --key-settings" if not key_settings else ""))
+        return 1
+
+    regressions = 0
+    for old, new in pairs:
+        lines, regressed = compare_entries(old, new, size_threshold, perf_threshold)
+        print("{0}: {1} ({2}) -> {3} ({4})".format('REGRESSED' if regressed else 'ok', describe(old), old['label'],
+                                                  describe(new), new['label']))
+        print("\n".join(lines))
+        regressions += 1 if regressed else 0
+    print("{0} of {1} configurations regressed (size > {2}%, throughput < -{3}%)".format(regressions, len(pairs),
+                                                                                      size_threshold, perf_threshold))
+    if ambiguous:
+        print("{0} configurations were ambiguous and not compared".format(ambiguous))
+    return 1 if regressions or ambiguous else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['record', 'list', 'compare'])
+    parser.add_argument('selectors', nargs='*', help='OLD and NEW label or #line for compare')
+    parser.add_argument('--history', default=history_file, help='history file, CONAN_ICU_HISTORY by default')
+    parser.add_argument('--metrics-dir', default=os.environ.get('CONAN_ICU_METRICS_DIR', 'metrics'))
+    parser.add_argument('--label', help='label of the recorded builds, the current time by default')
+    parser.add_argument('--since', type=float, help='only record metrics written after this unix time')
+    parser.add_argument('--size-threshold', type=float, default=2.0, help='flagged growth of a library or section in percent')
+    parser.add_argument('--perf-threshold', type=float, default=5.0, help='flagged throughput loss in percent')
+    parser.add_argument('--key-settings', help='comma separated settings the builds of two labels are paired on, '
+                                               'all of them by default')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.metrics_dir, args.label, args.since, args.history)
+    elif args.command == 'list':
+        list_history(load_history(args.history))
+    else:
+        selectors = (args.selectors + [None, None])[:2]
+        key_settings = [name.strip() for name in args.key_settings.split(',') if name.strip()] if args.key_settings else None
+        exit(compare(load_history(args.history), selectors[0], selectors[1], args.size_threshold, args.perf_threshold,
+                     key_settings))
@@ -0,0 +1,108 @@
+import subprocess, os, sys, re, json
+from multiprocessing.pool import ThreadPool
+
+# Planning stage of build_all_local.py and build.py.
+#
+# The package id of every configuration is computed up front with 'conan info' on the recipe, so
+# configurations that package_id() collapses onto the same binary (i.e. msvc_platform=msys and cygwin,
+# with_unit_tests, silent) are built once, and those whose binary already exists and is up to date
+# with the recipe in the local cache or on the given remotes are not built at all. The remaining
+# configurations are ordered by their past build durations, longest first, so that a parallel matrix
+# isn't left waiting on a long build started last. The durations are kept by package id in
+# build_durations.json.
+#
+# 'conan search' tells whether a package is outdated against the exported recipe, so the callers export
+# the recipe before planning.
+
+durations_file = 'build_durations.json'
+
+def package_id(recipe_dir, args):
+    cmd = 'conan info "{0}" {1} --only id'.format(recipe_dir, " ".join(args.split()))
+    output = subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT).decode('utf-8')
+    # the recipe's own node is printed as <name>/<version>@PROJECT (conanfile.py (...) by conan 1.x)
+    m = re.search(r'^(?:\S+@PROJECT|conanfile\.py.*)\s*\n\s+ID:\s*(\w+)', output, re.MULTILINE)
+    if not m:
+        raise Exception("No package id in the output of {0}:\n{1}".format(cmd, output))
+    return m.group(1)
+
+# Returns the package ids found for the reference in the local cache (remote=None) or on the remote,
+# mapped to whether they are outdated from the recipe
+def existing_packages(reference, remote=None):
+    cmd = 'conan search {0}{1}'.format(reference, ' -r {0}'.format(remote) if remote else '')
+    try:
+        output = subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT).decode('utf-8')
+    except subprocess.CalledProcessError as e:
+        print("WARNING: '{0}' failed, assuming no packages there:\n{1}".format(cmd, e.output.decode('utf-8', 'replace').strip()))
+        return {}
+
+    packages = {}
+    for block in re.split(r'(?=Package_ID:)', output)[1:]:
+        m = re.match(r'Package_ID:\s*(\w+)', block)
+        packages[m.group(1)] = re.search(r'outdated from recipe:\s*True', block, re.IGNORECASE) is not None
+    return packages
+
+def load_durations(path=durations_file):
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def record_duration(config, path=durations_file):
+    if config.get('retcode') != 0 or not config.get('package_id'):
+        return
+    durations = load_durations(path)
+    durations[config['package_id']] = round(config['duration'], 1)
+    with open(path, 'w') as f:
+        json.dump(durations, f, indent=2, sort_keys=True)
+
+# Splits the configurations, dicts with a 'name' and the conan 'args' (settings, options, profile),
+# into those to build, ordered longest first, and the skipped ones, which get a 'skipped' reason.
+# Every configuration gets its 'package_id' and its 'expected' duration (None when unknown).
+def plan(configs, recipe_dir, reference, remotes=(), durations=None):
+    if not configs:
+        return [], []
+    durations = load_durations() if durations is None else durations
+
+    pool = ThreadPool(min(8, len(configs)))
+    try:
+        ids = pool.map(lambda config: package_id(recipe_dir, config['args']), configs)
+    finally:
+        pool.close()
+        pool.join()
+
+    existing = [('the local cache', existing_packages(reference))]
+    existing += [('remote ' + remote, existing_packages(reference, remote)) for remote in remotes if remote]
+
+    to_build, skipped, seen = [], [], {}
+    for config, id_ in zip(configs, ids):
+        config['package_id'] = id_
+        config['expected'] = durations.get(id_)
+        found = [where for where, packages in existing if packages.get(id_) is False]
+        if id_ in seen:
+            config['skipped'] = 'same package as {0}'.format(seen[id_])
+        elif found:
+            config['skipped'] = 'exists in {0}'.format(found[0])
+        else:
+            seen[id_] = config['name']
+            to_build.append(config)
+            continue
+        seen.setdefault(id_, config['name'])
+        skipped.append(config)
+
+    # unknown durations first, they may well be the longest
+    to_build.sort(key=lambda config: -(config['expected'] if config['expected'] is not None else float('inf')))
+    return to_build, skipped
+
+def print_plan(to_build, skipped):
+    width = max([len(config['name']) for config in to_build + skipped] + [len("configuration")])
+    print("")
+    print("{0:<{width}}  {1:<40}  {2}".format("configuration", "package id", "plan", width=width))
+    print("{0}  {1}  {2}".format("-" * width, "-" * 40, "-" * 30))
+    for config in to_build:
+        expected = "~{0:.0f}s".format(config['expected']) if config['expected'] is not None else "duration unknown"
+        print("{0:<{width}}  {1:<40}  build ({2})".format(config['name'], config['package_id'], expected, width=width))
+    for config in skipped:
+        print("{0:<{width}}  {1:<40}  skip, {2}".format(config['name'], config['package_id'], config['skipped'], width=width))
+    print("{0} to build, {1} skipped".format(len(to_build), len(skipped)))
+    print("")
+    sys.stdout.flush()
@@ -0,0 +1,103 @@
+import subprocess, os, sys, json, argparse, math
+
+# python coldstart_benchmark.py --runs 200 [--shared] [--drop-caches] [-- extra conan arguments]
+#
+# Builds (or reuses) the icu package once per data_packaging mode through 'conan test', which starts
+# test_package/benchmark/coldstart.cpp --runs times as a fresh process with ICU_DATA pointing at the
+# package's share/icu/<version> directory. Reports p50/p99 of the process wall time and of the time to
+# the first ucnv_open/ucol_open, the page faults and the resident memory of every mode, and writes
+# them to coldstart.json.
+#
+# --drop-caches empties the page cache before every run (Linux, needs root), otherwise the data is
+# read from a warm cache and major faults stay close to zero.
+
+data_packagings = [ "shared", "static", "files", "archive" ]
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+sample_keys = ('process_ms', 'ucnv_open_ms', 'ucol_open_ms', 'minor_faults', 'major_faults', 'max_rss_kb')
+status_keys = ('ucnv_status', 'ucol_status')
+
+# A run failed when it exited non-zero, printed no complete sample or an ICU error
+def failed(sample):
+    if sample.get('returncode', 0) != 0 or any(key not in sample for key in sample_keys + status_keys):
+        return True
+    # U_ZERO_ERROR is the success status
+    return any(sample[key].endswith('_ERROR') and sample[key] != 'U_ZERO_ERROR' for key in status_keys)
+
+def summarize(mode, samples):
+    # the percentiles are taken over the successful runs only
+    passed = [sample for sample in samples if not failed(sample)]
+    summary = { 'data_packaging': mode, 'runs': len(samples) }
+    for key in sample_keys:
+        values = [sample[key] for sample in passed]
+        summary[key] = { 'p50': percentile(values, 50), 'p99': percentile(values, 99) }
+    summary['failures'] = len(samples) - len(passed)
+    return summary
+
+def print_table(summaries):
+    columns = [ ('process_ms', 'process ms'), ('ucnv_open_ms', 'ucnv_open ms'), ('ucol_open_ms', 'ucol_open ms'),
+                ('minor_faults', 'minflt'), ('major_faults', 'majflt'), ('max_rss_kb', 'rss kB') ]
+    header = "{0:<10}".format("mode") + "".join("{0:>24}".format(title + " p50/p99") for _, title in columns) + "  failures"
+    print(header)
+    print("-" * len(header))
+    for summary in summaries:
+        line = "{0:<10}".format(summary['data_packaging'])
+        for key, _ in columns:
+            line += "{0:>24}".format("{0:.2f}/{1:.2f}".format(summary[key]['p50'], summary[key]['p99']))
+        print(line + "  {0:>8}".format(summary['failures']))
+
+def main(args, conan_args):
+    reference = "{0}/{1}@{2}".format(args.name, args.version, args.channel)
+    results_dir = os.path.abspath(args.results_dir)
+    if not os.path.isdir(results_dir):
+        os.makedirs(results_dir)
+
+    summaries = []
+    for mode in args.modes.split(','):
+        results_file = os.path.join(results_dir, 'coldstart-{0}.json'.format(mode))
+        env = dict(os.environ)
+        env['CONAN_ICU_COLDSTART'] = str(args.runs)
+        env['CONAN_ICU_COLDSTART_JSON'] = results_file
+        if args.drop_caches:
+            env['CONAN_ICU_COLDSTART_DROP_CACHES'] = '1'
+
+        cmd = [ 'conan', 'test', 'test_package', reference, '--build', 'missing',
+                '-o', 'icu:data_packaging={0}'.format(mode),
+                '-o', 'icu:shared={0}'.format(args.shared) ] + conan_args
+        print("[{0}] {1}".format(mode, " ".join(cmd)))
+        sys.stdout.flush()
+        if subprocess.call(cmd, env=env) != 0 or not os.path.isfile(results_file):
+            print("ERROR: the cold start benchmark failed for data_packaging={0}".format(mode))
+            continue
+
+        with open(results_file, 'r') as f:
+            summaries.append(summarize(mode, json.load(f)['samples']))
+
+    print_table(summaries)
+    with open('coldstart.json', 'w') as f:
+        json.dump(summaries, f, indent=2, sort_keys=True)
+
+    return 0 if len(summaries) == len(args.modes.split(',')) else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=200, help='fresh processes started per data packaging mode')
+    parser.add_argument('--modes', default=",".join(data_packagings), help='comma separated data_packaging modes')
+    parser.add_argument('--shared', action='store_true', help='benchmark the shared ICU libraries')
+    parser.add_argument('--drop-caches', action='store_true', help='drop the page cache before every run (root only)')
+    parser.add_argument('--name', default='icu')
+    parser.add_argument('--version', default='60.1')
+    parser.add_argument('--channel', default='sigmoidal/testing')
+    parser.add_argument('--results-dir', default='coldstart_results')
+    args, conan_args = parser.parse_known_args()
+    if conan_args and conan_args[0] == '--':
+        conan_args = conan_args[1:]
+
+    exit(main(args, conan_args))
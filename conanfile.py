@@ -1,8 +1,27 @@
 from conans import ConanFile, tools, AutoToolsBuildEnvironment
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from xml.etree import ElementTree
 import os
 import glob
 import shutil
+import signal
 import re
+import json
+import time
+import hashlib
+import platform
+import subprocess
+import sys
+import tarfile
+import fnmatch
+import threading
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, only wall times are recorded there
+    resource = None
 
 #
 # Refer to http://userguide.icu-project.org/icudata for the data_packaging option
@@ -32,6 +51,109 @@ import re
 #   
 #    conan create sigmoidal/testing
 #
+# source() fetches its downloads concurrently, verifies them against the checksums pinned in
+# source_downloads and keeps them in a content addressed cache (CONAN_ICU_DOWNLOAD_CACHE,
+# ~/.conan/icu_downloads by default), so that fetching the sources again costs no network I/O. The merged and patched source tree is stored as an uncompressed tar next to them
+# (CONAN_ICU_SOURCE_SNAPSHOT_DIR, <download cache>/prepared by default), keyed by the checksums of the
+# downloads, and is expanded in one step whenever the sources are fetched again. When every download is
+# pinned, the snapshot is found without downloading anything.
+#
+# CONAN_ICU_MIRROR replaces the upstream urls with <mirror>/<file name>, where the mirror is either a
+# base url or a local directory, i.e. for building offline:
+#
+#    CONAN_ICU_MIRROR=/srv/mirrors/icu conan create sigmoidal/testing
+#
+# By default make compiles with one job per cpu (CONAN_CPU_COUNT), the jobs option sets the number of
+# jobs of every make step instead, including the tests and the install. jobs=auto sizes them by the
+# available memory per job (CONAN_ICU_MEM_PER_JOB MB, 512 by default, 1024 for Debug and 2048 for LTO
+# builds, capped by CONAN_ICU_MEM_LIMIT MB) and the load average, and passes -l to make:
+#
+#    conan create sigmoidal/testing -o icu:jobs=auto
+#
+# scratch_dir=ram builds the objects and the data in /dev/shm (scratch_dir=<path> in any other fast
+# directory) instead of the conan cache, only the install tree is written to the build folder. The scratch
+# directory is named after the build folder, so the compiler cache sees the same paths on every rebuild.
+# Builds fall back to the build folder when it has less than CONAN_ICU_SCRATCH_MIN_MB (4096) free.
+#
+# profile_compile=True runs every compiler invocation through profiling/compile_wrapper.py and writes
+# compile_profile.txt to the build folder: the slowest translation units with their peak memory and
+# object size, the compile time by directory and the longest serial chain. The summary is added
+# to build_metrics.json, so build_all_local.py collects it for every compiler of the matrix.
+#
+# unity_build=True compiles common and i18n from generated conan_unity_<n>.cpp files that include up to
+# unity_batch_size (16) of their sources, which cuts the time spent parsing the same headers and lets the
+# compiler inline across the merged sources. Sources whose file local names collide go to different
+# batches, CONAN_ICU_UNITY_EXCLUDE=<file.cpp>,... compiles sources on their own. When a batch doesn't
+# compile the make falls back to the per file build.
+#
+# The with_extras/samples/tests/tools/icuio options leave those parts out of the build (--disable-<part>),
+# the uconfig_no_* options compile the libraries with the matching UCONFIG_NO_* switch of uconfig.h,
+# which package_info() passes on to the consumers, i.e. for a conversion only ICU:
+#
+#    conan create sigmoidal/testing -o icu:with_extras=False -o icu:with_samples=False -o icu:with_tests=False \
+#                                   -o icu:uconfig_no_collation=True -o icu:uconfig_no_formatting=True \
+#                                   -o icu:uconfig_no_transliteration=True -o icu:uconfig_no_break_iteration=True
+#
+# split_debug_info=True strips the packaged shared libraries and programs and keeps their debug info
+# out of the package, in CONAN_ICU_DEBUG_INFO_DIR/<package id> (~/.conan/icu_debug_info/<package id> by
+# default): <file>.debug with a .gnu_debuglink and a .build-id link on Linux, <file>.dSYM on Macos. For
+# gdb use 'set debug-file-directory <debug info dir>/<package id>'. The debug_info recipe packages it as
+# icu_debug_info/60.1, one package per icu package id, to be uploaded next to the icu package (see
+# debug_info/conanfile.py). Static libraries would lose their debug info, so it needs shared=True and
+# shared_and_static=False.
+#
+# runtime_only=True packages the shared libraries and the data only, i.e. for deploying into containers.
+# Without headers the test_package compiles nothing, it only loads the libraries and their data:
+#
+#    conan create sigmoidal/testing -o icu:shared=True -o icu:runtime_only=True -o icu:split_debug_info=True
+#
+# configure_cache=True keeps configure's config.cache outside of the build folder
+# (CONAN_ICU_CONFIGURE_CACHE_DIR, ~/.conan/icu_configure_cache by default), keyed by the settings, the
+# compilers' versions and the compiler flags, so that repeated and matrix builds skip the autoconf probes.
+# A cache configure rejects is discarded and configure is run again from scratch.
+#
+# Every build records the wall time, cpu user/sys time and peak rss of its phases (source, configure, make,
+# check, install, package) in build_metrics.json, which is packaged next to the binaries. The peak rss is
+# the largest total resident memory of the phase's processes, sampled from /proc on Linux only. When
+# CONAN_ICU_METRICS_DIR is set, a copy named after the settings and options hash is also written there
+# for build.py and build_all_local.py to collect across a matrix.
+#
+# Reuse object files across builds and matrix configurations with ccache or sccache (Linux/Macos only).
+# The cache directory defaults to the tool's own, CONAN_ICU_COMPILER_CACHE_DIR overrides it. The hits and
+# misses reported at the end of the build are the build's own with ccache 4 (CCACHE_STATSLOG), with older
+# ccache and sccache they are those of the whole cache, including any concurrent builds sharing it:
+#
+#    CONAN_ICU_COMPILER_CACHE_DIR=/var/cache/icu-ccache conan create sigmoidal/testing -o icu:compiler_cache=ccache
+#
+# Configure and compile the static and the shared libraries in a single pass. The resulting package serves
+# both shared=True and shared=False consumers: package_info() selects the libraries from the shared option.
+# On Linux/Macos the static libraries are packaged in lib/static, on Windows they are the s-prefixed ones.
+# Note that on Windows both flavours are then compiled with the same compiler.runtime.
+#
+#    conan create sigmoidal/testing -o icu:shared_and_static=True
+#
+# Build ICU's data tools (genrb, icupkg, pkgdata, ...) and data natively once and configure every target
+# architecture against them with --with-cross-build (Linux/Macos only). The native build is kept in
+# CONAN_ICU_HOST_TOOLS_DIR (~/.conan/icu_host_tools by default) and reused by the following builds. Targets
+# sharing the host's endianness repackage its data archive instead of regenerating the data. This is also
+# what allows real cross-compiling, i.e. for armv8:
+#
+#    conan create sigmoidal/testing -s arch=armv8 -o icu:cross_build_tools=True
+#
+# The native build ignores the compilers and flags of the profile, which are the target's, and uses the
+# build machine's default compilers, or CC_FOR_BUILD and CXX_FOR_BUILD.
+#
+# Link time and profile guided optimization (Linux/Macos only). With pgo the libraries are first built
+# instrumented, pgo/workload.cpp (conversion, collation, normalization and break iteration) is run
+# against them and ICU is then rebuilt using the recorded profile:
+#
+#    conan create sigmoidal/testing -o icu:optimization=pgo_lto
+#
+# With with_unit_tests=True the test suites (cintltst, iotest and intltest split by its top level test groups)
+# run concurrently, each shard with its own timeout (CONAN_ICU_TEST_TIMEOUT, in seconds). The logs, a JUnit
+# report (junit.xml) and the per-suite durations (durations.json) are written to test_results in the build
+# folder. parallel_unit_tests=False falls back to a serial 'make check'.
+#
 
 class IcuConan(ConanFile):
     name = "icu"
@@ -39,22 +161,141 @@ class IcuConan(ConanFile):
     license="http://www.unicode.org/copyright.html#License"
     description = "ICU is a mature, widely used set of C/C++ and Java libraries providing Unicode and Globalization support for software applications."
     url = "https://github.com/sigmoidal/conan-icu"
+    exports = "pgo/*", "profiling/*"
     settings = "os", "arch", "compiler", "build_type"
     source_url = "http://download.icu-project.org/files/icu4c/{0}/icu4c-{1}-src".format(version,version.replace('.', '_'))
     data_url = "http://download.icu-project.org/files/icu4c/{0}/icu4c-{1}-data".format(version,version.replace('.', '_'))
+    source_file = "icu4c-{0}-src.tgz".format(version.replace('.', '_'))
+    data_file = "icu4c-{0}-data.zip".format(version.replace('.', '_'))
+    patch_file = "icu-60.1-msvc-escapesrc.patch"
+
+    # config.git commit of the config.guess/config.sub replacing ICU's outdated ones (2022-01-09)
+    config_git_commit = "c179db1b6f2ae484bfca1e9f8bae273e3319fa7d"
+    config_git_url = "http://git.savannah.gnu.org/gitweb/?p=config.git;a=blob_plain;f={0};hb={1}"
+
+    # Everything source() downloads, by file name: (url, sha256). Every download is verified against its
+    # pinned checksum, one without a checksum fails unless CONAN_ICU_UNPINNED_SOURCES is set, which only
+    # prints the checksum to pin and keeps the file out of the download cache.
+    source_downloads = { source_file: ("{0}.tgz".format(source_url), None),
+                         data_file: ("{0}.zip".format(data_url), None),
+                         'config.guess': (config_git_url.format('config.guess', config_git_commit),
+                                          'cf610daf8afdedbf2110abd79bdd4121d59080cab5ec46deaf67f97273bb6bda'),
+                         'config.sub': (config_git_url.format('config.sub', config_git_commit),
+                                        'deb02c26f43b2ea64276c9ede77ec0f53d08e6256710f3c0a12275712085c348'),
+                         patch_file: ('http://bugs.icu-project.org/trac/raw-attachment/ticket/13469/{0}'.format(patch_file), None) }
+    # bump whenever prepare_sources() changes, so that stale prepared source snapshots are not reused
+    source_snapshot_revision = 1
 
     options = {"shared": [True, False],
                "msvc_platform": ["msys", "cygwin"],
                "data_packaging": ["shared", "static", "files", "archive"],
+               "data_filter": "ANY",
+               "compiler_cache": ["None", "ccache", "sccache"],
+               "shared_and_static": [True, False],
+               "cross_build_tools": [True, False],
+               "optimization": ["default", "lto", "pgo", "pgo_lto"],
+               "configure_cache": [True, False],
+               "jobs": "ANY",
+               "scratch_dir": "ANY",
+               "profile_compile": [True, False],
+               "unity_build": [True, False],
+               "unity_batch_size": "ANY",
+               "with_extras": [True, False],
+               "with_samples": [True, False],
+               "with_tests": [True, False],
+               "with_tools": [True, False],
+               "with_icuio": [True, False],
+               "components": "ANY",
+               "split_debug_info": [True, False],
+               "runtime_only": [True, False],
+               "uconfig_no_legacy_conversion": [True, False],
+               "uconfig_no_break_iteration": [True, False],
+               "uconfig_no_idna": [True, False],
+               "uconfig_no_collation": [True, False],
+               "uconfig_no_formatting": [True, False],
+               "uconfig_no_transliteration": [True, False],
+               "uconfig_no_regular_expressions": [True, False],
+               "uconfig_no_service": [True, False],
                "with_unit_tests": [True, False],
+               "parallel_unit_tests": [True, False],
                "silent": [True, False]}
 
     default_options = "shared=False", \
                       "msvc_platform=msys", \
                       "data_packaging=archive", \
+                      "data_filter=None", \
+                      "compiler_cache=None", \
+                      "shared_and_static=False", \
+                      "cross_build_tools=False", \
+                      "optimization=default", \
+                      "configure_cache=False", \
+                      "jobs=None", \
+                      "scratch_dir=None", \
+                      "profile_compile=False", \
+                      "unity_build=False", \
+                      "unity_batch_size=16", \
+                      "with_extras=True", \
+                      "with_samples=True", \
+                      "with_tests=True", \
+                      "with_tools=True", \
+                      "with_icuio=True", \
+                      "components=None", \
+                      "split_debug_info=False", \
+                      "runtime_only=False", \
+                      "uconfig_no_legacy_conversion=False", \
+                      "uconfig_no_break_iteration=False", \
+                      "uconfig_no_idna=False", \
+                      "uconfig_no_collation=False", \
+                      "uconfig_no_formatting=False", \
+                      "uconfig_no_transliteration=False", \
+                      "uconfig_no_regular_expressions=False", \
+                      "uconfig_no_service=False", \
                       "with_unit_tests=False", \
+                      "parallel_unit_tests=True", \
                       "silent=True"
-    
+
+    # Data trees of icu/source/data that can be pruned through the data_filter option.
+    # Each entry maps a category name to its directory, the makefiles listing its sources,
+    # the local override makefile picked up by data/Makefile.in and the source list variables.
+    # The 'locales' tree is always built, but reduced to the requested locales.
+    data_trees = { 'locales': ('locales', ['resfiles.mk'], 'reslocal.mk', ['GENRB_SOURCE', 'GENRB_ALIAS_SOURCE']),
+                   'curr': ('curr', ['resfiles.mk'], 'reslocal.mk', ['CURR_SOURCE', 'CURR_ALIAS_SOURCE']),
+                   'lang': ('lang', ['resfiles.mk'], 'reslocal.mk', ['LANG_SOURCE', 'LANG_ALIAS_SOURCE']),
+                   'region': ('region', ['resfiles.mk'], 'reslocal.mk', ['REGION_SOURCE', 'REGION_ALIAS_SOURCE']),
+                   'zone': ('zone', ['resfiles.mk'], 'reslocal.mk', ['ZONE_SOURCE', 'ZONE_ALIAS_SOURCE']),
+                   'unit': ('unit', ['resfiles.mk'], 'reslocal.mk', ['UNIT_SOURCE', 'UNIT_ALIAS_SOURCE']),
+                   'coll': ('coll', ['colfiles.mk'], 'collocal.mk', ['COLLATION_SOURCE', 'COLLATION_ALIAS_SOURCE']),
+                   'brkitr': ('brkitr', ['brkfiles.mk'], 'brklocal.mk', ['BRK_RES_SOURCE', 'BRK_RES_ALIAS_SOURCE']),
+                   'rbnf': ('rbnf', ['rbnffiles.mk'], 'rbnflocal.mk', ['RBNF_SOURCE', 'RBNF_ALIAS_SOURCE']),
+                   'translit': ('translit', ['trnsfiles.mk'], 'trnslocal.mk', ['TRANSLIT_SOURCE']),
+                   'converters': ('mappings', ['ucmcore.mk', 'ucmfiles.mk', 'ucmebcdic.mk'], 'ucmlocal.mk',
+                                  ['UCM_SOURCE_CORE', 'UCM_SOURCE_FILES', 'UCM_SOURCE_EBCDIC', 'UCM_SOURCE_LOCAL']) }
+
+    # Bundles of the locale trees that every locale needs, kept by data_filter whatever the locales
+    shared_bundles = [ 'root', 'pool', 'res_index' ]
+
+    # Parts of the ICU tree that configure can leave out, each one has a with_<part> option
+    optional_parts = [ 'extras', 'samples', 'tests', 'tools', 'icuio' ]
+
+    # The ICU libraries by component: the library's name on Unix and on Windows, and the components
+    # it links against
+    library_components = { 'data': ('icudata', 'icudt', []),
+                           'uc': ('icuuc', 'icuuc', ['data']),
+                           'i18n': ('icui18n', 'icuin', ['uc']),
+                           'io': ('icuio', 'icuio', ['i18n', 'uc']),
+                           'tu': ('icutu', 'icutu', ['i18n', 'uc']),
+                           'test': ('icutest', 'icutest', ['tu', 'i18n', 'uc']) }
+
+    # The libraries the unity_build option compiles from batches of their sources
+    unity_dirs = [ 'common', 'i18n' ]
+
+    # Compile time switches of common/unicode/uconfig.h, each one has a uconfig_no_<switch> option
+    uconfig_switches = [ 'legacy_conversion', 'break_iteration', 'idna', 'collation', 'formatting',
+                         'transliteration', 'regular_expressions', 'service' ]
+
+    # Per-phase timings and resource usage, see timed_phase()
+    metrics_file = 'build_metrics.json'
+
     # Dictionary storing strings useful for setting up the configuration and make command lines
     cfg = { 'enable_debug': '', 
             'platform': '', 
@@ -63,7 +304,61 @@ class IcuConan(ConanFile):
             'output_dir': '', 
             'enable_static': '', 
             'data_packaging': '', 
-            'general_opts': '' }
+            'general_opts': '',
+            'configure_script': '../source/runConfigureICU' }
+
+    def configure(self):
+        if self.settings.os == 'Windows' and self.options.optimization != 'default':
+            raise Exception("optimization={0} is only supported by the Linux and Macos builds".format(self.options.optimization))
+
+        # the test suites need the test framework of tools/ctestfw and iotest needs icuio
+        if self.options.with_unit_tests:
+            for component in ('tests', 'tools', 'icuio'):
+                if not getattr(self.options, 'with_' + component):
+                    raise Exception("with_unit_tests requires with_{0}=True".format(component))
+
+        if self.options.split_debug_info:
+            if self.settings.os == 'Windows':
+                raise Exception("split_debug_info is only supported by the Linux and Macos builds")
+            # the debug info of the archives' objects can't be linked back from outside the package
+            if not self.options.shared or self.options.shared_and_static:
+                raise Exception("split_debug_info requires shared=True and shared_and_static=False")
+
+        if self.settings.os == 'Windows' and self.options.scratch_dir:
+            raise Exception("scratch_dir is only supported by the Linux and Macos builds")
+
+        if self.settings.os == 'Windows' and self.options.profile_compile:
+            raise Exception("profile_compile is only supported by the Linux and Macos builds")
+
+        if self.options.unity_build:
+            if self.settings.os == 'Windows':
+                raise Exception("unity_build is only supported by the Linux and Macos builds")
+            if not str(self.options.unity_batch_size).isdigit() or int(str(self.options.unity_batch_size)) < 2:
+                raise Exception("unity_batch_size must be a number of sources of at least 2")
+        else:
+            self.options.remove("unity_batch_size")
+
+        if self.options.jobs and str(self.options.jobs) != 'auto' and not str(self.options.jobs).isdigit():
+            raise Exception("jobs must be a number of make jobs or 'auto', not '{0}'".format(self.options.jobs))
+
+        # a runtime package holds the shared libraries only
+        if self.options.runtime_only and (not self.options.shared or self.options.shared_and_static):
+            raise Exception("runtime_only requires shared=True and shared_and_static=False")
+
+        components = self.requested_components()
+        unknown = [component for component in components if component not in self.library_components]
+        if unknown:
+            raise Exception("Unknown components: {0}, use {1}".format(",".join(unknown), ",".join(sorted(self.library_components))))
+        if 'io' in components and not self.options.with_icuio:
+            raise Exception("the io component requires with_icuio=True")
+        if ('tu' in components or 'test' in components) and not self.options.with_tools:
+            raise Exception("the tu and test components require with_tools=True")
+
+        # the data is compiled by the tools, unless those of a native build are used
+        if self.settings.os == 'Windows' and not self.options.with_tools:
+            raise Exception("with_tools=False is only supported by the Linux and Macos builds")
+        if not self.options.with_tools and not self.options.cross_build_tools:
+            raise Exception("with_tools=False requires cross_build_tools=True to build the data")
 
     def build_requirements(self):
         if self.settings.os == "Windows":
@@ -75,11 +370,47 @@ class IcuConan(ConanFile):
                 self.build_requires("msys2_installer/latest@bincrafters/testing")
 
     def source(self):
-        self.output.info("Fetching sources: {0}.tgz".format(self.source_url))
-        
-        tools.get("{0}.tgz".format(self.source_url))
-        
-        src_folder = os.getcwd()
+        with self.timed_phase('source'):
+            src_folder = os.getcwd()
+
+            # the merged and patched tree is expanded from a snapshot when one exists for these downloads,
+            # without downloading anything when all of them are pinned
+            snapshot = self.source_snapshot(self.known_source_sums())
+            if snapshot and os.path.isfile(snapshot):
+                self.expand_source_snapshot(snapshot, src_folder)
+                return
+
+            downloads = self.fetch_sources(src_folder)
+            # otherwise the snapshot is keyed by the sums of what was downloaded
+            snapshot = self.source_snapshot(dict((filename, self.sha256sum(path)) for filename, path in downloads.items()))
+            if os.path.isfile(snapshot):
+                self.expand_source_snapshot(snapshot, src_folder)
+            else:
+                self.prepare_sources(src_folder, downloads)
+
+            # the archives would otherwise be copied to every build folder
+            for download in downloads.values():
+                os.remove(download)
+
+            if not os.path.isfile(snapshot):
+                self.output.info("Storing prepared sources: {0}".format(snapshot))
+                if not os.path.isdir(os.path.dirname(snapshot)):
+                    os.makedirs(os.path.dirname(snapshot))
+                tmp_snapshot = '{0}.tmp-{1}'.format(snapshot, os.getpid())
+                with tarfile.open(tmp_snapshot, 'w') as tar:
+                    tar.add(os.path.join(src_folder, self.name), arcname=self.name)
+                shutil.move(tmp_snapshot, snapshot)
+
+    # Extracts a prepared sources snapshot written by source() into src_folder
+    def expand_source_snapshot(self, snapshot, src_folder):
+        self.output.info("Expanding prepared sources: {0}".format(snapshot))
+        with tarfile.open(snapshot, 'r') as tar:
+            tar.extractall(src_folder)
+
+    # Unpacks the sources and merges the updated config scripts, the data and the patch into them
+    def prepare_sources(self, src_folder, downloads):
+        self.output.info("Extracting sources: {0}".format(self.source_file))
+        tools.unzip(downloads[self.source_file])
 
         # update the outdated config.guess and config.sub included in ICU
         # ICU Ticket: http://bugs.icu-project.org/trac/ticket/13470
@@ -89,16 +420,15 @@ class IcuConan(ConanFile):
             if os.path.isfile(dst_config):
                 os.remove(dst_config)
             self.output.info('Updating %s' % dst_config)
-            tools.download('http://git.savannah.gnu.org/gitweb/?p=config.git;a=blob_plain;f={0};hb=HEAD'.format(cfg_update), dst_config)
-        
+            shutil.copy(downloads[cfg_update], dst_config)
+
         #
         # ICU has incomplete data in the tgz file released,
         # need to download and merge them separately.
         # http://bugs.icu-project.org/trac/ticket/13139
         #
-        data_web_file = "{0}.zip".format(self.data_url)
-        self.output.info('Fetching data: %s' % data_web_file)
-        tools.get(data_web_file)
+        self.output.info('Extracting data: %s' % self.data_file)
+        tools.unzip(downloads[self.data_file])
 
         icu_datadir = os.path.join(src_folder, self.name, 'source', 'data')
         downloaded_icu_datadir = os.path.join(src_folder,'data')
@@ -106,10 +436,8 @@ class IcuConan(ConanFile):
         shutil.rmtree(icu_datadir)
         os.rename(downloaded_icu_datadir, icu_datadir)
 
-        # Download and apply patch for ICU Ticket: http://bugs.icu-project.org/trac/ticket/13469
-        patchfile = 'icu-60.1-msvc-escapesrc.patch'
-        tools.download('http://bugs.icu-project.org/trac/raw-attachment/ticket/13469/%s' % patchfile, patchfile)
-        tools.patch(base_path=os.path.join(src_folder, self.name), patch_file=patchfile, strip=1)
+        # Apply patch for ICU Ticket: http://bugs.icu-project.org/trac/ticket/13469
+        tools.patch(base_path=os.path.join(src_folder, self.name), patch_file=downloads[self.patch_file], strip=1)
 
     def build(self):
         root_path = self.conanfile_directory
@@ -131,57 +459,233 @@ class IcuConan(ConanFile):
             tools.replace_in_file(runConfigureICU_file, '        CXX=g++; export CXX\n', '', strict=True)
 
         self.cfg['icu_source_dir'] = os.path.join(root_path, self.name, 'source')
+
+        if self.options.data_filter:
+            self.filter_data()
+
         self.cfg['build_dir'] = os.path.join(root_path, self.name, 'build')
         self.cfg['output_dir'] = os.path.join(root_path, 'output')
 
         self.cfg['silent'] = '--silent' if self.options.silent else 'VERBOSE=1'
+
+        # every make of the build, including those of the tests and of the install, runs under the same budget
+        self.cfg['jobs'], make_flags = self.job_budget()
+        if make_flags:
+            self.output.info("Building with MAKEFLAGS={0}".format(make_flags))
         self.cfg['enable_debug'] = '--enable-debug --disable-release' if self.settings.build_type == 'Debug' else ''
-        self.cfg['arch_bits'] = '64' if self.settings.arch == 'x86_64' else '32'
-        self.cfg['enable_static'] = '--enable-static --disable-shared' if not self.options.shared else '--enable-shared --disable-static'
+        self.cfg['arch_bits'] = '64' if str(self.settings.arch) in ('x86_64', 'armv8', 'ppc64', 'ppc64le', 'sparcv9', 'mips64') else '32'
+        if self.options.shared_and_static:
+            self.cfg['enable_static'] = '--enable-static --enable-shared'
+        else:
+            self.cfg['enable_static'] = '--enable-static --disable-shared' if not self.options.shared else '--enable-shared --disable-static'
         self.cfg['data_packaging'] = '--with-data-packaging={0}'.format(self.options.data_packaging) 
         self.cfg['general_opts'] = '--disable-layout --disable-layoutex'
+        for part in self.optional_parts:
+            if not getattr(self.options, 'with_' + part):
+                self.cfg['general_opts'] += ' --disable-{0}'.format(part)
                 
         if not self.options.shared:
             self.cpp_info.defines.append("U_STATIC_IMPLEMENTATION")
 
-        if self.settings.os == 'Windows':
-            # this overrides pre-configured environments (such as Appveyor's)
-            if "VisualStudioVersion" in os.environ:
-                del os.environ["VisualStudioVersion"]
-            self.cfg['vccmd'] = tools.vcvars_command(self.settings)
+        # only the make phases of this build get the budget, not the test_package build that follows
+        with tools.environment_append({'MAKEFLAGS': make_flags} if make_flags else {}):
+            if self.settings.os == 'Windows':
+                # this overrides pre-configured environments (such as Appveyor's)
+                if "VisualStudioVersion" in os.environ:
+                    del os.environ["VisualStudioVersion"]
+                self.cfg['vccmd'] = tools.vcvars_command(self.settings)
 
-            if self.options.msvc_platform == 'cygwin':
-                self.build_cygwin()
-            elif self.options.msvc_platform == 'msys':
-                self.build_msys()
-        else:
-            self.build_unix()
+                if self.uconfig_defines():
+                    os.environ['CPPFLAGS'] = self.uconfig_cppflags(os.environ.get('CPPFLAGS', ''))
+
+                if self.options.msvc_platform == 'cygwin':
+                    self.build_cygwin()
+                elif self.options.msvc_platform == 'msys':
+                    self.build_msys()
+            else:
+                scratch_dir = self.scratch_build_dir() if self.options.scratch_dir else None
+                if scratch_dir:
+                    # only the install tree (output_dir) is written to the conan cache
+                    self.cfg['build_dir'] = os.path.join(scratch_dir, 'build')
+                    self.cfg['configure_script'] = os.path.join(self.cfg['icu_source_dir'], 'runConfigureICU')
+                try:
+                    self.build_unix()
+                    if self.options.profile_compile:
+                        self.report_compile_profile()
+                finally:
+                    if scratch_dir:
+                        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+        if self.cfg.get('compiler_cache_stats') is not None:
+            self.report_compiler_cache_stats()
 
     def package(self):
-        bin_dir_src, include_dir_src, lib_dir_src, share_dir_src = (os.path.join('output', path) for path in
-                                                                    ('bin', 'include', 'lib', 'share'))
-        if self.settings.os == 'Windows':
-            bin_dir_dst, lib_dir_dst = ('bin64', 'lib64') if self.settings.arch == 'x86_64' else ('bin', 'lib')
+        with self.timed_phase('package'):
+            bin_dir_src, include_dir_src, lib_dir_src, share_dir_src = (os.path.join('output', path) for path in
+                                                                        ('bin', 'include', 'lib', 'share'))
+            if self.settings.os == 'Windows':
+                bin_dir_dst, lib_dir_dst = ('bin64', 'lib64') if self.settings.arch == 'x86_64' else ('bin', 'lib')
 
-            # we copy everything for a full ICU package
-            self.copy("*", dst=bin_dir_dst, src=bin_dir_src, keep_path=True, symlinks=True)
-            self.copy(pattern='*.dll', dst=bin_dir_dst, src=lib_dir_src, keep_path=False)
-            self.copy("*", dst=lib_dir_dst, src=lib_dir_src, keep_path=True, symlinks=True)
+                # we copy everything for a full ICU package
+                self.copy("*", dst=bin_dir_dst, src=bin_dir_src, keep_path=True, symlinks=True)
+                self.copy(pattern='*.dll', dst=bin_dir_dst, src=lib_dir_src, keep_path=False)
+                self.copy("*", dst=lib_dir_dst, src=lib_dir_src, keep_path=True, symlinks=True)
 
-            # lets remove .dlls from the lib dir, they are in bin/ in upstream releases.
-            if os.path.exists(os.path.join(self.package_folder, lib_dir_dst)):
-                for item in os.listdir(os.path.join(self.package_folder, lib_dir_dst)):
-                    if item.endswith(".dll"):
-                        os.remove(os.path.join(self.package_folder, lib_dir_dst, item))
+                # lets remove .dlls from the lib dir, they are in bin/ in upstream releases.
+                if os.path.exists(os.path.join(self.package_folder, lib_dir_dst)):
+                    for item in os.listdir(os.path.join(self.package_folder, lib_dir_dst)):
+                        if item.endswith(".dll"):
+                            os.remove(os.path.join(self.package_folder, lib_dir_dst, item))
 
-            self.copy("*", dst="include", src=include_dir_src, keep_path=True, symlinks=True)
-            self.copy("*", dst="share", src=share_dir_src, keep_path=True, symlinks=True)
-        else:
-            # we copy everything for a full ICU package
-            self.copy("*", dst="bin", src=bin_dir_src, keep_path=True, symlinks=True)
-            self.copy("*", dst="include", src=include_dir_src, keep_path=True, symlinks=True)
-            self.copy("*", dst="lib", src=lib_dir_src, keep_path=True, symlinks=True)
-            self.copy("*", dst="share", src=share_dir_src, keep_path=True, symlinks=True)
+                self.copy("*", dst="include", src=include_dir_src, keep_path=True, symlinks=True)
+                self.copy("*", dst="share", src=share_dir_src, keep_path=True, symlinks=True)
+            else:
+                # we copy everything for a full ICU package
+                self.copy("*", dst="bin", src=bin_dir_src, keep_path=True, symlinks=True)
+                self.copy("*", dst="include", src=include_dir_src, keep_path=True, symlinks=True)
+                self.copy("*", dst="lib", src=lib_dir_src, keep_path=True, symlinks=True)
+                self.copy("*", dst="share", src=share_dir_src, keep_path=True, symlinks=True)
+
+                # static and shared libraries share their names here, keep the archives apart
+                if self.options.shared_and_static:
+                    static_lib_dir = os.path.join(self.package_folder, 'lib', 'static')
+                    os.makedirs(static_lib_dir)
+                    for archive in glob.glob(os.path.join(self.package_folder, 'lib', '*.a')):
+                        shutil.move(archive, static_lib_dir)
+
+            if self.options.runtime_only:
+                self.reduce_to_runtime()
+
+            if self.options.split_debug_info:
+                self.split_debug_info()
+
+            self.record_binary_sizes()
+
+        self.write_metrics()
+
+    # Removes everything but the shared libraries and the data from the package
+    def reduce_to_runtime(self):
+        runtime_libraries = ('*.dll', '*.so', '*.so.*', '*.dylib')
+        for root, dirs, files in os.walk(self.package_folder, topdown=False):
+            relative_root = os.path.relpath(root, self.package_folder)
+            if relative_root == os.path.join('share', self.name) or relative_root.startswith(os.path.join('share', self.name, '')):
+                continue
+            for name in files:
+                if not any(fnmatch.fnmatch(name, pattern) for pattern in runtime_libraries):
+                    os.remove(os.path.join(root, name))
+            if root != self.package_folder and not os.listdir(root):
+                os.rmdir(root)
+
+    # The directory outside the package that split_debug_info() moves the debug info of this package to
+    def debug_info_dir(self):
+        debug_info_root = os.environ.get('CONAN_ICU_DEBUG_INFO_DIR',
+                                         os.path.join(os.path.expanduser('~'), '.conan', 'icu_debug_info'))
+        return os.path.join(debug_info_root, os.path.basename(self.package_folder))
+
+    # Moves the debug info of the shared libraries and programs to <debug info dir>/<path>.debug (<path>.dSYM
+    # on Macos), linked from the stripped binaries through .gnu_debuglink and from .build-id/xx/yyyy.debug
+    def split_debug_info(self):
+        debug_dir = self.debug_info_dir()
+        objcopy = os.environ.get('OBJCOPY', 'objcopy')
+        strip = os.environ.get('STRIP', 'strip')
+
+        # the debug info of an earlier build of the same package id
+        if os.path.isdir(debug_dir):
+            shutil.rmtree(debug_dir)
+        self.output.info("Writing the debug info to {0}, package it for upload with 'conan create <user>/<channel> "
+                         "--cwd debug_info -o icu_debug_info:icu_package_id={1}'".format(debug_dir, os.path.basename(debug_dir)))
+
+        for root, dirs, files in os.walk(self.package_folder):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    continue
+                with open(path, 'rb') as f:
+                    magic = f.read(8)
+
+                macho = magic[:4] in (b'\xfe\xed\xfa\xce', b'\xfe\xed\xfa\xcf', b'\xce\xfa\xed\xfe', b'\xcf\xfa\xed\xfe')
+                if not magic.startswith(b'\x7fELF') and not macho:
+                    continue
+
+                debug_file = os.path.join(debug_dir, os.path.relpath(path, self.package_folder))
+                if not os.path.isdir(os.path.dirname(debug_file)):
+                    os.makedirs(os.path.dirname(debug_file))
+
+                if macho:
+                    self.run('dsymutil "{0}" -o "{1}.dSYM"'.format(path, debug_file))
+                    self.run('{0} -S "{1}"'.format(strip, path))
+                    continue
+
+                self.run('{0} --only-keep-debug "{1}" "{2}.debug"'.format(objcopy, path, debug_file))
+                self.run('{0} --strip-debug --strip-unneeded "{1}"'.format(strip, path))
+                self.run('{0} --add-gnu-debuglink="{1}.debug" "{2}"'.format(objcopy, debug_file, path))
+
+                build_id = self.build_id(path)
+                if build_id:
+                    link = os.path.join(debug_dir, '.build-id', build_id[:2], build_id[2:] + '.debug')
+                    if not os.path.isdir(os.path.dirname(link)):
+                        os.makedirs(os.path.dirname(link))
+                    if not os.path.lexists(link):
+                        os.symlink(os.path.relpath(debug_file + '.debug', os.path.dirname(link)), link)
+
+    # Adds the size, the section sizes and the number of exported symbols of every packaged ICU library
+    # to the build metrics, build_history.py tracks them across builds. Versions are dropped from the
+    # library names (lib/libicuuc.so.60.1 is recorded as lib/libicuuc.so), so that upgrades compare.
+    def record_binary_sizes(self):
+        libraries = ('libicu*.so*', 'libicu*.a', 'libicu*.dylib', 'icu*.dll', 'icu*.lib', 'sicu*.lib')
+        nm = os.environ.get('NM', 'nm')
+        size = os.environ.get('SIZE', 'size')
+
+        binaries = {}
+        for root, dirs, files in os.walk(self.package_folder):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.islink(path) or not any(fnmatch.fnmatch(name, pattern) for pattern in libraries):
+                    continue
+                relative = os.path.relpath(path, self.package_folder).replace(os.sep, '/')
+                relative = re.sub(r'\.so(\.[0-9.]+)$', '.so', relative)
+                relative = re.sub(r'(\.[0-9]+)+\.dylib$', '.dylib', relative)
+                relative = re.sub(r'[0-9]+(d?\.dll)$', r'\1', relative)
+                record = {'bytes': os.path.getsize(path)}
+
+                if self.settings.os != 'Windows':
+                    # the sections summed over the members of archives, 'size -A' is GNU's, Macos has none of it
+                    try:
+                        output = subprocess.check_output([size, '-A', path]).decode('utf-8', 'replace')
+                        sections = {}
+                        for m in re.finditer(r'^(\.\S+)\s+(\d+)\s+\d+\s*$', output, re.MULTILINE):
+                            sections[m.group(1)] = sections.get(m.group(1), 0) + int(m.group(2))
+                        record['sections'] = sections
+                    except (OSError, subprocess.CalledProcessError):
+                        pass
+
+                    if name.endswith('.a'):
+                        nm_args = ['-g', '--defined-only'] if self.settings.os != 'Macos' else ['-gU']
+                    else:
+                        nm_args = ['-D', '--defined-only'] if self.settings.os != 'Macos' else ['-gU']
+                    try:
+                        output = subprocess.check_output([nm] + nm_args + [path]).decode('utf-8', 'replace')
+                        record['exported_symbols'] = len(re.findall(r'^\S*\s+[A-TV-Z]\s+\S+', output, re.MULTILINE))
+                    except (OSError, subprocess.CalledProcessError):
+                        pass
+                binaries[relative] = record
+
+        metrics = {'phases': {}}
+        if os.path.isfile(self.metrics_file):
+            with open(self.metrics_file, 'r') as f:
+                metrics = json.load(f)
+        metrics['binaries'] = binaries
+        with open(self.metrics_file, 'w') as f:
+            json.dump(metrics, f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def build_id(path):
+        try:
+            notes = subprocess.check_output(['readelf', '-n', path]).decode('utf-8', 'replace')
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        m = re.search(r'Build ID:\s*([0-9a-fA-F]+)', notes)
+        return m.group(1).lower() if m else None
 
     def package_id(self):
         # Whether we built with Cygwin or MSYS shouldn't affect the package id
@@ -190,29 +694,52 @@ class IcuConan(ConanFile):
 
         # ICU unit testing shouldn't affect the package's ID
         self.info.options.with_unit_tests = "any"
+        self.info.options.parallel_unit_tests = "any"
 
         # Verbosity doesn't affect package's ID
         self.info.options.silent = "any"
+
+        # A compiler cache produces the same binaries
+        self.info.options.compiler_cache = "any"
+
+        # Every library is packaged, the components only select what consumers link
+        self.info.options.components = "any"
+
+        # Neither does building the data with host tools
+        self.info.options.cross_build_tools = "any"
+
+        # Cached configure results are only reused for the same toolchain
+        self.info.options.configure_cache = "any"
+
+        # Neither does the number of make jobs affect the package's ID
+        self.info.options.jobs = "any"
+
+        # Nor where the intermediate files are built
+        self.info.options.scratch_dir = "any"
+
+        # Profiling the compiler invocations doesn't change what they produce
+        self.info.options.profile_compile = "any"
+
+        # Both flavours are in the package, the consumer picks one in package_info()
+        if self.options.shared_and_static:
+            self.info.options.shared = "any"
+
+        # The order in which locales and categories are given doesn't affect the package's ID
+        if self.options.data_filter:
+            locales, categories, converters = self.parse_data_filter()
+            self.info.options.data_filter = ",".join(sorted(locales) + sorted(categories) + sorted(converters))
             
     def package_info(self):
         bin_dir, lib_dir = ('bin64', 'lib64') if self.settings.arch == 'x86_64' and self.settings.os == 'Windows' else ('bin' , 'lib')
         
+        if self.options.shared_and_static and not self.options.shared and self.settings.os != 'Windows':
+            lib_dir = os.path.join(lib_dir, 'static')
+
         self.cpp_info.libdirs = [ lib_dir ]
         
-        self.cpp_info.libs = []
-        vtag = self.version.split('.')[0]
-        keep = False
-        for lib in tools.collect_libs(self, lib_dir):
-            if not vtag in lib:
-                if lib != 'icudata':
-                    self.cpp_info.libs.append(lib)
-                else:
-                    keep = True
-
-        # if icudata is not last, it fails to build on some platforms (Windows)
-        # (have to double-check this)
-        if keep:
-            self.cpp_info.libs.append('icudata')
+        # the requested components and everything they depend on, dependents first and icudata last
+        # (if icudata is not last, it fails to build on some platforms, i.e. Windows)
+        self.cpp_info.libs = [self.library_name(component) for component in self.linked_components()]
 
         self.env_info.PATH.append(os.path.join(self.package_folder, bin_dir))
 
@@ -224,11 +751,833 @@ class IcuConan(ConanFile):
             if self.settings.os == 'Windows':
                 self.cpp_info.libs.append('advapi32')
                 
+        # consumers must see the same uconfig.h switches as the libraries
+        self.cpp_info.defines.extend(self.uconfig_defines())
+
         if self.settings.compiler == "gcc":
             self.cpp_info.cppflags = ["-std=c++11"]
 
 
-            
+
+    # The components given in the components option, or all that were built
+    def requested_components(self):
+        if self.options.components:
+            return [component.strip() for component in str(self.options.components).split(',') if component.strip()]
+        components = ['data', 'uc', 'i18n']
+        if self.options.with_icuio:
+            components.append('io')
+        if self.options.with_tools:
+            components.extend(['tu', 'test'])
+        return components
+
+    # The requested components and their dependencies in link order
+    def linked_components(self):
+        ordered = []
+
+        def visit(component):
+            if component not in ordered:
+                for dependency in self.library_components[component][2]:
+                    visit(dependency)
+                ordered.append(component)
+
+        for component in sorted(self.requested_components()):
+            visit(component)
+        return list(reversed(ordered))
+
+    # The static libraries of Windows builds are prefixed with 's' and the debug ones suffixed with 'd'
+    def library_name(self, component):
+        unix_name, windows_name, _ = self.library_components[component]
+        if self.settings.os != 'Windows':
+            return unix_name
+        return '{0}{1}{2}'.format('s' if not self.options.shared else '',
+                                  windows_name,
+                                  'd' if self.settings.build_type == 'Debug' else '')
+
+    def uconfig_defines(self):
+        return ['UCONFIG_NO_{0}=1'.format(switch.upper()) for switch in self.uconfig_switches
+                if getattr(self.options, 'uconfig_no_' + switch)]
+
+    def uconfig_cppflags(self, cppflags):
+        return " ".join([cppflags] + ['-D{0}'.format(define) for define in self.uconfig_defines()]).strip()
+
+    # Splits the data_filter option, i.e. 'en,de_DE,ja,coll,brkitr,ibm-943_P15A-2003.ucm',
+    # into the requested locales, data categories and conversion tables
+    def parse_data_filter(self):
+        locales, categories, converters = [], [], []
+        for item in str(self.options.data_filter).replace(';', ',').split(','):
+            item = item.strip()
+            if not item:
+                continue
+            if item in self.data_trees and item != 'locales':
+                categories.append(item)
+            elif item.endswith('.ucm'):
+                converters.append(item)
+            else:
+                locales.append(item)
+        return locales, categories, converters
+
+    # Returns the variables assigned in ICU's data makefiles as lists of file names
+    @staticmethod
+    def parse_data_makefiles(mk_files):
+        variables = {}
+        for mk_file in mk_files:
+            if not os.path.isfile(mk_file):
+                continue
+            with open(mk_file, 'r') as f:
+                contents = f.read().replace('\\\n', ' ')
+            for line in contents.splitlines():
+                m = re.match(r'^\s*([A-Z_]+)\s*=(.*)$', line)
+                if m:
+                    variables[m.group(1)] = m.group(2).split()
+        return variables
+
+    # Writes the *local.mk overrides read by icu/source/data/Makefile.in after the stock
+    # *files.mk, so that only the requested locales, categories and conversion tables are built
+    def filter_data(self):
+        locales, categories, converters = self.parse_data_filter()
+        self.output.info("Filtering ICU data: locales={0} categories={1} converters={2}".format(
+            ",".join(locales), ",".join(categories), ",".join(converters)))
+
+        def keep_locale(res_file):
+            loc = os.path.splitext(res_file)[0]
+            # every locale falls back to root, which also holds the collation root, and shares the pool
+            if loc in self.shared_bundles:
+                return True
+            for wanted in locales:
+                # keep the requested locale, its sub-locales and its parents (i.e. de for de_DE)
+                if loc == wanted or loc.startswith(wanted + '_') or wanted.startswith(loc + '_'):
+                    return True
+            return False
+
+        data_dir = os.path.join(self.cfg['icu_source_dir'], 'data')
+        for category, (subdir, files_mks, local_mk, variables) in self.data_trees.items():
+            local_mk_path = os.path.join(data_dir, subdir, local_mk)
+            if os.path.isfile(local_mk_path):
+                os.remove(local_mk_path)
+
+            # trees without per-locale sources are either kept whole or dropped
+            if category in categories and category in ('converters', 'translit'):
+                continue
+
+            sources = self.parse_data_makefiles([os.path.join(data_dir, subdir, mk) for mk in files_mks])
+            if not sources:
+                continue
+
+            with open(local_mk_path, 'w') as f:
+                f.write("# Generated by the conan recipe for data_filter={0}\n".format(self.options.data_filter))
+                for var in variables:
+                    if category == 'converters':
+                        kept = [ucm for ucm in sources.get(var, []) if ucm in converters]
+                    elif category == 'locales' or category in categories:
+                        kept = [res for res in sources.get(var, []) if keep_locale(res)]
+                    elif category != 'translit':
+                        # the services of the trees left out still open, with the root data
+                        kept = [res for res in sources.get(var, []) if os.path.splitext(res)[0] in self.shared_bundles]
+                    else:
+                        kept = []
+                    f.write("{0} = {1}\n".format(var, " ".join(kept)))
+
+    # Records the wall time, cpu user/sys time and peak rss of the child processes run during a phase
+    @contextmanager
+    def timed_phase(self, phase):
+        usage_before = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+        # ru_maxrss of the children is the high-water mark of the whole build so far, not of the phase,
+        # so the phase's processes are sampled instead (Linux only)
+        rss = {'peak_kb': 0}
+        stop_sampling = threading.Event()
+        sampler = None
+        if os.path.isdir('/proc/self/task'):
+            sampler = threading.Thread(target=self.sample_children_rss, args=(stop_sampling, rss))
+            sampler.daemon = True
+            sampler.start()
+        start = time.time()
+        succeeded = False
+        try:
+            yield
+            succeeded = True
+        finally:
+            record = {'wall_s': round(time.time() - start, 3), 'succeeded': succeeded}
+            if resource:
+                usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+                record['user_s'] = round(usage.ru_utime - usage_before.ru_utime, 3)
+                record['sys_s'] = round(usage.ru_stime - usage_before.ru_stime, 3)
+            if sampler:
+                stop_sampling.set()
+                sampler.join()
+                record['peak_rss_kb'] = rss['peak_kb']
+            self.record_metrics(phase, record)
+
+    # Samples the summed resident memory of all descendant processes until stop is set, keeping the
+    # largest sum in rss['peak_kb']. Processes living shorter than the interval may be missed.
+    @staticmethod
+    def sample_children_rss(stop, rss, interval=0.25):
+        page_kb = os.sysconf('SC_PAGE_SIZE') // 1024
+        while True:
+            children = {}
+            for pid in os.listdir('/proc'):
+                if not pid.isdigit():
+                    continue
+                try:
+                    with open('/proc/{0}/stat'.format(pid), 'r') as f:
+                        # the command name in parentheses may contain spaces
+                        ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+                except (IOError, OSError, IndexError, ValueError):
+                    continue
+                children.setdefault(ppid, []).append(int(pid))
+
+            total_kb = 0
+            pending = list(children.get(os.getpid(), []))
+            while pending:
+                pid = pending.pop()
+                pending.extend(children.get(pid, []))
+                try:
+                    with open('/proc/{0}/statm'.format(pid), 'r') as f:
+                        total_kb += int(f.read().split()[1]) * page_kb
+                except (IOError, OSError, IndexError, ValueError):
+                    pass
+            rss['peak_kb'] = max(rss['peak_kb'], total_kb)
+
+            if stop.wait(interval):
+                return
+
+    def run_phase(self, phase, command):
+        with self.timed_phase(phase):
+            self.run(command)
+
+    # The metrics file lives in the current source/build folder, so that the source phase recorded
+    # in the source folder is carried over to the build folder together with the sources
+    def record_metrics(self, phase, record):
+        metrics = {'phases': {}}
+        if os.path.isfile(self.metrics_file):
+            with open(self.metrics_file, 'r') as f:
+                metrics = json.load(f)
+        metrics['phases'][phase] = record
+        with open(self.metrics_file, 'w') as f:
+            json.dump(metrics, f, indent=2, sort_keys=True)
+
+    def write_metrics(self):
+        if not os.path.isfile(self.metrics_file):
+            return
+
+        with open(self.metrics_file, 'r') as f:
+            metrics = json.load(f)
+
+        metrics['reference'] = "{0}/{1}".format(self.name, self.version)
+        metrics['package_id'] = os.path.basename(self.package_folder)
+        metrics['settings'] = dict((k, str(v)) for k, v in self.settings.values.as_list())
+        metrics['options'] = dict((k, str(v)) for k, v in self.options.values.as_list())
+        metrics['key'] = hashlib.sha1(json.dumps([metrics['settings'], metrics['options']],
+                                                 sort_keys=True).encode('utf-8')).hexdigest()
+
+        destinations = [os.path.join(self.package_folder, self.metrics_file)]
+        if os.environ.get('CONAN_ICU_METRICS_DIR'):
+            metrics_dir = os.environ['CONAN_ICU_METRICS_DIR']
+            if not os.path.isdir(metrics_dir):
+                os.makedirs(metrics_dir)
+            destinations.append(os.path.join(metrics_dir, '{0}-{1}-{2}.json'.format(self.name, self.version, metrics['key'])))
+
+        for destination in destinations:
+            with open(destination, 'w') as f:
+                json.dump(metrics, f, indent=2, sort_keys=True)
+
+    # The C and C++ compilers of the profile or the environment, or the compiler's default names
+    def compilers(self):
+        if str(self.settings.compiler) == 'gcc':
+            default_cc, default_cxx = 'gcc', 'g++'
+        elif 'clang' in str(self.settings.compiler):
+            default_cc, default_cxx = 'clang', 'clang++'
+        else:
+            default_cc, default_cxx = 'cc', 'c++'
+        return os.environ.get('CC', default_cc), os.environ.get('CXX', default_cxx)
+
+    # Adds the LTO/PGO flags to the autotools environment. pgo_stage is 'generate' for the
+    # instrumented build and 'use' for the final one.
+    def optimization_vars(self, env_vars, pgo_stage):
+        optimization = str(self.options.optimization)
+        env_vars = dict(env_vars)
+        flags = []
+        gcc = str(self.settings.compiler) == 'gcc'
+        profile_dir = os.path.join(self.conanfile_directory, 'pgo_profile')
+
+        if optimization in ('pgo', 'pgo_lto'):
+            if pgo_stage == 'generate':
+                flags += ['-fprofile-generate={0}'.format(profile_dir)] if gcc else \
+                         ['-fprofile-instr-generate={0}'.format(os.path.join(profile_dir, 'icu-%p.profraw'))]
+            else:
+                flags += ['-fprofile-use={0}'.format(profile_dir), '-fprofile-correction', '-Wno-coverage-mismatch'] if gcc else \
+                         ['-fprofile-instr-use={0}'.format(os.path.join(profile_dir, 'icu.profdata'))]
+
+        # LTO only matters for the final libraries
+        if optimization in ('lto', 'pgo_lto') and pgo_stage == 'use':
+            flags.append('-flto')
+            # static libraries of LTO objects need the archiver's linker plugin, Apple's ar has it built in
+            if gcc or self.settings.os == 'Linux':
+                archivers = self.lto_archivers()
+                if archivers:
+                    env_vars['AR'], env_vars['RANLIB'] = archivers
+                else:
+                    self.output.warn("No {0} found, the static LTO libraries may not link".format(
+                        'gcc-ar' if gcc else 'llvm-ar'))
+
+        for var in ('CFLAGS', 'CXXFLAGS', 'LDFLAGS'):
+            env_vars[var] = " ".join([env_vars.get(var, '')] + flags).strip()
+        return env_vars
+
+    # The archiver and ranlib reading LTO objects: gcc-ar/gcc-ranlib named after gcc (gcc-ar-7 for gcc-7,
+    # x86_64-linux-gnu-gcc-ar for x86_64-linux-gnu-gcc) or the plain ones on the PATH, llvm-ar/llvm-ranlib
+    # for clang (llvm-ar-6.0 for clang-6.0). None when neither is found.
+    def lto_archivers(self):
+        cc_dir, cc_name = os.path.split(self.compilers()[0].split()[-1])
+        candidates = []
+        if str(self.settings.compiler) == 'gcc':
+            if 'gcc' in cc_name:
+                candidates.append((os.path.join(cc_dir, cc_name.replace('gcc', 'gcc-ar', 1)),
+                                   os.path.join(cc_dir, cc_name.replace('gcc', 'gcc-ranlib', 1))))
+            candidates.append(('gcc-ar', 'gcc-ranlib'))
+        else:
+            m = re.search(r'clang(?:\+\+)?(-[0-9.]+)$', cc_name)
+            if m:
+                candidates.append(('llvm-ar' + m.group(1), 'llvm-ranlib' + m.group(1)))
+            candidates.append(('llvm-ar', 'llvm-ranlib'))
+
+        for ar, ranlib in candidates:
+            found = [os.path.isfile(tool) if os.path.dirname(tool) else tools.which(tool) for tool in (ar, ranlib)]
+            if all(found):
+                return ar, ranlib
+        return None
+
+    # Runs pgo/workload.cpp against the instrumented libraries installed in the output dir
+    def pgo_train(self):
+        output_dir = self.cfg['output_dir']
+        workload = os.path.join(self.cfg['build_dir'], 'pgo_workload')
+        libs = '-licui18n -licuuc -licudata' + (' -lpthread -ldl' if self.settings.os == 'Linux' else '')
+
+        with self.timed_phase('pgo_train'):
+            self.run('{cxx} $CPPFLAGS $CXXFLAGS -std=c++11 {source} -I{include} -L{lib} {libs} $LDFLAGS -o {workload}'.format(
+                cxx=self.compilers()[1],
+                source=os.path.join(self.conanfile_directory, 'pgo', 'workload.cpp'),
+                include=os.path.join(output_dir, 'include'),
+                lib=os.path.join(output_dir, 'lib'),
+                libs=libs,
+                workload=workload))
+
+            lib_dir = os.path.join(output_dir, 'lib')
+            with tools.environment_append({'LD_LIBRARY_PATH': lib_dir, 'DYLD_LIBRARY_PATH': lib_dir,
+                                           'ICU_DATA': os.path.join(output_dir, 'share', self.name, self.version)}):
+                self.run(workload)
+
+            if str(self.settings.compiler) != 'gcc':
+                profile_dir = os.path.join(self.conanfile_directory, 'pgo_profile')
+                profdata = 'xcrun llvm-profdata' if self.settings.os == 'Macos' else 'llvm-profdata'
+                self.run('{profdata} merge -output={output} {profraws}'.format(profdata=profdata,
+                                                                              output=os.path.join(profile_dir, 'icu.profdata'),
+                                                                              profraws=" ".join(glob.glob(os.path.join(profile_dir, '*.profraw')))))
+
+    # Puts ccache/sccache in front of CC/CXX. runConfigureICU no longer forces gcc/g++ (see build()),
+    # so the compilers picked by the profile or the environment are the ones being wrapped.
+    def compiler_cache_vars(self):
+        launcher = str(self.options.compiler_cache)
+        if not self.options.compiler_cache:
+            return {}
+
+        if not tools.which(launcher):
+            self.output.warn("compiler_cache={0} requested, but {0} was not found in PATH. Building without it.".format(launcher))
+            return {}
+
+        cc, cxx = self.compilers()
+        env_vars = { 'CC': '{0} {1}'.format(launcher, cc),
+                     'CXX': '{0} {1}'.format(launcher, cxx) }
+
+        cache_dir = os.environ.get('CONAN_ICU_COMPILER_CACHE_DIR')
+        if launcher == 'ccache':
+            # every configuration builds in its own folder, hash paths relative to it to share the cache
+            env_vars['CCACHE_BASEDIR'] = self.conanfile_directory
+            if cache_dir:
+                env_vars['CCACHE_DIR'] = cache_dir
+            # ccache 4 logs the result of every compilation of this build there, apart from concurrent builds
+            env_vars['CCACHE_STATSLOG'] = os.path.join(self.conanfile_directory, 'ccache_stats.log')
+            if os.path.isfile(env_vars['CCACHE_STATSLOG']):
+                os.remove(env_vars['CCACHE_STATSLOG'])
+        elif cache_dir:
+            env_vars['SCCACHE_DIR'] = cache_dir
+
+        with tools.environment_append(env_vars):
+            self.cfg['compiler_cache_stats'] = self.compiler_cache_stats()
+        self.cfg['compiler_cache_env'] = env_vars
+
+        self.output.info("Using {0}: CC={1} CXX={2}".format(launcher, env_vars['CC'], env_vars['CXX']))
+        return env_vars
+
+    # Puts profiling/compile_wrapper.py in front of CC/CXX (and of the compiler cache) for profile_compile,
+    # with CONAN_ICU_TIME_TRACE clang also writes a -ftime-trace .json next to every object
+    def compile_profile_vars(self, env_vars):
+        if not self.options.profile_compile:
+            return {}
+
+        self.cfg['compile_profile_log'] = os.path.join(self.conanfile_directory, 'compile_profile.log')
+        if os.path.isfile(self.cfg['compile_profile_log']):
+            os.remove(self.cfg['compile_profile_log'])
+
+        cc, cxx = self.compilers()
+        wrapper = '{0} {1} {2}'.format(sys.executable,
+                                       os.path.join(self.conanfile_directory, 'profiling', 'compile_wrapper.py'),
+                                       self.cfg['compile_profile_log'])
+        profile_vars = { 'CC': '{0} {1}'.format(wrapper, env_vars.get('CC', cc)),
+                         'CXX': '{0} {1}'.format(wrapper, env_vars.get('CXX', cxx)) }
+
+        if os.environ.get('CONAN_ICU_TIME_TRACE') and 'clang' in str(self.settings.compiler):
+            for var in ('CFLAGS', 'CXXFLAGS'):
+                profile_vars[var] = " ".join([env_vars.get(var, ''), '-ftime-trace']).strip()
+
+        self.output.info("Profiling the compiler invocations into {0}".format(self.cfg['compile_profile_log']))
+        return profile_vars
+
+    # Writes compile_profile.txt from the wrapper's log: the slowest translation units, the compile time by
+    # directory and the longest serial chain: going back from the last invocation to finish, the one that
+    # finished last before each started. The chain is picked greedily from the timings, make's dependencies
+    # aren't known, so it is an estimate of the critical path rather than the path itself. The summary is
+    # also added to the build metrics.
+    def report_compile_profile(self):
+        records = []
+        with open(self.cfg['compile_profile_log'], 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                # leaves out the configure probes and the pgo training build
+                if record['output'] and 'conftest' not in record['output'] and record['retcode'] == 0 and \
+                   record['start'] >= self.cfg.get('compile_profile_since', 0):
+                    records.append(record)
+        if not records:
+            return
+
+        source_dir = self.cfg['icu_source_dir']
+
+        def name(record):
+            target = record['sources'][0] if record['sources'] else record['output']
+            target = os.path.normpath(os.path.join(record['cwd'], target))
+            return os.path.relpath(target, source_dir) if target.startswith(source_dir) else target
+
+        compiles = sorted([r for r in records if r['kind'] == 'compile' and r['sources']], key=lambda r: -r['wall_s'])
+        top = int(os.environ.get('CONAN_ICU_PROFILE_TOP', '25'))
+
+        by_dir = {}
+        for record in compiles:
+            directory = os.path.dirname(name(record)) or '.'
+            by_dir[directory] = by_dir.get(directory, 0) + record['wall_s']
+
+        serial_chain = [max(records, key=lambda r: r['end'])]
+        while True:
+            before = [r for r in records if r['end'] <= serial_chain[-1]['start']]
+            if not before:
+                break
+            serial_chain.append(max(before, key=lambda r: r['end']))
+        serial_chain.reverse()
+
+        start = min(r['start'] for r in records)
+        end = max(r['end'] for r in records)
+        lines = ["{0} compiles, {1} links, {2:.1f} s of compiler time in {3:.1f} s".format(
+                     len(compiles), len([r for r in records if r['kind'] == 'link']), sum(r['wall_s'] for r in records), end - start),
+                 "",
+                 "Slowest translation units:",
+                 "{0:>9} {1:>9} {2:>10}  {3}".format('wall s', 'rss MB', 'object kB', 'source')]
+        for record in compiles[:top]:
+            lines.append("{0:>9.2f} {1:>9} {2:>10}  {3}".format(record['wall_s'], record.get('peak_rss_kb', 0) // 1024,
+                                                               record.get('output_bytes', 0) // 1024, name(record)))
+        lines += ["", "Compile time by directory:"]
+        for directory in sorted(by_dir, key=lambda d: -by_dir[d]):
+            lines.append("{0:>9.1f}  {1}".format(by_dir[directory], directory))
+        lines += ["", "Longest serial chain ({0:.1f} s of {1:.1f} s):".format(sum(r['wall_s'] for r in serial_chain), end - start)]
+        for record in serial_chain:
+            lines.append("{0:>9.2f} {1:>9.2f}  {2} {3}".format(record['start'] - start, record['wall_s'], record['kind'], name(record)))
+
+        report_file = os.path.join(self.conanfile_directory, 'compile_profile.txt')
+        with open(report_file, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        for line in lines[:top + 4]:
+            self.output.info(line)
+        self.output.info("Compile profile written to {0}".format(report_file))
+
+        metrics = {'phases': {}}
+        if os.path.isfile(self.metrics_file):
+            with open(self.metrics_file, 'r') as f:
+                metrics = json.load(f)
+        metrics['compile_profile'] = { 'compiler_s': round(sum(r['wall_s'] for r in records), 3),
+                                       'longest_serial_chain_s': round(sum(r['wall_s'] for r in serial_chain), 3),
+                                       'slowest': [{'source': name(r), 'wall_s': r['wall_s'],
+                                                    'peak_rss_kb': r.get('peak_rss_kb'), 'output_bytes': r.get('output_bytes')}
+                                                   for r in compiles[:top]] }
+        with open(self.metrics_file, 'w') as f:
+            json.dump(metrics, f, indent=2, sort_keys=True)
+
+    # Returns the counters of the compiler cache. ccache 3.7 and later print them as '<counter>\t<value>'
+    # with --print-stats (i.e. 'direct_cache_hit\t42'), older ccache and sccache only as a table.
+    def compiler_cache_stats(self):
+        launcher = str(self.options.compiler_cache)
+        if launcher == 'ccache':
+            try:
+                output = subprocess.check_output([launcher, '--print-stats'], stderr=subprocess.STDOUT).decode('utf-8', 'replace')
+                stats = dict((m.group(1), int(m.group(2))) for m in re.finditer(r'^(\w+)\t(\d+)\s*$', output, re.MULTILINE))
+                if stats:
+                    return stats
+            except (OSError, subprocess.CalledProcessError):
+                pass
+
+        stats_cmd = [launcher, '-s'] if launcher == 'ccache' else [launcher, '--show-stats']
+        try:
+            output = subprocess.check_output(stats_cmd).decode('utf-8', 'replace')
+        except (OSError, subprocess.CalledProcessError):
+            return {}
+        return self.parse_compiler_cache_table(output)
+
+    # Parses the tables of 'ccache -s' and 'sccache --show-stats': ccache 3 prints 'cache hit (direct)   42',
+    # sccache 'Cache hits   42' and ccache 4 'Hits:   42 / 50 (84.00%)', with the counters nested by indentation
+    # under their groups, i.e. 'Cacheable calls Hits Direct'.
+    @staticmethod
+    def parse_compiler_cache_table(output):
+        stats = {}
+        groups = []
+        for line in output.splitlines():
+            m = re.match(r'^(\s*)([A-Za-z][A-Za-z ()/-]*?)(?::\s*|\s{2,})(\d+)?(?:\s*/\s*\d+.*)?\s*$', line)
+            if not m:
+                continue
+            indent, name = len(m.group(1)), m.group(2).strip()
+            while groups and groups[-1][0] >= indent:
+                groups.pop()
+            if m.group(3) is not None:
+                stats[" ".join([group for _, group in groups] + [name])] = int(m.group(3))
+            groups.append((indent, name))
+        return stats
+
+    # Reports the hits and misses of this build from the ccache stats log, one counter name per compilation
+    # between '#' comment lines. Without one (ccache before 4.0, sccache) they are the differences of the
+    # cache's own counters, which also count the builds running concurrently against the same cache.
+    def report_compiler_cache_stats(self):
+        stats_log = self.cfg['compiler_cache_env'].get('CCACHE_STATSLOG')
+        if stats_log and os.path.isfile(stats_log):
+            counts = {}
+            with open(stats_log, 'r') as f:
+                for line in f:
+                    counter = line.strip()
+                    if counter and not counter.startswith('#'):
+                        counts[counter] = counts.get(counter, 0) + 1
+            self.output.info("{0} results of this build, from {1}:".format(self.options.compiler_cache, stats_log))
+        else:
+            with tools.environment_append(self.cfg['compiler_cache_env']):
+                stats = self.compiler_cache_stats()
+            before = self.cfg['compiler_cache_stats']
+            counts = dict((counter, stats[counter] - before.get(counter, 0)) for counter in stats)
+            self.output.info("{0} counters of the whole cache during this build, they include the builds sharing "
+                             "the cache concurrently:".format(self.options.compiler_cache))
+
+        for counter in sorted(counts):
+            if 'hit' in counter.lower() or 'miss' in counter.lower():
+                self.output.info("{0} {1}: {2}".format(self.options.compiler_cache, counter, counts[counter]))
+
+    def gnu_triplet(self):
+        arch = str(self.settings.arch)
+        cpu = { 'x86': 'i686', 'armv8': 'aarch64', 'armv7': 'arm', 'armv7hf': 'arm' }.get(arch, arch)
+        if self.settings.os == 'Macos':
+            return '{0}-apple-darwin'.format(cpu if arch != 'x86' else 'i386')
+        if arch == 'armv7hf':
+            return 'arm-linux-gnueabihf'
+        if arch == 'armv7':
+            return 'arm-linux-gnueabi'
+        return '{0}-linux-gnu'.format(cpu)
+
+    # Returns the directory of a native ICU build to be used with --with-cross-build. It only depends
+    # on the build machine, its compilers and the data filter, so it is shared by every configuration.
+    # The compilers and flags of the profile are the target's, the native build uses the build machine's
+    # default compilers or CC_FOR_BUILD/CXX_FOR_BUILD.
+    def host_tools_build(self):
+        build_compilers = [(var, os.environ[var + '_FOR_BUILD']) for var in ('CC', 'CXX') if os.environ.get(var + '_FOR_BUILD')]
+        build_platform = 'MacOSX' if platform.system() == 'Darwin' else 'Linux'
+        key = hashlib.sha1(json.dumps([self.version, platform.system(), platform.machine(), build_compilers,
+                                       str(self.options.data_filter)]).encode('utf-8')).hexdigest()[:16]
+        tools_root = os.environ.get('CONAN_ICU_HOST_TOOLS_DIR',
+                                    os.path.join(os.path.expanduser('~'), '.conan', 'icu_host_tools'))
+        host_dir = os.path.join(tools_root, '{0}-{1}'.format(self.version, key))
+
+        if os.path.isfile(os.path.join(host_dir, 'config', 'icucross.mk')):
+            self.output.info("Reusing the ICU host tools in {0}".format(host_dir))
+            return host_dir
+
+        self.output.info("Building the ICU host tools in {0}".format(host_dir))
+
+        # build next to the final location and rename it into place, concurrent builds keep the first one
+        tmp_dir = '{0}.tmp-{1}'.format(host_dir, os.getpid())
+        os.makedirs(tmp_dir)
+        self.run_phase('host_tools', "cd {builddir} && unset CC CXX CPP CFLAGS CXXFLAGS CPPFLAGS LDFLAGS LIBS && "
+                                     "{compilers}bash {runconfigure} {platform} --enable-static --disable-shared "
+                                     "--with-data-packaging=archive --disable-tests --disable-samples --disable-extras "
+                                     "&& make {silent} -j {cpus_var}".format(builddir=tmp_dir,
+                                                                            compilers="".join('{0}="{1}" '.format(var, value)
+                                                                                              for var, value in build_compilers),
+                                                                            runconfigure=os.path.join(self.cfg['icu_source_dir'], 'runConfigureICU'),
+                                                                            platform=build_platform,
+                                                                            silent=self.cfg['silent'],
+                                                                            cpus_var=self.cfg['jobs']))
+        try:
+            os.rename(tmp_dir, host_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return host_dir
+
+    def use_host_tools(self, host_dir):
+        self.cfg['host'] = '{0} --with-cross-build={1}'.format(self.cfg['host'], host_dir).strip()
+
+        # icudt<version>l.dat is the same on every little endian ASCII target, so those repackage
+        # the host's archive with pkgdata instead of compiling the data sources again
+        big_endian_archs = ('ppc32', 'ppc64', 'sparc', 'sparcv9', 's390', 's390x', 'mips', 'mips64')
+        data_archive = os.path.join(host_dir, 'data', 'out', 'icudt{0}l.dat'.format(self.version.split('.')[0]))
+        if str(self.settings.arch) not in big_endian_archs and os.path.isfile(data_archive):
+            self.cfg['make_args'] = 'ICUDATA_SOURCE_ARCHIVE={0}'.format(data_archive)
+
+    # The number of make jobs and the MAKEFLAGS applying it to every make. Without the jobs option this
+    # is one job per cpu and only the compile steps run in parallel, as before. 'auto' caps the jobs by
+    # the available memory (CONAN_ICU_MEM_PER_JOB MB per job, CONAN_ICU_MEM_LIMIT MB at most) and by the
+    # load of the other tenants, and has make hold back new jobs while the load exceeds the cpus (-l).
+    def job_budget(self):
+        cpus = tools.cpu_count()
+        if not self.options.jobs:
+            return cpus, ''
+        if str(self.options.jobs) != 'auto':
+            jobs = max(1, int(str(self.options.jobs)))
+            return jobs, '-j{0}'.format(jobs)
+
+        jobs = cpus
+        if hasattr(os, 'getloadavg'):
+            jobs = min(jobs, max(1, int(round(cpus - os.getloadavg()[0]))))
+
+        if self.settings.build_type == 'Debug':
+            default_mem_per_job = 1024
+        elif 'lto' in str(self.options.optimization):
+            default_mem_per_job = 2048
+        else:
+            default_mem_per_job = 512
+        mem_per_job = int(os.environ.get('CONAN_ICU_MEM_PER_JOB', default_mem_per_job))
+
+        mem = self.available_memory_mb()
+        if os.environ.get('CONAN_ICU_MEM_LIMIT'):
+            mem = min(mem or sys.maxsize, int(os.environ['CONAN_ICU_MEM_LIMIT']))
+        if mem is not None:
+            jobs = min(jobs, max(1, mem // mem_per_job))
+
+        self.output.info("Make job budget: {0} of {1} cpus, {2} MB per job, {3} MB available".format(jobs, cpus, mem_per_job, mem))
+        return jobs, '-j{0} -l{1}'.format(jobs, cpus)
+
+    # The available memory in MB or None, also used by build_all_local.py to cap its concurrent builds
+    @staticmethod
+    def available_memory_mb():
+        # only Linux exposes this cheaply, other hosts are limited by the cpus and the load only
+        try:
+            with open('/proc/meminfo') as meminfo:
+                for line in meminfo:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) // 1024
+        except (IOError, OSError, ValueError):
+            pass
+        return None
+
+    # Builds the test programs once, then runs the suites through their own 'make check' (which sets up
+    # the library path and ICU_DATA) as concurrent shards. make_cmd turns make arguments into the
+    # platform's command line.
+    def run_unit_tests(self, make_cmd):
+        results_dir = os.path.join(self.conanfile_directory, 'test_results')
+        if not os.path.isdir(results_dir):
+            os.makedirs(results_dir)
+
+        with self.timed_phase('check_build'):
+            for test_dir in ('test/testdata', 'test/intltest', 'test/cintltst', 'test/iotest'):
+                self.run(make_cmd("{silent} -j {cpus_var} -C {test_dir}".format(silent=self.cfg['silent'],
+                                                                                cpus_var=self.cfg['jobs'],
+                                                                                test_dir=test_dir)))
+
+        shards = [('cintltst', 'all', make_cmd("-C test/cintltst check")),
+                  ('iotest', 'all', make_cmd("-C test/iotest check"))]
+
+        groups = self.intltest_groups(make_cmd, results_dir)
+        if groups:
+            for group in groups:
+                shards.append(('intltest', group, make_cmd("-C test/intltest check INTLTEST_OPTS={0}".format(group))))
+        else:
+            shards.append(('intltest', 'all', make_cmd("-C test/intltest check")))
+
+        timeout = int(os.environ.get('CONAN_ICU_TEST_TIMEOUT', '3600'))
+        # every shard is a single test process, so as many run at once as the budget has make jobs
+        pool = ThreadPool(max(1, min(self.cfg['jobs'], len(shards))))
+        with self.timed_phase('check'):
+            try:
+                results = pool.map(lambda shard: self.run_test_shard(shard, timeout, results_dir), shards)
+            finally:
+                pool.close()
+                pool.join()
+
+        self.write_test_reports(results, results_dir)
+
+        failed = ['{0}/{1}'.format(r['suite'], r['name']) for r in results if r['status'] != 'passed']
+        if failed:
+            raise Exception("ICU unit tests failed: {0} (see {1})".format(", ".join(failed), results_dir))
+
+    # intltest prints its top level test names after a line of dashes when asked to LIST them
+    def intltest_groups(self, make_cmd, results_dir):
+        listing = self.run_test_shard(('intltest', 'LIST', make_cmd("-C test/intltest check INTLTEST_OPTS=LIST")),
+                                      600, results_dir)
+        groups = []
+        in_list = False
+        with open(listing['log'], 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('-----'):
+                    in_list = True
+                elif in_list and re.match(r'^\w+$', line):
+                    groups.append(line)
+                elif in_list:
+                    break
+        return groups
+
+    def run_test_shard(self, shard, timeout, results_dir):
+        suite, name, command = shard
+        log_file = os.path.join(results_dir, '{0}-{1}.log'.format(suite, name))
+        result = {'suite': suite, 'name': name, 'log': log_file}
+
+        # the shell, make and the test program get a process group of their own, which a timeout kills as a whole
+        if os.name != 'posix':
+            popen_args = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        elif sys.version_info[0] >= 3:
+            popen_args = {'start_new_session': True}
+        else:
+            # the shards run on pool threads, where preexec_fn may deadlock the child, python 2 has nothing else
+            popen_args = {'preexec_fn': os.setsid}
+        start = time.time()
+        with open(log_file, 'w') as log:
+            process = subprocess.Popen(command, shell=True, stdout=log, stderr=subprocess.STDOUT, **popen_args)
+            while process.poll() is None:
+                if time.time() - start > timeout:
+                    self.kill_process_tree(process)
+                    result['status'] = 'timeout'
+                    break
+                time.sleep(0.5)
+        result['time'] = round(time.time() - start, 3)
+        result.setdefault('status', 'passed' if process.returncode == 0 else 'failed')
+        result['returncode'] = process.returncode
+
+        self.output.info("[{0}/{1}] {2} in {3:.0f}s".format(suite, name, result['status'], result['time']))
+        return result
+
+    @staticmethod
+    def kill_process_tree(process):
+        if os.name == 'posix':
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        else:
+            with open(os.devnull, 'w') as devnull:
+                subprocess.call('taskkill /F /T /PID {0}'.format(process.pid), stdout=devnull, stderr=devnull)
+        process.wait()
+
+    def write_test_reports(self, results, results_dir):
+        testsuites = ElementTree.Element('testsuites')
+        durations = {}
+        for suite in sorted(set(r['suite'] for r in results)):
+            cases = [r for r in results if r['suite'] == suite]
+            durations[suite] = dict((r['name'], r['time']) for r in cases)
+            testsuite = ElementTree.SubElement(testsuites, 'testsuite', name=suite, tests=str(len(cases)),
+                                               failures=str(len([r for r in cases if r['status'] != 'passed'])),
+                                               time=str(sum(r['time'] for r in cases)))
+            for r in cases:
+                testcase = ElementTree.SubElement(testsuite, 'testcase', classname=suite, name=r['name'], time=str(r['time']))
+                if r['status'] != 'passed':
+                    with open(r['log'], 'r') as f:
+                        tail = f.read()[-8192:]
+                    failure = ElementTree.SubElement(testcase, 'failure',
+                                                     message='{0} (exit code {1})'.format(r['status'], r['returncode']))
+                    failure.text = tail
+
+        ElementTree.ElementTree(testsuites).write(os.path.join(results_dir, 'junit.xml'), encoding='utf-8')
+        with open(os.path.join(results_dir, 'durations.json'), 'w') as f:
+            json.dump(durations, f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def sha256sum(file_path):
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def download_cache_dir():
+        return os.environ.get('CONAN_ICU_DOWNLOAD_CACHE',
+                              os.path.join(os.path.expanduser('~'), '.conan', 'icu_downloads'))
+
+    # The pinned sha256 of every download by file name, None when it is not pinned
+    def known_source_sums(self):
+        return dict((filename, sha256) for filename, (url, sha256) in self.source_downloads.items())
+
+    # Path of the prepared sources snapshot for the given downloads, None if one of them is unknown
+    def source_snapshot(self, sums):
+        if None in sums.values():
+            return None
+        key = hashlib.sha1()
+        key.update('{0}-{1}'.format(self.source_snapshot_revision, self.version).encode('utf-8'))
+        for filename in sorted(sums):
+            key.update('{0}={1}'.format(filename, sums[filename]).encode('utf-8'))
+        snapshot_dir = os.environ.get('CONAN_ICU_SOURCE_SNAPSHOT_DIR', os.path.join(self.download_cache_dir(), 'prepared'))
+        return os.path.join(snapshot_dir, '{0}-{1}-{2}.tar'.format(self.name, self.version, key.hexdigest()))
+
+    # Fetches all source_downloads concurrently into dest_dir, returns their paths by file name
+    def fetch_sources(self, dest_dir):
+        cache_dir = self.download_cache_dir()
+        if not os.path.isdir(os.path.join(cache_dir, 'sha256')):
+            os.makedirs(os.path.join(cache_dir, 'sha256'))
+
+        def fetch(item):
+            filename, (url, sha256) = item
+            return filename, self.fetch_source(filename, url, sha256, cache_dir, dest_dir)
+
+        pool = ThreadPool(len(self.source_downloads))
+        try:
+            fetched = pool.map(fetch, sorted(self.source_downloads.items()))
+        finally:
+            pool.close()
+            pool.join()
+        return dict(fetched)
+
+    def fetch_source(self, filename, url, sha256, cache_dir, dest_dir):
+        dest = os.path.join(dest_dir, filename)
+        cached = os.path.join(cache_dir, 'sha256', sha256) if sha256 else None
+
+        if cached and os.path.isfile(cached):
+            self.output.info("Using cached {0} ({1})".format(filename, sha256))
+            shutil.copy(cached, dest)
+        else:
+            mirror = os.environ.get('CONAN_ICU_MIRROR')
+            if mirror and os.path.isdir(mirror):
+                self.output.info("Copying {0} from {1}".format(filename, mirror))
+                shutil.copy(os.path.join(mirror, filename), dest)
+            else:
+                if mirror:
+                    url = '{0}/{1}'.format(mirror.rstrip('/'), filename)
+                self.output.info("Downloading {0}".format(url))
+                tools.download(url, dest, overwrite=True)
+
+        actual = self.sha256sum(dest)
+        if not sha256:
+            if not os.environ.get('CONAN_ICU_UNPINNED_SOURCES'):
+                raise Exception("No pinned sha256 for {0} (downloaded {1}), verify it and pin it in source_downloads".format(
+                    filename, actual))
+            # the file is used for this build only, it is neither trusted nor cached
+            self.output.warn("No pinned sha256 for {0}, the download has sha256 {1}".format(filename, actual))
+            return dest
+        if actual != sha256:
+            raise Exception("Checksum mismatch for {0}: expected sha256 {1}, got {2}".format(filename, sha256, actual))
+
+        cached = os.path.join(cache_dir, 'sha256', actual)
+        if not os.path.isfile(cached):
+            shutil.copy(dest, cached + '.tmp-{0}'.format(os.getpid()))
+            shutil.move(cached + '.tmp-{0}'.format(os.getpid()), cached)
+        return dest
+
     def build_config_cmd(self):
         outdir = self.cfg['output_dir']
 
@@ -240,20 +1589,243 @@ class IcuConan(ConanFile):
                             self.cfg['output_dir'],
                             flags=re.IGNORECASE).replace('\\', '/')
 
-        config_cmd = "../source/runConfigureICU {enable_debug} " \
+        config_cmd = "{configure_script} {enable_debug} " \
                      "{platform} {host} {lib_arch_bits} {outdir} " \
-                     "{enable_static} {data_packaging} {general}" \
-                     "".format(enable_debug=self.cfg['enable_debug'],
+                     "{enable_static} {data_packaging} {general} {cache_file}" \
+                     "".format(configure_script=self.cfg['configure_script'],
+                               enable_debug=self.cfg['enable_debug'],
                                platform=self.cfg['platform'],
                                host=self.cfg['host'],
                                lib_arch_bits='--with-library-bits=%s' % self.cfg['arch_bits'],
                                outdir='--prefix=%s' % outdir,
                                enable_static=self.cfg['enable_static'],
                                data_packaging=self.cfg['data_packaging'],
-                               general=self.cfg['general_opts'])
+                               general=self.cfg['general_opts'],
+                               cache_file='--cache-file=config.cache' if self.options.configure_cache else '')
 
         return config_cmd
 
+    # Replaces the objects of the unity_dirs in their configured Makefiles by batches of unity_batch_size
+    # sources, compiled through generated conan_unity_<n>.cpp files next to the sources. Sources that
+    # define file local names (statics, anonymous namespaces, types) which another source of the batch
+    # defines as well go to different batches, sources that configure macros before their includes and
+    # those in CONAN_ICU_UNITY_EXCLUDE are compiled on their own.
+    def setup_unity_build(self):
+        batch_size = int(str(self.options.unity_batch_size))
+        excludes = set(name.strip() for name in os.environ.get('CONAN_ICU_UNITY_EXCLUDE', '').split(',') if name.strip())
+
+        for directory in self.unity_dirs:
+            src_dir = os.path.join(self.cfg['icu_source_dir'], directory)
+            makefile = os.path.join(self.cfg['build_dir'], directory, 'Makefile')
+            with open(makefile, 'r') as f:
+                content = f.read()
+
+            m = re.search(r'^OBJECTS\s*=((?:[^\n]*\\\n)*[^\n]*)$', content, re.MULTILINE)
+            if not m:
+                self.output.warn("No OBJECTS in {0}, building {1} file by file".format(makefile, directory))
+                continue
+
+            merged, separate = [], []
+            for obj in m.group(1).replace('\\\n', ' ').split():
+                source = os.path.join(src_dir, obj[:-len('.o')] + '.cpp')
+                scan = self.scan_unity_source(source) if obj.endswith('.o') and os.path.isfile(source) and \
+                                                         os.path.basename(source) not in excludes else None
+                if scan:
+                    merged.append(scan)
+                else:
+                    separate.append(obj)
+
+            # first fit into the batches, so that no batch holds a file local name twice
+            batches = []
+            for scan in merged:
+                for batch in batches:
+                    if len(batch) < batch_size and not any(scan['names'] & other['names'] for other in batch):
+                        batch.append(scan)
+                        break
+                else:
+                    batches.append([scan])
+
+            objects = []
+            for number, batch in enumerate(batches):
+                if len(batch) == 1:
+                    objects.append(os.path.splitext(os.path.basename(batch[0]['source']))[0] + '.o')
+                    continue
+                # 'using namespace' leaks into the sources that follow, so those go last
+                batch.sort(key=lambda scan: scan['using_namespace'])
+                unity_name = 'conan_unity_{0}'.format(number)
+                with open(os.path.join(src_dir, unity_name + '.cpp'), 'w') as f:
+                    f.write("// Generated by the unity_build option of the conan recipe\n")
+                    for scan in batch:
+                        f.write('#include "{0}"\n'.format(os.path.basename(scan['source'])))
+                        for macro in sorted(scan['macros']):
+                            f.write('#undef {0}\n'.format(macro))
+                objects.append(unity_name + '.o')
+
+            shutil.copy(makefile, makefile + '.per_file')
+            with open(makefile, 'w') as f:
+                f.write(content[:m.start()] + 'OBJECTS = ' + ' '.join(objects + separate) + content[m.end():])
+
+            self.output.info("Unity build of {0}: {1} sources in {2} batches, {3} compiled on their own".format(
+                directory, len(merged), len([batch for batch in batches if len(batch) > 1]),
+                len(separate) + len([batch for batch in batches if len(batch) == 1])))
+
+    def restore_per_file_build(self):
+        for directory in self.unity_dirs:
+            makefile = os.path.join(self.cfg['build_dir'], directory, 'Makefile')
+            if os.path.isfile(makefile + '.per_file'):
+                shutil.move(makefile + '.per_file', makefile)
+
+    # Returns the file local names, the macros and whether the source has a 'using namespace' at file
+    # scope, or None when the source can't be merged with others
+    @staticmethod
+    def scan_unity_source(source):
+        with open(source, 'rb') as f:
+            text = f.read().decode('utf-8', 'replace')
+        # comments and literals don't declare anything
+        text = re.sub(r'/\*.*?\*/', ' ', text, flags=re.DOTALL)
+        text = re.sub(r'//[^\n]*', '', text)
+        text = re.sub(r'"(?:\\.|[^"\\\n])*"', '""', text)
+        text = re.sub(r"'(?:\\.|[^'\\\n])*'", "''", text)
+        lines = text.split('\n')
+
+        # macros set up before an include change what the include declares, which a previous source
+        # of the batch has already included
+        includes = [i for i, line in enumerate(lines) if re.match(r'\s*#\s*include\b', line)]
+        if any(re.match(r'\s*#\s*(define|undef)\b', line) for line in lines[:includes[-1] if includes else 0]):
+            return None
+
+        scan = {'source': source, 'names': set(), 'macros': set(), 'using_namespace': False}
+        scopes = []
+        pending_static = False
+        for line in lines:
+            stripped = line.strip()
+            m = re.match(r'#\s*define\s+(\w+)', stripped)
+            if m:
+                scan['macros'].add(m.group(1))
+                continue
+            m = re.match(r'#\s*undef\s+(\w+)', stripped)
+            if m:
+                scan['macros'].discard(m.group(1))
+                continue
+            if stripped.startswith('#'):
+                continue
+
+            file_scope = all(scope != 'block' for scope in scopes)
+            anonymous = 'anonymous' in scopes
+            if file_scope:
+                if re.match(r'(using\s+namespace\b|U_NAMESPACE_USE\b)', stripped):
+                    scan['using_namespace'] = True
+                m = re.match(r'(?:typedef\s+)?(?:class|struct|union|enum)\s+(?:U_\w+_API\s+)?(\w+)\s*(?:[:{]|$)', stripped)
+                if m:
+                    scan['names'].add(m.group(1))
+                m = re.match(r'typedef\b.*?(\w+)\s*;$', stripped)
+                if m:
+                    scan['names'].add(m.group(1))
+                if stripped.startswith('static ') or anonymous or pending_static:
+                    m = re.match(r'(?:[\w:<>,]+[\s*&]+)*?(\w+)\s*(?:\(|\[|=|;)', stripped)
+                    if m and m.group(1) not in ('static', 'const', 'inline', 'return', 'operator'):
+                        scan['names'].add(m.group(1))
+                    pending_static = stripped.startswith('static ') and not m and not stripped.endswith(';')
+
+            if stripped.startswith('U_NAMESPACE_BEGIN') or stripped.startswith('U_CDECL_BEGIN'):
+                scopes.append('namespace')
+            elif stripped.startswith('U_NAMESPACE_END') or stripped.startswith('U_CDECL_END'):
+                if scopes:
+                    scopes.pop()
+            for token in re.finditer(r'(namespace\s*\{)|(namespace\s+\w+\s*\{)|(extern\s*""\s*\{)|([{}])', line):
+                if token.group(1):
+                    scopes.append('anonymous')
+                elif token.group(2) or token.group(3):
+                    scopes.append('namespace')
+                elif token.group(4) == '{':
+                    scopes.append('block')
+                elif scopes:
+                    scopes.pop()
+        return scan
+
+    # Creates the directory for the intermediate build files under the scratch_dir option, 'ram' being
+    # /dev/shm. Returns None, to build in the conan cache, when it has less than CONAN_ICU_SCRATCH_MIN_MB
+    # (4096 by default) free. The directory is named after the build folder, so that a rebuild compiles
+    # in the same paths and hits the compiler cache.
+    def scratch_build_dir(self):
+        scratch_root = '/dev/shm' if str(self.options.scratch_dir) == 'ram' else os.path.expanduser(str(self.options.scratch_dir))
+        required_mb = int(os.environ.get('CONAN_ICU_SCRATCH_MIN_MB', '4096'))
+        try:
+            stat = os.statvfs(scratch_root)
+            free_mb = stat.f_bavail * stat.f_frsize // (1024 * 1024)
+        except OSError:
+            free_mb = 0
+
+        if free_mb < required_mb:
+            self.output.warn("{0} has {1} MB free, {2} MB are needed, building in {3}".format(scratch_root, free_mb, required_mb,
+                                                                                             self.cfg['build_dir']))
+            return None
+
+        build_folder_hash = hashlib.sha1(os.path.abspath(self.conanfile_directory).encode('utf-8')).hexdigest()[:12]
+        scratch_dir = os.path.join(scratch_root, '{0}-{1}-{2}'.format(self.name, self.version, build_folder_hash))
+        # the leftovers of a build that was killed before its cleanup
+        if os.path.isdir(scratch_dir):
+            shutil.rmtree(scratch_dir)
+        os.makedirs(scratch_dir)
+        self.output.info("Building in {0} ({1} MB free)".format(scratch_dir, free_mb))
+        return scratch_dir
+
+    # Identifies the toolchain configure probes: the settings, the platform and host given to
+    # runConfigureICU, the compilers' version banners and the environment autoconf treats as precious
+    def configure_cache_file(self):
+        key = hashlib.sha1()
+        for setting in ('os', 'arch', 'compiler', 'compiler.version', 'compiler.libcxx', 'compiler.runtime', 'build_type'):
+            key.update('{0}={1}\n'.format(setting, self.settings.get_safe(setting)).encode('utf-8'))
+        key.update('{0} {1}\n'.format(self.cfg['platform'], self.cfg['host']).encode('utf-8'))
+        for var in ('CC', 'CXX', 'CPP', 'CFLAGS', 'CXXFLAGS', 'CPPFLAGS', 'LDFLAGS', 'LIBS'):
+            key.update('{0}={1}\n'.format(var, os.environ.get(var, '')).encode('utf-8'))
+
+        if self.settings.os == 'Windows':
+            key.update(self.cfg['vccmd'].encode('utf-8'))
+        else:
+            for compiler in self.compilers():
+                try:
+                    version = subprocess.check_output(compiler.split() + ['--version'], stderr=subprocess.STDOUT)
+                except (OSError, subprocess.CalledProcessError):
+                    version = b''
+                key.update(version)
+
+        cache_dir = os.environ.get('CONAN_ICU_CONFIGURE_CACHE_DIR',
+                                   os.path.join(os.path.expanduser('~'), '.conan', 'icu_configure_cache'))
+        return os.path.join(cache_dir, '{0}-{1}-{2}.cache'.format(self.name, self.version, key.hexdigest()))
+
+    # Runs configure in the build dir, seeded from and saved back to the persistent config.cache when
+    # the configure_cache option is on
+    def run_configure(self, phase, command):
+        if not self.options.configure_cache:
+            self.run_phase(phase, command)
+            return
+
+        cache_file = self.configure_cache_file()
+        build_cache = os.path.join(self.cfg['build_dir'], 'config.cache')
+        if os.path.isfile(cache_file):
+            self.output.info("Using configure cache: {0}".format(cache_file))
+            shutil.copy(cache_file, build_cache)
+            try:
+                self.run_phase(phase, command)
+            except Exception:
+                # autoconf refuses a cache that does not match the environment, probe from scratch
+                self.output.warn("configure failed with the cached results, discarding {0}".format(cache_file))
+                os.remove(cache_file)
+                shutil.rmtree(self.cfg['build_dir'])
+                os.mkdir(self.cfg['build_dir'])
+                self.run_phase(phase, command)
+        else:
+            self.run_phase(phase, command)
+
+        # copied under a temporary name first, concurrent builds may share the cache
+        if os.path.isfile(build_cache):
+            if not os.path.isdir(os.path.dirname(cache_file)):
+                os.makedirs(os.path.dirname(cache_file))
+            tmp_cache = '{0}.tmp-{1}'.format(cache_file, os.getpid())
+            shutil.copy(build_cache, tmp_cache)
+            shutil.move(tmp_cache, cache_file)
+
     def build_msys(self):
         self.cfg['platform'] = 'MSYS/MSVC'
 
@@ -274,22 +1846,26 @@ class IcuConan(ConanFile):
 
         config_cmd = self.build_config_cmd()
 
-        self.run("{vccmd} && cd {builddir} && bash -c ^'{config_cmd}^'".format(vccmd=self.cfg['vccmd'],
-                                                                               builddir=self.cfg['build_dir'],
-                                                                               config_cmd=config_cmd))
+        self.run_configure('configure', "{vccmd} && cd {builddir} && bash -c ^'{config_cmd}^'".format(vccmd=self.cfg['vccmd'],
+                                                                                                    builddir=self.cfg['build_dir'],
+                                                                                                    config_cmd=config_cmd))
 
-        self.run("{vccmd} && cd {builddir} && bash -c ^'make {silent} -j {cpus_var}^'".format(vccmd=self.cfg['vccmd'],
-                                                                                              builddir=self.cfg['build_dir'],
-                                                                                              silent=self.cfg['silent'],
-                                                                                              cpus_var=tools.cpu_count()))
-        if self.options.with_unit_tests:
-            self.run("{vccmd} && cd {builddir} && bash -c ^'make {silent} check^'".format(vccmd=self.cfg['vccmd'],
-                                                                                          builddir=self.cfg['build_dir'],
-                                                                                          silent=self.cfg['silent']))
+        self.run_phase('make', "{vccmd} && cd {builddir} && bash -c ^'make {silent} -j {cpus_var}^'".format(vccmd=self.cfg['vccmd'],
+                                                                                                            builddir=self.cfg['build_dir'],
+                                                                                                            silent=self.cfg['silent'],
+                                                                                                            cpus_var=self.cfg['jobs']))
+        if self.options.with_unit_tests and self.options.parallel_unit_tests:
+            self.run_unit_tests(lambda args: "{vccmd} && cd {builddir} && bash -c ^'make {args}^'".format(vccmd=self.cfg['vccmd'],
+                                                                                                          builddir=self.cfg['build_dir'],
+                                                                                                          args=args))
+        elif self.options.with_unit_tests:
+            self.run_phase('check', "{vccmd} && cd {builddir} && bash -c ^'make {silent} check^'".format(vccmd=self.cfg['vccmd'],
+                                                                                                         builddir=self.cfg['build_dir'],
+                                                                                                         silent=self.cfg['silent']))
 
-        self.run("{vccmd} && cd {builddir} && bash -c ^'make {silent} install^'".format(vccmd=self.cfg['vccmd'],
-                                                                                        builddir=self.cfg['build_dir'],
-                                                                                        silent=self.cfg['silent']))
+        self.run_phase('install', "{vccmd} && cd {builddir} && bash -c ^'make {silent} install^'".format(vccmd=self.cfg['vccmd'],
+                                                                                                         builddir=self.cfg['build_dir'],
+                                                                                                         silent=self.cfg['silent']))
 
 
     def build_cygwin(self):
@@ -312,56 +1888,100 @@ class IcuConan(ConanFile):
         self.output.info("Starting configuration.")
 
         config_cmd = self.build_config_cmd()
-        self.run("{vccmd} && cd {builddir} && bash -c '{config_cmd}'".format(vccmd=self.cfg['vccmd'],
-                                                                             builddir=self.cfg['build_dir'],
-                                                                             config_cmd=config_cmd))
+        self.run_configure('configure', "{vccmd} && cd {builddir} && bash -c '{config_cmd}'".format(vccmd=self.cfg['vccmd'],
+                                                                                                  builddir=self.cfg['build_dir'],
+                                                                                                  config_cmd=config_cmd))
 
         self.output.info("Starting built.")
 
 
-        self.run("{vccmd} && cd {builddir} && make {silent} -j {cpus_var}".format(vccmd=self.cfg['vccmd'],
-                                                                                  builddir=self.cfg['build_dir'],
-                                                                                  silent=self.cfg['silent'],
-                                                                                  cpus_var=tools.cpu_count()))
-        if self.options.with_unit_tests:
-            self.run("{vccmd} && cd {builddir} && make {silent} check".format(vccmd=self.cfg['vccmd'],
-                                                                              builddir=self.cfg['build_dir'],
-                                                                              silent=self.cfg['silent']))
+        self.run_phase('make', "{vccmd} && cd {builddir} && make {silent} -j {cpus_var}".format(vccmd=self.cfg['vccmd'],
+                                                                                                builddir=self.cfg['build_dir'],
+                                                                                                silent=self.cfg['silent'],
+                                                                                                cpus_var=self.cfg['jobs']))
+        if self.options.with_unit_tests and self.options.parallel_unit_tests:
+            self.run_unit_tests(lambda args: "{vccmd} && cd {builddir} && make {args}".format(vccmd=self.cfg['vccmd'],
+                                                                                              builddir=self.cfg['build_dir'],
+                                                                                              args=args))
+        elif self.options.with_unit_tests:
+            self.run_phase('check', "{vccmd} && cd {builddir} && make {silent} check".format(vccmd=self.cfg['vccmd'],
+                                                                                             builddir=self.cfg['build_dir'],
+                                                                                             silent=self.cfg['silent']))
 
-        self.run("{vccmd} && cd {builddir} && make {silent} install".format(vccmd=self.cfg['vccmd'],
-                                                                            builddir=self.cfg['build_dir'],
-                                                                            silent=self.cfg['silent']))
+        self.run_phase('install', "{vccmd} && cd {builddir} && make {silent} install".format(vccmd=self.cfg['vccmd'],
+                                                                                             builddir=self.cfg['build_dir'],
+                                                                                             silent=self.cfg['silent']))
             
 
     def build_unix(self):
+        if self.settings.os == 'Linux':
+            self.cfg['platform'] = 'Linux/gcc' if str(self.settings.compiler).startswith('gcc') else 'Linux'
+        elif self.settings.os == 'Macos':
+            self.cfg['platform'] = 'MacOSX'
+
+        self.cfg['make_args'] = ''
+
+        # the native build must not see the target's compiler flags
+        if self.options.cross_build_tools:
+            if tools.cross_building(self.settings):
+                self.cfg['host'] = '--host={0}'.format(self.gnu_triplet())
+            self.use_host_tools(self.host_tools_build())
+
         env_build = AutoToolsBuildEnvironment(self)
-        with tools.environment_append(env_build.vars):
-            if self.settings.os == 'Linux':
-                self.cfg['platform'] = 'Linux/gcc' if str(self.settings.compiler).startswith('gcc') else 'Linux'
-            elif self.settings.os == 'Macos':
-                self.cfg['platform'] = 'MacOSX'
+        env_vars = dict(env_build.vars)
+        env_vars.update(self.compiler_cache_vars())
+        env_vars.update(self.compile_profile_vars(env_vars))
+        env_vars['CPPFLAGS'] = self.uconfig_cppflags(env_vars.get('CPPFLAGS', ''))
+
+        if str(self.options.optimization) in ('pgo', 'pgo_lto'):
+            # instrumented libraries, installed to the output dir for the training workload only
+            with tools.environment_append(self.optimization_vars(env_vars, 'generate')):
+                self.build_unix_pass(phase_prefix='pgo_', with_unit_tests=False)
+                self.pgo_train()
+            shutil.rmtree(self.cfg['build_dir'])
+            shutil.rmtree(self.cfg['output_dir'])
 
-            os.mkdir(self.cfg['build_dir'])
+        # the profile covers the final build only
+        self.cfg['compile_profile_since'] = time.time()
+        with tools.environment_append(self.optimization_vars(env_vars, 'use')):
+            self.build_unix_pass(phase_prefix='', with_unit_tests=self.options.with_unit_tests)
 
-            config_cmd = self.build_config_cmd()
+    def build_unix_pass(self, phase_prefix, with_unit_tests):
+        os.mkdir(self.cfg['build_dir'])
+
+        config_cmd = self.build_config_cmd()
 
-            # with tools.environment_append(env_build.vars):
-            self.run("cd {builddir} && bash {config_cmd}".format(builddir=self.cfg['build_dir'],
-                                                                 config_cmd=config_cmd))
+        self.run_configure(phase_prefix + 'configure', "cd {builddir} && bash {config_cmd}".format(builddir=self.cfg['build_dir'],
+                                                                                                 config_cmd=config_cmd))
 
-            self.run("cd {builddir} && make {silent} -j {cpus_var}".format(builddir=self.cfg['build_dir'],
-                                                                           cpus_var=tools.cpu_count(),
-                                                                           silent=self.cfg['silent']))
+        make_cmd = "cd {builddir} && make {silent} -j {cpus_var} {make_args}".format(builddir=self.cfg['build_dir'],
+                                                                                      cpus_var=self.cfg['jobs'],
+                                                                                      silent=self.cfg['silent'],
+                                                                                      make_args=self.cfg['make_args'])
+        if self.options.unity_build:
+            self.setup_unity_build()
+            try:
+                self.run_phase(phase_prefix + 'make', make_cmd)
+            except Exception:
+                # the sources that don't compile together are built one by one, like without unity_build
+                self.output.warn("The unity build failed, building common and i18n file by file")
+                self.restore_per_file_build()
+                self.run_phase(phase_prefix + 'make', make_cmd)
+        else:
+            self.run_phase(phase_prefix + 'make', make_cmd)
 
-            if self.options.with_unit_tests:
-                self.run("cd {builddir} && make {silent} check".format(builddir=self.cfg['build_dir'],
-                                                                       silent=self.cfg['silent']))
+        if with_unit_tests and self.options.parallel_unit_tests:
+            self.run_unit_tests(lambda args: "cd {builddir} && make {args}".format(builddir=self.cfg['build_dir'],
+                                                                                   args=args))
+        elif with_unit_tests:
+            self.run_phase('check', "cd {builddir} && make {silent} check".format(builddir=self.cfg['build_dir'],
+                                                                                  silent=self.cfg['silent']))
 
-            self.run("cd {builddir} && make {silent} install".format(builddir=self.cfg['build_dir'],
-                                                                     silent=self.cfg['silent']))
+        self.run_phase(phase_prefix + 'install', "cd {builddir} && make {silent} install".format(builddir=self.cfg['build_dir'],
+                                                                                                 silent=self.cfg['silent']))
 
-            if self.settings.os == 'Macos':
-                with tools.chdir('output/lib'):
-                    for dylib in glob.glob('*icu*.{0}.dylib'.format(self.version)):
-                        self.run('install_name_tool -id {0} {1}'.format(
-                            os.path.basename(dylib), dylib))
+        if self.settings.os == 'Macos':
+            with tools.chdir(os.path.join(self.cfg['output_dir'], 'lib')):
+                for dylib in glob.glob('*icu*.{0}.dylib'.format(self.version)):
+                    self.run('install_name_tool -id {0} {1}'.format(
+                        os.path.basename(dylib), dylib))
@@ -0,0 +1,252 @@
+import subprocess, os, sys, json, argparse, glob, hashlib, shutil, tempfile, re, fnmatch
+
+# python data_bundle.py --package <package folder> --locales en,de_CH,ja --converters ibm-943_P15A-2003 \
+#                       [--keep PATTERN] [--remove PATTERN] [--add FILE[=ITEM]] [--output icu_data]
+#
+# Tailors the full ICU data archive of a package built with -o icu:data_packaging=archive without
+# rebuilding it: the packaged icupkg removes the items that are not needed from a copy of
+# share/icu/<version>/icudt<version>l.dat and adds custom items, *.txt sources are compiled to .res
+# with the packaged genrb first. The application loads the result through ICU_DATA or
+# u_setDataDirectory() from the --output directory.
+#
+# --locales keeps the listed locales, their parents, their sub-locales and root in every locale tree
+# (locales, curr, lang, region, zone, unit, coll, brkitr, rbnf), --converters keeps the listed
+# conversion tables (*.cnv), every other item (normalization, properties, break rules, dictionaries,
+# supplemental data) is kept unless a --remove pattern matches it. --keep patterns win over both.
+# Patterns match the item names printed by --list, i.e. 'coll/*' or '*.cnv'.
+#
+# The bundles are cached by a hash of the archive, the tools, the added files and the arguments
+# (CONAN_ICU_BUNDLE_CACHE, ~/.conan/icu_bundles by default), so a repeated request only copies the
+# archive. The package folder is printed by:
+#
+#    conan info icu/60.1@sigmoidal/testing --paths --only package_folder -o icu:data_packaging=archive
+
+# Trees whose resource bundles are named after a locale
+locale_trees = [ '', 'curr', 'lang', 'region', 'zone', 'unit', 'coll', 'brkitr', 'rbnf' ]
+
+# Bundles of the locale trees that look like a locale id, but are needed by every locale
+shared_bundles = [ 'root', 'pool', 'res_index' ]
+
+def sha256sum(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def find_tool(package_folder, name):
+    for bin_dir in ('bin', 'bin64'):
+        for tool in (name, name + '.exe'):
+            path = os.path.join(package_folder, bin_dir, tool)
+            if os.path.isfile(path):
+                return path
+    # the tools of the package are on the PATH of consumers (env_info.PATH)
+    for path_dir in os.environ.get('PATH', '').split(os.pathsep):
+        for tool in (name, name + '.exe'):
+            path = os.path.join(path_dir, tool)
+            if os.path.isfile(path):
+                return path
+    raise Exception("{0} was found neither in {1} nor on the PATH, build the package with -o icu:with_tools=True".format(
+        name, package_folder))
+
+def find_archive(package_folder):
+    archives = glob.glob(os.path.join(package_folder, 'share', 'icu', '*', 'icudt*.dat'))
+    if len(archives) != 1:
+        raise Exception("Expected one icudt*.dat in {0}, build the package with -o icu:data_packaging=archive".format(
+            os.path.join(package_folder, 'share', 'icu')))
+    return archives[0]
+
+def list_items(icupkg, archive):
+    output = subprocess.check_output([icupkg, '-l', archive]).decode('utf-8')
+    return [line.strip() for line in output.splitlines() if line.strip()]
+
+def split_item(item):
+    # the items may be listed with the package name, i.e. icudt60l/coll/de.res
+    item = re.sub(r'^icudt\d+[lbe]/', '', item)
+    tree, name = os.path.split(item)
+    return tree, name
+
+def is_locale_bundle(item):
+    tree, name = split_item(item)
+    base, ext = os.path.splitext(name)
+    return ext == '.res' and tree in locale_trees and base not in shared_bundles and \
+           re.match(r'^[a-z]{2,3}(_[A-Za-z0-9]+)*$', base) is not None
+
+def keep_locale(name, locales):
+    loc = os.path.splitext(name)[0]
+    # the requested locale, its sub-locales and its parents (i.e. de for de_CH), as the data_filter option
+    return any(loc == wanted or loc.startswith(wanted + '_') or wanted.startswith(loc + '_') for wanted in locales)
+
+def removed_items(items, args):
+    locales = [locale.strip() for locale in args.locales.split(',') if locale.strip()] if args.locales else None
+    converters = [os.path.splitext(converter.strip())[0] for converter in args.converters.split(',')
+                  if converter.strip()] if args.converters else None
+
+    removed = []
+    for item in items:
+        tree, name = split_item(item)
+        relative = '/'.join([tree, name]) if tree else name
+        if any(fnmatch.fnmatch(relative, pattern) for pattern in args.keep):
+            continue
+        if any(fnmatch.fnmatch(relative, pattern) for pattern in args.remove):
+            removed.append(item)
+        elif locales is not None and is_locale_bundle(item) and not keep_locale(name, locales):
+            removed.append(item)
+        elif converters is not None and name.endswith('.cnv') and os.path.splitext(name)[0] not in converters:
+            removed.append(item)
+    return removed
+
+# Splits the --add arguments into (file, item), where *.txt sources are renamed to their .res item
+def added_items(args):
+    added = []
+    for spec in args.add:
+        path, _, item = spec.partition('=')
+        if not os.path.isfile(path):
+            raise Exception("--add {0}: no such file".format(path))
+        if not item:
+            item = os.path.basename(path)
+        if path.endswith('.txt') and item.endswith('.txt'):
+            item = item[:-len('.txt')] + '.res'
+        added.append((os.path.abspath(path), item.replace('\\', '/')))
+    return added
+
+def bundle_key(archive, tools, added, args):
+    inputs = { 'archive': sha256sum(archive),
+               'tools': [sha256sum(tool) for tool in tools],
+               'added': [(sha256sum(path), item) for path, item in added],
+               'locales': args.locales,
+               'converters': args.converters,
+               'keep': sorted(args.keep),
+               'remove': sorted(args.remove) }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+def build_bundle(icupkg, genrb, archive, added, args, bundle_dir):
+    parent_dir = os.path.dirname(bundle_dir)
+    if not os.path.isdir(parent_dir):
+        os.makedirs(parent_dir)
+    # next to the cache entry, so that the finished bundle is renamed into place
+    work_dir = tempfile.mkdtemp(prefix='tmp_', dir=parent_dir)
+    try:
+        bundle = os.path.join(work_dir, os.path.basename(archive))
+        shutil.copy(archive, bundle)
+        items = list_items(icupkg, bundle)
+        removed = removed_items(items, args)
+
+        command = [icupkg]
+        if removed:
+            command += ['-r', os.path.join(work_dir, 'remove.lst')]
+
+        if added:
+            # icupkg reads the added items from <source dir>/<item>
+            stage_dir = os.path.join(work_dir, 'stage')
+            for path, item in added:
+                item_dir = os.path.join(stage_dir, os.path.dirname(item))
+                if not os.path.isdir(item_dir):
+                    os.makedirs(item_dir)
+                if path.endswith('.txt'):
+                    subprocess.check_call([genrb, '-q', '-d', item_dir, path])
+                    compiled = os.path.join(item_dir, os.path.splitext(os.path.basename(path))[0] + '.res')
+                    if compiled != os.path.join(stage_dir, item):
+                        shutil.move(compiled, os.path.join(stage_dir, item))
+                else:
+                    shutil.copy(path, os.path.join(stage_dir, item))
+            add_list = os.path.join(work_dir, 'add.lst')
+            with open(add_list, 'w') as f:
+                f.write("\n".join(item for _, item in added) + "\n")
+            command += ['-a', add_list, '-s', stage_dir]
+
+        while removed or added:
+            with open(os.path.join(work_dir, 'remove.lst'), 'w') as f:
+                f.write("\n".join(removed) + "\n")
+            # without an output file icupkg rewrites the input in place, after checking that every kept
+            # item finds the items it depends on (aliases, parent locales, break rules)
+            process = subprocess.Popen(command + [bundle], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            output = process.communicate()[0].decode('utf-8', 'replace')
+            if process.returncode == 0:
+                break
+            missing = set(re.findall(r'depends on missing item (\S+)', output))
+            if not missing or not missing & set(removed):
+                sys.stdout.write(output)
+                raise Exception("icupkg failed to tailor {0}".format(archive))
+            print("Keeping {0}, needed by the kept items".format(", ".join(sorted(missing & set(removed)))))
+            removed = [item for item in removed if item not in missing]
+
+        summary = { 'archive': archive,
+                    'items': len(items),
+                    'removed': len(removed),
+                    'added': len(added),
+                    'bytes_before': os.path.getsize(archive),
+                    'bytes_after': os.path.getsize(bundle),
+                    'locales': args.locales,
+                    'converters': args.converters,
+                    'keep': args.keep,
+                    'remove': args.remove,
+                    'add': [item for _, item in added] }
+        with open(os.path.join(work_dir, 'bundle.json'), 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+
+        # the bundle is moved into place as a whole, so that concurrent requests never see a partial one
+        for scratch in ('remove.lst', 'add.lst', 'stage'):
+            path = os.path.join(work_dir, scratch)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.isfile(path):
+                os.remove(path)
+        try:
+            os.rename(work_dir, bundle_dir)
+        except OSError:
+            if not os.path.isdir(bundle_dir):
+                raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def main(args):
+    package_folder = os.path.abspath(args.package)
+    archive = os.path.abspath(args.archive) if args.archive else find_archive(package_folder)
+    icupkg = find_tool(package_folder, 'icupkg')
+
+    if args.list:
+        print("\n".join(list_items(icupkg, archive)))
+        return 0
+
+    added = added_items(args)
+    genrb = find_tool(package_folder, 'genrb') if any(path.endswith('.txt') for path, _ in added) else None
+    tools = [icupkg] + ([genrb] if genrb else [])
+
+    cache_dir = os.path.abspath(args.cache_dir or os.environ.get('CONAN_ICU_BUNDLE_CACHE',
+                                                                 os.path.join(os.path.expanduser('~'), '.conan', 'icu_bundles')))
+    bundle_dir = os.path.join(cache_dir, bundle_key(archive, tools, added, args))
+    if os.path.isfile(os.path.join(bundle_dir, 'bundle.json')):
+        print("Using the cached bundle {0}".format(bundle_dir))
+    else:
+        build_bundle(icupkg, genrb, archive, added, args, bundle_dir)
+
+    with open(os.path.join(bundle_dir, 'bundle.json'), 'r') as f:
+        summary = json.load(f)
+
+    output_dir = os.path.abspath(args.output)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    shutil.copy(os.path.join(bundle_dir, os.path.basename(archive)), output_dir)
+
+    print("{0}: {1} of {2} items removed, {3} added, {4:.1f} MB -> {5:.1f} MB".format(
+        os.path.join(output_dir, os.path.basename(archive)), summary['removed'], summary['items'], summary['added'],
+        summary['bytes_before'] / 1048576.0, summary['bytes_after'] / 1048576.0))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--package', required=True, help='package folder of icu built with data_packaging=archive')
+    parser.add_argument('--archive', help='icudt*.dat to tailor instead of the one in the package')
+    parser.add_argument('--locales', help='comma separated locales to keep, all are kept by default')
+    parser.add_argument('--converters', help='comma separated conversion tables to keep, all are kept by default')
+    parser.add_argument('--keep', action='append', default=[], help='item pattern that is always kept')
+    parser.add_argument('--remove', action='append', default=[], help='item pattern to remove')
+    parser.add_argument('--add', action='append', default=[], help='FILE[=ITEM], a .res/.cnv/... item or a .txt source to add')
+    parser.add_argument('--output', default='icu_data', help='directory the tailored archive is written to')
+    parser.add_argument('--cache-dir', help='bundle cache, CONAN_ICU_BUNDLE_CACHE or ~/.conan/icu_bundles by default')
+    parser.add_argument('--list', action='store_true', help='list the items of the archive and exit')
+    args = parser.parse_args()
+
+    exit(main(args))
@@ -0,0 +1,38 @@
+from conans import ConanFile
+import os
+
+#
+# Packages the debug info that split_debug_info=True of the icu recipe writes to the build machine's
+# CONAN_ICU_DEBUG_INFO_DIR (~/.conan/icu_debug_info by default), as a package of its own per icu binary,
+# i.e. after building:
+#
+#    conan create sigmoidal/testing --cwd debug_info -o icu_debug_info:icu_package_id=<icu package id>
+#    conan upload icu_debug_info/60.1@sigmoidal/testing --all -r sigmoidal
+#
+# Whoever debugs that icu binary retrieves the matching debug info with
+#
+#    conan install icu_debug_info/60.1@sigmoidal/testing -o icu_debug_info:icu_package_id=<icu package id>
+#
+# and points gdb at its package folder with 'set debug-file-directory', which holds the .build-id links.
+#
+
+class IcuDebugInfoConan(ConanFile):
+    name = "icu_debug_info"
+    version = "60.1"
+    license = "http://www.unicode.org/copyright.html#License"
+    description = "Debug info split from the icu package of the given package id"
+    url = "https://github.com/sigmoidal/conan-icu"
+    options = {"icu_package_id": "ANY"}
+    default_options = "icu_package_id=None"
+
+    def configure(self):
+        if not self.options.icu_package_id:
+            raise Exception("icu_package_id is required, the package id of the icu binary the debug info belongs to")
+
+    def package(self):
+        debug_info_root = os.environ.get('CONAN_ICU_DEBUG_INFO_DIR',
+                                         os.path.join(os.path.expanduser('~'), '.conan', 'icu_debug_info'))
+        debug_dir = os.path.join(debug_info_root, str(self.options.icu_package_id))
+        if not os.path.isdir(debug_dir):
+            raise Exception("No debug info in {0}, build the icu package with -o icu:split_debug_info=True".format(debug_dir))
+        self.copy("*", src=debug_dir, keep_path=True, symlinks=True)
@@ -0,0 +1,155 @@
+// Training workload for optimization=pgo: exercises the hot paths of ICU (conversion, collation,
+// normalization and break iteration) on the freshly built instrumented libraries, so that the
+// second build is optimized for them.
+//
+// usage: workload [iterations]
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <vector>
+#include "unicode/utypes.h"
+#include "unicode/ustring.h"
+#include "unicode/ucnv.h"
+#include "unicode/ucol.h"
+#include "unicode/unorm2.h"
+#include "unicode/ubrk.h"
+
+// A small multilingual corpus (UTF-8), repeated to form the training text
+static const char *corpus[] = {
+    "The quick brown fox jumps over the lazy dog. It's 3:45 p.m., isn't it? ",
+    "Falsches \xC3\x9C" "ben von Xylophonmusik qu\xC3\xA4lt jeden gr\xC3\xB6\xC3\x9F" "eren Zwerg. Stra\xC3\x9F" "e, Ma\xC3\x9F" "e. ",
+    "Voix ambigu\xC3\xAB d'un c\xC5\x93ur qui au z\xC3\xA9phyr pr\xC3\xA9" "f\xC3\xA8re les jattes de kiwis. ",
+    "\xD0\xA1\xD1\x8A\xD0\xB5\xD1\x88\xD1\x8C \xD0\xB6\xD0\xB5 \xD0\xB5\xD1\x89\xD1\x91 \xD1\x8D\xD1\x82\xD0\xB8\xD1\x85 \xD0\xBC\xD1\x8F\xD0\xB3\xD0\xBA\xD0\xB8\xD1\x85 \xD1\x84\xD1\x80\xD0\xB0\xD0\xBD\xD1\x86\xD1\x83\xD0\xB7\xD1\x81\xD0\xBA\xD0\xB8\xD1\x85 \xD0\xB1\xD1\x83\xD0\xBB\xD0\xBE\xD0\xBA. ",
+    "\xE3\x81\x84\xE3\x82\x8D\xE3\x81\xAF\xE3\x81\xAB\xE3\x81\xBB\xE3\x81\xB8\xE3\x81\xA8\xE3\x80\x81\xE6\x97\xA5\xE6\x9C\xAC\xE8\xAA\x9E\xE3\x81\xAE\xE6\x96\x87\xE7\xAB\xA0\xE3\x81\xA7\xE3\x81\x99\xE3\x80\x82",
+    "\xE4\xB8\xAD\xE6\x96\x87\xE6\x96\x87\xE6\x9C\xAC\xE7\x9A\x84\xE6\x96\xAD\xE8\xAF\x8D\xE5\x92\x8C\xE6\x8E\x92\xE5\xBA\x8F\xE3\x80\x82",
+    "\xD8\xA7\xD9\x84\xD8\xB9\xD8\xB1\xD8\xA8\xD9\x8A\xD8\xA9 \xD9\x84\xD8\xBA\xD8\xA9 \xD8\xAC\xD9\x85\xD9\x8A\xD9\x84\xD8\xA9. ",
+    "e\xCC\x81" "cole, A\xCC\x8A" "ngstro\xCC\x88m, \xEF\xAC\x81nance, \xE2\x84\xAB. "
+};
+
+static const char *locales[] = { "en", "de", "fr", "ru", "ja", "zh", "ar" };
+
+#define LENGTHOF(array) (int32_t)(sizeof(array)/sizeof((array)[0]))
+
+static void check(UErrorCode status, const char *what) {
+    if(U_FAILURE(status)) {
+        fprintf(stderr, "%s: %s\n", what, u_errorName(status));
+    }
+}
+
+static void convert(const std::vector<UChar> &text) {
+#if !UCONFIG_NO_LEGACY_CONVERSION
+    const char *charsets[] = { "UTF-8", "ISO-8859-1", "Shift_JIS" };
+#else
+    const char *charsets[] = { "UTF-8", "ISO-8859-1" };
+#endif
+    std::vector<char> bytes(text.size() * 4 + 16);
+    std::vector<UChar> back(text.size() + 16);
+
+    for(int32_t i = 0; i < LENGTHOF(charsets); ++i) {
+        UErrorCode status = U_ZERO_ERROR;
+        UConverter *cnv = ucnv_open(charsets[i], &status);
+        if(U_FAILURE(status)) {
+            check(status, charsets[i]);
+            continue;
+        }
+        int32_t length = ucnv_fromUChars(cnv, &bytes[0], (int32_t)bytes.size(), &text[0], (int32_t)text.size(), &status);
+        ucnv_toUChars(cnv, &back[0], (int32_t)back.size(), &bytes[0], length, &status);
+        check(status, charsets[i]);
+        ucnv_close(cnv);
+    }
+
+    // the UTF-8 fast paths of ustring.h
+    UErrorCode status = U_ZERO_ERROR;
+    int32_t length = 0;
+    u_strToUTF8(&bytes[0], (int32_t)bytes.size(), &length, &text[0], (int32_t)text.size(), &status);
+    u_strFromUTF8(&back[0], (int32_t)back.size(), NULL, &bytes[0], length, &status);
+    check(status, "u_strToUTF8/u_strFromUTF8");
+}
+
+#if !UCONFIG_NO_COLLATION
+static void collate(const std::vector<std::vector<UChar> > &lines) {
+    uint8_t key[4096];
+    for(int32_t i = 0; i < LENGTHOF(locales); ++i) {
+        UErrorCode status = U_ZERO_ERROR;
+        UCollator *coll = ucol_open(locales[i], &status);
+        if(U_FAILURE(status)) {
+            check(status, "ucol_open");
+            continue;
+        }
+        for(size_t j = 0; j < lines.size(); ++j) {
+            ucol_getSortKey(coll, &lines[j][0], (int32_t)lines[j].size(), key, (int32_t)sizeof(key));
+            const std::vector<UChar> &other = lines[(j + 1) % lines.size()];
+            ucol_strcoll(coll, &lines[j][0], (int32_t)lines[j].size(), &other[0], (int32_t)other.size());
+        }
+        ucol_close(coll);
+    }
+}
+#endif
+
+static void normalize(const std::vector<UChar> &text) {
+    std::vector<UChar> dest(text.size() * 4 + 16);
+    UErrorCode status = U_ZERO_ERROR;
+    const UNormalizer2 *forms[] = { unorm2_getNFCInstance(&status), unorm2_getNFDInstance(&status),
+                                    unorm2_getNFKCInstance(&status), unorm2_getNFKDInstance(&status) };
+    check(status, "unorm2_get*Instance");
+    for(int32_t i = 0; i < LENGTHOF(forms) && U_SUCCESS(status); ++i) {
+        unorm2_normalize(forms[i], &text[0], (int32_t)text.size(), &dest[0], (int32_t)dest.size(), &status);
+        unorm2_isNormalized(forms[i], &text[0], (int32_t)text.size(), &status);
+    }
+    check(status, "unorm2_normalize");
+}
+
+#if !UCONFIG_NO_BREAK_ITERATION
+static void iterate(const std::vector<UChar> &text) {
+    UBreakIteratorType types[] = { UBRK_WORD, UBRK_LINE, UBRK_SENTENCE };
+    for(int32_t i = 0; i < LENGTHOF(locales); ++i) {
+        for(int32_t t = 0; t < LENGTHOF(types); ++t) {
+            UErrorCode status = U_ZERO_ERROR;
+            UBreakIterator *brk = ubrk_open(types[t], locales[i], &text[0], (int32_t)text.size(), &status);
+            if(U_FAILURE(status)) {
+                check(status, "ubrk_open");
+                continue;
+            }
+            while(ubrk_next(brk) != UBRK_DONE) {
+                ubrk_getRuleStatus(brk);
+            }
+            ubrk_close(brk);
+        }
+    }
+}
+#endif
+
+int main(int argc, char **argv) {
+    int iterations = argc > 1 ? atoi(argv[1]) : 200;
+
+    std::vector<std::vector<UChar> > lines;
+    std::vector<UChar> text;
+    for(int32_t i = 0; i < LENGTHOF(corpus); ++i) {
+        UErrorCode status = U_ZERO_ERROR;
+        UChar buffer[1024];
+        int32_t length = 0;
+        u_strFromUTF8(buffer, LENGTHOF(buffer), &length, corpus[i], -1, &status);
+        check(status, "u_strFromUTF8");
+        lines.push_back(std::vector<UChar>(buffer, buffer + length));
+    }
+    for(int r = 0; r < 16; ++r) {
+        for(size_t i = 0; i < lines.size(); ++i) {
+            text.insert(text.end(), lines[i].begin(), lines[i].end());
+        }
+    }
+
+    for(int i = 0; i < iterations; ++i) {
+        convert(text);
+#if !UCONFIG_NO_COLLATION
+        collate(lines);
+#endif
+        normalize(text);
+#if !UCONFIG_NO_BREAK_ITERATION
+        iterate(text);
+#endif
+    }
+
+    printf("ICU training workload: %d iterations over %d UChars\n", iterations, (int)text.size());
+    return 0;
+}
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# Compiler wrapper of the profile_compile option:
+#
+#    python compile_wrapper.py <log> <compiler> [arguments]
+#
+# Runs the compiler and appends one JSON line to <log> with the start and end time of the invocation,
+# its peak resident memory, the sources it was given and the size of the object or binary it wrote.
+# The recipe turns the log into the report of the slowest translation units and of the longest serial chain.
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+source_extensions = ('.c', '.cc', '.cpp', '.cxx')
+
+
+def main(argv):
+    log, command = argv[1], argv[2:]
+
+    output = None
+    if '-o' in command[:-1]:
+        output = command[command.index('-o') + 1]
+    sources = [arg for arg in command if arg.endswith(source_extensions)]
+
+    start = time.time()
+    retcode = subprocess.call(command)
+    end = time.time()
+
+    record = {'start': start,
+              'end': end,
+              'wall_s': round(end - start, 4),
+              'kind': 'compile' if '-c' in command else 'link',
+              'cwd': os.getcwd(),
+              'sources': sources,
+              'output': output,
+              'retcode': retcode}
+    if output and os.path.isfile(output):
+        record['output_bytes'] = os.path.getsize(output)
+    if resource:
+        # the high-water mark of the compiler, reported in bytes on Macos and kB elsewhere
+        max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        record['peak_rss_kb'] = max_rss // 1024 if sys.platform == 'darwin' else max_rss
+
+    # a single short write in append mode, so that the lines of concurrent jobs don't interleave
+    with open(log, 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+
+    return retcode
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,92 @@
+import subprocess, os, sys, json, argparse
+
+# python scalability_benchmark.py --threads 16 [--duration 1] [--modes archive,shared] [-- extra conan arguments]
+#
+# Builds (or reuses) the icu package for every combination of shared/static libraries and data_packaging
+# mode through 'conan test', which runs test_package/benchmark/scalability.cpp at 1, 2, 4, ... --threads
+# threads (0 for one per cpu). The workloads open, use and close converters, collators, break iterators
+# and number/date formats on every iteration, so that contention in ICU's mutexes, caches and data
+# loading shows up. Reports the throughput, the scaling efficiency against one thread and the p50/p99/p99.9
+# latency per workload and thread count of every combination, and writes them to scalability.json.
+# The ICU errors of the workloads are listed after the table and make the script exit with 1.
+
+data_packagings = [ "shared", "static", "files", "archive" ]
+
+def print_table(combinations):
+    header = "{0:<8} {1:<8} {2:<32} {3:>7} {4:>12} {5:>10} {6:>10} {7:>10} {8:>10}".format(
+        "libs", "data", "workload", "threads", "ops/s", "efficiency", "p50 us", "p99 us", "p99.9 us")
+    print(header)
+    print("-" * len(header))
+    for combination in combinations:
+        for step in combination['steps']:
+            print("{0:<8} {1:<8} {2:<32} {3:>7} {4:>12.1f} {5:>9.1f}% {6:>10.1f} {7:>10.1f} {8:>10.1f}".format(
+                'shared' if combination['shared'] else 'static', combination['data_packaging'], step['workload'],
+                step['threads'], step['ops_per_s'], step['efficiency'] * 100.0, step['p50_us'], step['p99_us'],
+                step['p999_us']))
+
+def main(args, conan_args):
+    reference = "{0}/{1}@{2}".format(args.name, args.version, args.channel)
+    results_dir = os.path.abspath(args.results_dir)
+    if not os.path.isdir(results_dir):
+        os.makedirs(results_dir)
+
+    combinations = []
+    expected = 0
+    errors = 0
+    for shared in [s.strip() == 'True' for s in args.shared.split(',')]:
+        for mode in args.modes.split(','):
+            expected += 1
+            name = '{0}-{1}'.format('shared' if shared else 'static', mode)
+            results_file = os.path.join(results_dir, 'scalability-{0}.json'.format(name))
+            env = dict(os.environ)
+            env['CONAN_ICU_SCALABILITY'] = str(args.threads)
+            env['CONAN_ICU_SCALABILITY_DURATION'] = str(args.duration)
+            env['CONAN_ICU_SCALABILITY_JSON'] = results_file
+
+            cmd = [ 'conan', 'test', 'test_package', reference, '--build', 'missing',
+                    '-o', 'icu:data_packaging={0}'.format(mode),
+                    '-o', 'icu:shared={0}'.format(shared) ] + conan_args
+            print("[{0}] {1}".format(name, " ".join(cmd)))
+            sys.stdout.flush()
+            if subprocess.call(cmd, env=env) != 0 or not os.path.isfile(results_file):
+                print("ERROR: the scalability benchmark failed for shared={0} data_packaging={1}".format(shared, mode))
+                continue
+
+            with open(results_file, 'r') as f:
+                results = json.load(f)
+            combinations.append({ 'shared': shared, 'data_packaging': mode, 'icu_version': results['icu_version'],
+                                  'max_threads': results['max_threads'], 'steps': results['steps'],
+                                  'failed_workloads': results.get('failed_workloads', []) })
+
+    print_table(combinations)
+    for combination in combinations:
+        name = '{0}-{1}'.format('shared' if combination['shared'] else 'static', combination['data_packaging'])
+        for workload in combination['failed_workloads']:
+            print("ERROR: {0}: {1} failed".format(name, workload))
+            errors += 1
+        for step in combination['steps']:
+            if step['errors']:
+                print("ERROR: {0}: {1} at {2} threads: {3} of {4} iterations failed".format(
+                    name, step['workload'], step['threads'], step['errors'], step['operations']))
+                errors += 1
+    with open('scalability.json', 'w') as f:
+        json.dump(combinations, f, indent=2, sort_keys=True)
+
+    return 0 if len(combinations) == expected and not errors else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=0, help='highest thread count, 0 for one per cpu')
+    parser.add_argument('--duration', type=float, default=1.0, help='seconds per workload and thread count')
+    parser.add_argument('--modes', default=",".join(data_packagings), help='comma separated data_packaging modes')
+    parser.add_argument('--shared', default='True,False', help='comma separated shared option values')
+    parser.add_argument('--name', default='icu')
+    parser.add_argument('--version', default='60.1')
+    parser.add_argument('--channel', default='sigmoidal/testing')
+    parser.add_argument('--results-dir', default='scalability_results')
+    args, conan_args = parser.parse_known_args()
+    if conan_args and conan_args[0] == '--':
+        conan_args = conan_args[1:]
+
+    exit(main(args, conan_args))
@@ -0,0 +1,72 @@
+// Cold start probe: opens the first converter and collator of a fresh process and reports, as one
+// JSON line, how long that took since main() together with the page faults and resident memory of
+// the process. test_package runs it many times per data_packaging mode (see coldstart_benchmark.py).
+
+#include <stdio.h>
+#include <chrono>
+#include "unicode/utypes.h"
+#include "unicode/ucnv.h"
+#include "unicode/ucol.h"
+
+#ifdef _WIN32
+#include <windows.h>
+#include <psapi.h>
+#else
+#include <sys/resource.h>
+#endif
+
+int main() {
+    typedef std::chrono::steady_clock clock;
+    clock::time_point start = clock::now();
+
+    // Shift_JIS is table based, so this loads the converter alias table and the .cnv data
+    UErrorCode cnv_status = U_ZERO_ERROR;
+#if !UCONFIG_NO_LEGACY_CONVERSION
+    UConverter *cnv = ucnv_open("Shift_JIS", &cnv_status);
+#else
+    UConverter *cnv = ucnv_open("UTF-16", &cnv_status);
+#endif
+    double ucnv_open_ms = std::chrono::duration<double, std::milli>(clock::now() - start).count();
+
+    UErrorCode coll_status = U_ZERO_ERROR;
+#if !UCONFIG_NO_COLLATION
+    UCollator *coll = ucol_open("de", &coll_status);
+#endif
+    double ucol_open_ms = std::chrono::duration<double, std::milli>(clock::now() - start).count();
+
+    long minor_faults = 0, major_faults = 0, max_rss_kb = 0;
+#ifdef _WIN32
+    PROCESS_MEMORY_COUNTERS counters;
+    if(GetProcessMemoryInfo(GetCurrentProcess(), &counters, sizeof(counters))) {
+        // Windows does not tell soft and hard faults apart
+        minor_faults = (long)counters.PageFaultCount;
+        max_rss_kb = (long)(counters.PeakWorkingSetSize / 1024);
+    }
+#else
+    struct rusage usage;
+    if(getrusage(RUSAGE_SELF, &usage) == 0) {
+        minor_faults = usage.ru_minflt;
+        major_faults = usage.ru_majflt;
+#ifdef __APPLE__
+        max_rss_kb = usage.ru_maxrss / 1024;
+#else
+        max_rss_kb = usage.ru_maxrss;
+#endif
+    }
+#endif
+
+    printf("{\"ucnv_open_ms\": %.4f, \"ucol_open_ms\": %.4f, \"ucnv_status\": \"%s\", \"ucol_status\": \"%s\", "
+           "\"minor_faults\": %ld, \"major_faults\": %ld, \"max_rss_kb\": %ld}\n",
+           ucnv_open_ms, ucol_open_ms, u_errorName(cnv_status), u_errorName(coll_status),
+           minor_faults, major_faults, max_rss_kb);
+
+    if(cnv) {
+        ucnv_close(cnv);
+    }
+#if !UCONFIG_NO_COLLATION
+    if(coll) {
+        ucol_close(coll);
+    }
+#endif
+    return U_SUCCESS(cnv_status) && U_SUCCESS(coll_status) ? 0 : 1;
+}
@@ -0,0 +1,297 @@
+// Multi-threaded scalability benchmark of the packaged ICU libraries. Every workload opens, uses
+// and closes its ICU service objects on each iteration, as a request handler of a threaded server
+// would, so the contention in ICU's internal mutexes, caches and data lookups shows up as lost
+// throughput and as latency tail. Each workload runs at 1, 2, 4, ... --threads threads for
+// --duration seconds and reports the throughput, the scaling efficiency against one thread
+// (throughput(n) / (n * throughput(1))) and the p50/p90/p99/p99.9 latency of one iteration.
+// Every workload is run once before it is measured, the cost of the first data load is
+// measured by coldstart.cpp. ICU errors are reported in the JSON (the errors of every step and the
+// failed_workloads that failed their first run) and don't change the exit code, which is left for
+// the test of the package itself.
+//
+// usage: icu_scalability [--json file] [--threads N] [--duration seconds]
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+#include <string>
+#include <vector>
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <thread>
+#include "unicode/utypes.h"
+#include "unicode/uversion.h"
+#include "unicode/ustring.h"
+#include "unicode/ucnv.h"
+#include "unicode/ucol.h"
+#include "unicode/brkiter.h"
+#include "unicode/numfmt.h"
+#include "unicode/datefmt.h"
+#include "unicode/locid.h"
+#include "unicode/unistr.h"
+
+#define LENGTHOF(array) (int32_t)(sizeof(array)/sizeof((array)[0]))
+
+typedef std::chrono::steady_clock bench_clock;
+
+static const char *sample_text =
+    "The quick brown fox jumps over the lazy dog. Falsches \xC3\x9C" "ben von Xylophonmusik qu\xC3\xA4lt jeden Zwerg. "
+    "\xE6\x9D\xB1\xE4\xBA\xAC\xE3\x81\xAF\xE6\x97\xA5\xE6\x9C\xAC\xE3\x81\xAE\xE9\xA6\x96\xE9\x83\xBD\xE3\x81\xA7\xE3\x81\x99\xE3\x80\x82 "
+    "\xD0\xA1\xD1\x8A\xD0\xB5\xD1\x88\xD1\x8C \xD0\xB6\xD0\xB5 \xD0\xB5\xD1\x89\xD1\x91 \xD1\x8D\xD1\x82\xD0\xB8\xD1\x85. ";
+
+static const char *locales[] = { "en_US", "de_DE", "fr_FR", "ja_JP", "ru_RU", "es_ES" };
+
+struct Workload {
+    const char *name;
+    // one iteration of the workload, run by the given thread, returns false on an ICU error
+    bool (*run)(int thread, uint64_t iteration);
+};
+
+struct Step {
+    std::string workload;
+    int threads;
+    double seconds;
+    uint64_t operations;
+    uint64_t errors;
+    double ops_per_s;
+    double efficiency;
+    double p50_us, p90_us, p99_us, p999_us;
+};
+
+static icu::UnicodeString text;
+static std::vector<icu::UnicodeString> words;
+
+static bool run_conversion(int thread, uint64_t iteration) {
+    static const char *charsets[] = {
+        "UTF-8", "ISO-8859-1",
+#if !UCONFIG_NO_LEGACY_CONVERSION
+        "Shift_JIS", "windows-1251",
+#endif
+    };
+    UErrorCode status = U_ZERO_ERROR;
+    UConverter *cnv = ucnv_open(charsets[(thread + iteration) % LENGTHOF(charsets)], &status);
+    char bytes[1024];
+    UChar back[512];
+    int32_t length = ucnv_fromUChars(cnv, bytes, (int32_t)sizeof(bytes), text.getBuffer(), text.length(), &status);
+    ucnv_toUChars(cnv, back, LENGTHOF(back), bytes, length, &status);
+    ucnv_close(cnv);
+    return U_SUCCESS(status) || status == U_INVALID_CHAR_FOUND;
+}
+
+#if !UCONFIG_NO_COLLATION
+static bool run_collation(int thread, uint64_t iteration) {
+    UErrorCode status = U_ZERO_ERROR;
+    UCollator *coll = ucol_open(locales[(thread + iteration) % LENGTHOF(locales)], &status);
+    uint8_t key[256];
+    for(size_t i = 0; U_SUCCESS(status) && i < words.size(); ++i) {
+        ucol_getSortKey(coll, words[i].getBuffer(), words[i].length(), key, (int32_t)sizeof(key));
+    }
+    ucol_close(coll);
+    return U_SUCCESS(status);
+}
+#endif
+
+#if !UCONFIG_NO_BREAK_ITERATION
+static bool run_break_iteration(int thread, uint64_t iteration) {
+    UErrorCode status = U_ZERO_ERROR;
+    icu::Locale locale(locales[(thread + iteration) % LENGTHOF(locales)]);
+    icu::BreakIterator *brk = (iteration % 2) ? icu::BreakIterator::createWordInstance(locale, status)
+                                              : icu::BreakIterator::createLineInstance(locale, status);
+    if(U_SUCCESS(status)) {
+        brk->setText(text);
+        for(int32_t pos = brk->first(); pos != icu::BreakIterator::DONE; pos = brk->next()) {
+        }
+    }
+    delete brk;
+    return U_SUCCESS(status);
+}
+#endif
+
+#if !UCONFIG_NO_FORMATTING
+static bool run_formatting(int thread, uint64_t iteration) {
+    UErrorCode status = U_ZERO_ERROR;
+    icu::Locale locale(locales[(thread + iteration) % LENGTHOF(locales)]);
+    icu::NumberFormat *number = icu::NumberFormat::createInstance(locale, status);
+    icu::DateFormat *date = icu::DateFormat::createDateTimeInstance(icu::DateFormat::kMedium, icu::DateFormat::kMedium, locale);
+    icu::UnicodeString result;
+    if(U_SUCCESS(status) && date != NULL) {
+        number->format(1234567.891 + (double)iteration, result);
+        date->format((UDate)1.5e12 + (UDate)iteration * 1000.0, result);
+    }
+    delete number;
+    delete date;
+    return U_SUCCESS(status) && date != NULL;
+}
+#endif
+
+static const Workload workloads[] = {
+    { "ucnv_open+convert+close", run_conversion },
+#if !UCONFIG_NO_COLLATION
+    { "ucol_open+getSortKey", run_collation },
+#endif
+#if !UCONFIG_NO_BREAK_ITERATION
+    { "BreakIterator create+iterate", run_break_iteration },
+#endif
+#if !UCONFIG_NO_FORMATTING
+    { "NumberFormat/DateFormat format", run_formatting },
+#endif
+};
+
+static double percentile_us(const std::vector<uint32_t> &sorted_ns, double pct) {
+    if(sorted_ns.empty()) {
+        return 0.0;
+    }
+    // nearest rank, as coldstart_benchmark.py computes its percentiles
+    size_t rank = (size_t)ceil(pct / 100.0 * (double)sorted_ns.size());
+    return sorted_ns[std::min(std::max(rank, (size_t)1), sorted_ns.size()) - 1] / 1000.0;
+}
+
+// Runs the workload on the given number of threads, which start together and stop after duration
+static Step run_step(const Workload &workload, int threads, double duration) {
+    std::atomic<int> ready(0);
+    std::atomic<bool> go(false), stop(false);
+    std::vector<std::vector<uint32_t> > latencies(threads);
+    std::vector<uint64_t> errors(threads, 0);
+    std::vector<std::thread> pool;
+
+    for(int t = 0; t < threads; ++t) {
+        pool.push_back(std::thread([&, t]() {
+            std::vector<uint32_t> &samples = latencies[t];
+            samples.reserve(1 << 16);
+            ++ready;
+            while(!go) {
+                std::this_thread::yield();
+            }
+            for(uint64_t iteration = 0; !stop; ++iteration) {
+                bench_clock::time_point start = bench_clock::now();
+                if(!workload.run(t, iteration)) {
+                    ++errors[t];
+                }
+                samples.push_back((uint32_t)std::min<int64_t>(0xffffffff,
+                    std::chrono::duration_cast<std::chrono::nanoseconds>(bench_clock::now() - start).count()));
+            }
+        }));
+    }
+
+    while(ready < threads) {
+        std::this_thread::yield();
+    }
+    bench_clock::time_point start = bench_clock::now();
+    go = true;
+    std::this_thread::sleep_for(std::chrono::duration<double>(duration));
+    stop = true;
+    for(size_t t = 0; t < pool.size(); ++t) {
+        pool[t].join();
+    }
+    double seconds = std::chrono::duration<double>(bench_clock::now() - start).count();
+
+    std::vector<uint32_t> all;
+    Step step = { workload.name, threads, seconds, 0, 0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0 };
+    for(int t = 0; t < threads; ++t) {
+        all.insert(all.end(), latencies[t].begin(), latencies[t].end());
+        step.errors += errors[t];
+    }
+    std::sort(all.begin(), all.end());
+    step.operations = all.size();
+    step.ops_per_s = step.operations / seconds;
+    step.p50_us = percentile_us(all, 50.0);
+    step.p90_us = percentile_us(all, 90.0);
+    step.p99_us = percentile_us(all, 99.0);
+    step.p999_us = percentile_us(all, 99.9);
+    return step;
+}
+
+static void write_json(FILE *out, const std::vector<Step> &steps, const std::vector<std::string> &failed_workloads,
+                       int max_threads, double duration) {
+    fprintf(out, "{\n  \"icu_version\": \"%s\",\n  \"static\": %s,\n  \"max_threads\": %d,\n  \"duration\": %g,\n  \"steps\": [\n",
+            U_ICU_VERSION,
+#ifdef U_STATIC_IMPLEMENTATION
+            "true",
+#else
+            "false",
+#endif
+            max_threads, duration);
+    for(size_t i = 0; i < steps.size(); ++i) {
+        const Step &s = steps[i];
+        fprintf(out, "    {\"workload\": \"%s\", \"threads\": %d, \"ops_per_s\": %.3f, \"efficiency\": %.4f, "
+                     "\"p50_us\": %.3f, \"p90_us\": %.3f, \"p99_us\": %.3f, \"p999_us\": %.3f, "
+                     "\"operations\": %llu, \"errors\": %llu, \"seconds\": %.6f}%s\n",
+                s.workload.c_str(), s.threads, s.ops_per_s, s.efficiency, s.p50_us, s.p90_us, s.p99_us, s.p999_us,
+                (unsigned long long)s.operations, (unsigned long long)s.errors, s.seconds,
+                i + 1 < steps.size() ? "," : "");
+    }
+    fprintf(out, "  ],\n  \"failed_workloads\": [");
+    for(size_t i = 0; i < failed_workloads.size(); ++i) {
+        fprintf(out, "%s\"%s\"", i ? ", " : "", failed_workloads[i].c_str());
+    }
+    fprintf(out, "]\n}\n");
+}
+
+int main(int argc, char **argv) {
+    const char *json_file = NULL;
+    int max_threads = (int)std::thread::hardware_concurrency();
+    double duration = 1.0;
+    for(int i = 1; i < argc; ++i) {
+        if(strcmp(argv[i], "--json") == 0 && i + 1 < argc) {
+            json_file = argv[++i];
+        } else if(strcmp(argv[i], "--threads") == 0 && i + 1 < argc) {
+            max_threads = atoi(argv[++i]);
+        } else if(strcmp(argv[i], "--duration") == 0 && i + 1 < argc) {
+            duration = atof(argv[++i]);
+        }
+    }
+    max_threads = std::max(1, max_threads);
+
+    text = icu::UnicodeString::fromUTF8(sample_text);
+    for(int32_t start = 0, end; start < text.length(); start = end + 1) {
+        end = text.indexOf((UChar)0x20, start);
+        if(end < 0) {
+            end = text.length();
+        }
+        if(end > start) {
+            words.push_back(icu::UnicodeString(text, start, end - start));
+        }
+    }
+
+    std::vector<int> thread_counts;
+    for(int threads = 1; threads < max_threads; threads *= 2) {
+        thread_counts.push_back(threads);
+    }
+    thread_counts.push_back(max_threads);
+
+    std::vector<Step> steps;
+    std::vector<std::string> failed_workloads;
+    for(int w = 0; w < LENGTHOF(workloads); ++w) {
+        if(!workloads[w].run(0, 0)) {
+            fprintf(stderr, "%s: failed\n", workloads[w].name);
+            failed_workloads.push_back(workloads[w].name);
+            continue;
+        }
+        double single = 0.0;
+        for(size_t i = 0; i < thread_counts.size(); ++i) {
+            Step step = run_step(workloads[w], thread_counts[i], duration);
+            if(step.threads == 1) {
+                single = step.ops_per_s;
+            }
+            step.efficiency = single > 0.0 ? step.ops_per_s / (step.threads * single) : 0.0;
+            fprintf(stderr, "%-32s %3d threads %12.1f ops/s %6.1f%% efficiency  p50 %8.1f  p99 %8.1f  p99.9 %8.1f us\n",
+                    step.workload.c_str(), step.threads, step.ops_per_s, step.efficiency * 100.0,
+                    step.p50_us, step.p99_us, step.p999_us);
+            steps.push_back(step);
+        }
+    }
+
+    write_json(stdout, steps, failed_workloads, max_threads, duration);
+    if(json_file) {
+        FILE *out = fopen(json_file, "w");
+        if(!out) {
+            fprintf(stderr, "cannot write %s\n", json_file);
+            return 1;
+        }
+        write_json(out, steps, failed_workloads, max_threads, duration);
+        fclose(out);
+    }
+    return 0;
+}
@@ -0,0 +1,286 @@
+// Throughput benchmark of the packaged ICU libraries: conversion, collation, normalization,
+// break iteration and case mapping over a fixed synthetic corpus. The results are printed
+// as JSON, so that packages built with different settings/options can be compared.
+//
+// usage: icu_benchmark [--json file] [--min-time seconds]
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <string>
+#include <vector>
+#include <chrono>
+#include "unicode/utypes.h"
+#include "unicode/uversion.h"
+#include "unicode/ustring.h"
+#include "unicode/ucnv.h"
+#include "unicode/ucol.h"
+#include "unicode/unorm2.h"
+#include "unicode/ubrk.h"
+
+#define LENGTHOF(array) (int32_t)(sizeof(array)/sizeof((array)[0]))
+
+// UTF-8 source lines, the corpora below repeat them up to about 256 KB of UTF-16
+static const char *latin_lines[] = {
+    "The quick brown fox jumps over the lazy dog. It's 3:45 p.m., isn't it? ",
+    "Falsches \xC3\x9C" "ben von Xylophonmusik qu\xC3\xA4lt jeden gr\xC3\xB6\xC3\x9F" "eren Zwerg. ",
+    "Voix ambigu\xC3\xAB d'un c\xC5\x93ur qui au z\xC3\xA9phyr pr\xC3\xA9" "f\xC3\xA8re les jattes de kiwis. ",
+    "El ping\xC3\xBCino Wenceslao hizo kil\xC3\xB3metros bajo exhaustiva lluvia y fr\xC3\xADo. "
+};
+
+static const char *japanese_lines[] = {
+    "\xE3\x81\x84\xE3\x82\x8D\xE3\x81\xAF\xE3\x81\xAB\xE3\x81\xBB\xE3\x81\xB8\xE3\x81\xA8\xE3\x80\x81\xE6\x97\xA5\xE6\x9C\xAC\xE8\xAA\x9E\xE3\x81\xAE\xE6\x96\x87\xE7\xAB\xA0\xE3\x81\xA7\xE3\x81\x99\xE3\x80\x82",
+    "\xE6\x9D\xB1\xE4\xBA\xAC\xE3\x81\xAF\xE6\x97\xA5\xE6\x9C\xAC\xE3\x81\xAE\xE9\xA6\x96\xE9\x83\xBD\xE3\x81\xA7\xE3\x81\x99\xE3\x80\x82ICU 60.1 ",
+    "\xE3\x82\xAB\xE3\x82\xBF\xE3\x82\xAB\xE3\x83\x8A\xE3\x81\xA8\xE3\x81\xB2\xE3\x82\x89\xE3\x81\x8C\xE3\x81\xAA\xE3\x80\x81\xE6\xBC\xA2\xE5\xAD\x97\xE3\x80\x82"
+};
+
+static const char *other_lines[] = {
+    "\xD0\xA1\xD1\x8A\xD0\xB5\xD1\x88\xD1\x8C \xD0\xB6\xD0\xB5 \xD0\xB5\xD1\x89\xD1\x91 \xD1\x8D\xD1\x82\xD0\xB8\xD1\x85 \xD0\xBC\xD1\x8F\xD0\xB3\xD0\xBA\xD0\xB8\xD1\x85 \xD0\xB1\xD1\x83\xD0\xBB\xD0\xBE\xD0\xBA. ",
+    "\xE4\xB8\xAD\xE6\x96\x87\xE6\x96\x87\xE6\x9C\xAC\xE7\x9A\x84\xE6\x96\xAD\xE8\xAF\x8D\xE5\x92\x8C\xE6\x8E\x92\xE5\xBA\x8F\xE3\x80\x82",
+    "\xD8\xA7\xD9\x84\xD8\xB9\xD8\xB1\xD8\xA8\xD9\x8A\xD8\xA9 \xD9\x84\xD8\xBA\xD8\xA9 \xD8\xAC\xD9\x85\xD9\x8A\xD9\x84\xD8\xA9. ",
+    "e\xCC\x81" "cole, A\xCC\x8A" "ngstro\xCC\x88m, \xEF\xAC\x81nance, \xE2\x84\xAB. "
+};
+
+typedef std::vector<UChar> UText16;
+
+struct Result {
+    std::string name;
+    double seconds;
+    long long operations;
+    double bytes;
+};
+
+static std::vector<Result> results;
+static double min_time = 0.5;
+static int failures = 0;
+
+static void check(UErrorCode status, const char *what) {
+    if(U_FAILURE(status)) {
+        fprintf(stderr, "%s: %s\n", what, u_errorName(status));
+        ++failures;
+    }
+}
+
+static UText16 toUText16(const char **lines, int32_t count) {
+    UText16 line, text;
+    for(int32_t i = 0; i < count; ++i) {
+        UErrorCode status = U_ZERO_ERROR;
+        int32_t length = 0;
+        u_strFromUTF8(NULL, 0, &length, lines[i], -1, &status);
+        status = U_ZERO_ERROR;
+        line.resize(length);
+        u_strFromUTF8(&line[0], length, NULL, lines[i], -1, &status);
+        check(status, "u_strFromUTF8");
+        text.insert(text.end(), line.begin(), line.end());
+    }
+    return text;
+}
+
+static UText16 repeat(const UText16 &line, size_t size) {
+    UText16 text;
+    while(text.size() < size) {
+        text.insert(text.end(), line.begin(), line.end());
+    }
+    return text;
+}
+
+// Runs op() until min_time has elapsed, op() returns the number of bytes it processed
+template<typename Op>
+static void measure(const std::string &name, Op op) {
+    typedef std::chrono::steady_clock clock;
+    Result result = { name, 0.0, 0, 0.0 };
+    clock::time_point start = clock::now();
+    do {
+        result.bytes += op();
+        ++result.operations;
+        result.seconds = std::chrono::duration<double>(clock::now() - start).count();
+    } while(result.seconds < min_time);
+    results.push_back(result);
+    fprintf(stderr, "%-40s %10.1f MB/s %12.1f ops/s\n", name.c_str(),
+            result.bytes / result.seconds / 1e6, result.operations / result.seconds);
+}
+
+static void bench_conversion(const char *charset, const UText16 &text) {
+    UErrorCode status = U_ZERO_ERROR;
+    UConverter *cnv = ucnv_open(charset, &status);
+    if(U_FAILURE(status)) {
+        check(status, charset);
+        return;
+    }
+
+    std::vector<char> bytes(text.size() * 4);
+    UText16 back(text.size() + 16);
+    int32_t length = ucnv_fromUChars(cnv, &bytes[0], (int32_t)bytes.size(), &text[0], (int32_t)text.size(), &status);
+    check(status, charset);
+
+    measure(std::string("ucnv_fromUChars/") + charset, [&]() {
+        UErrorCode status = U_ZERO_ERROR;
+        ucnv_fromUChars(cnv, &bytes[0], (int32_t)bytes.size(), &text[0], (int32_t)text.size(), &status);
+        return (double)text.size() * sizeof(UChar);
+    });
+    measure(std::string("ucnv_toUChars/") + charset, [&]() {
+        UErrorCode status = U_ZERO_ERROR;
+        ucnv_toUChars(cnv, &back[0], (int32_t)back.size(), &bytes[0], length, &status);
+        return (double)length;
+    });
+    ucnv_close(cnv);
+}
+
+#if !UCONFIG_NO_COLLATION
+static void bench_collation(const char *locale, const std::vector<UText16> &words) {
+    UErrorCode status = U_ZERO_ERROR;
+    UCollator *coll = ucol_open(locale, &status);
+    if(U_FAILURE(status)) {
+        check(status, locale);
+        return;
+    }
+
+    double bytes = 0;
+    for(size_t i = 0; i < words.size(); ++i) {
+        bytes += words[i].size() * sizeof(UChar);
+    }
+
+    uint8_t key[1024];
+    measure(std::string("ucol_getSortKey/") + locale, [&]() {
+        for(size_t i = 0; i < words.size(); ++i) {
+            ucol_getSortKey(coll, &words[i][0], (int32_t)words[i].size(), key, (int32_t)sizeof(key));
+        }
+        return bytes;
+    });
+    measure(std::string("ucol_strcoll/") + locale, [&]() {
+        for(size_t i = 1; i < words.size(); ++i) {
+            ucol_strcoll(coll, &words[i - 1][0], (int32_t)words[i - 1].size(), &words[i][0], (int32_t)words[i].size());
+        }
+        return bytes;
+    });
+    ucol_close(coll);
+}
+#endif
+
+static void bench_normalization(const char *form, const UNormalizer2 *norm2, const UText16 &text) {
+    UText16 dest(text.size() * 4);
+    measure(std::string("unorm2_normalize/") + form, [&]() {
+        UErrorCode status = U_ZERO_ERROR;
+        unorm2_normalize(norm2, &text[0], (int32_t)text.size(), &dest[0], (int32_t)dest.size(), &status);
+        return (double)text.size() * sizeof(UChar);
+    });
+}
+
+#if !UCONFIG_NO_BREAK_ITERATION
+static void bench_break(const char *kind, UBreakIteratorType type, const UText16 &text) {
+    UErrorCode status = U_ZERO_ERROR;
+    UBreakIterator *brk = ubrk_open(type, "en", &text[0], (int32_t)text.size(), &status);
+    if(U_FAILURE(status)) {
+        check(status, kind);
+        return;
+    }
+    measure(std::string("ubrk_next/") + kind, [&]() {
+        ubrk_first(brk);
+        while(ubrk_next(brk) != UBRK_DONE) {
+        }
+        return (double)text.size() * sizeof(UChar);
+    });
+    ubrk_close(brk);
+}
+#endif
+
+static void bench_case(const UText16 &text) {
+    UText16 dest(text.size() * 3);
+    measure("u_strToUpper/root", [&]() {
+        UErrorCode status = U_ZERO_ERROR;
+        u_strToUpper(&dest[0], (int32_t)dest.size(), &text[0], (int32_t)text.size(), "", &status);
+        return (double)text.size() * sizeof(UChar);
+    });
+}
+
+static void write_json(FILE *out) {
+    fprintf(out, "{\n  \"icu_version\": \"%s\",\n  \"static\": %s,\n  \"min_time\": %g,\n  \"failures\": %d,\n  \"benchmarks\": [\n",
+            U_ICU_VERSION,
+#ifdef U_STATIC_IMPLEMENTATION
+            "true",
+#else
+            "false",
+#endif
+            min_time, failures);
+    for(size_t i = 0; i < results.size(); ++i) {
+        const Result &r = results[i];
+        fprintf(out, "    {\"name\": \"%s\", \"mb_per_s\": %.3f, \"ops_per_s\": %.3f, \"operations\": %lld, \"seconds\": %.6f}%s\n",
+                r.name.c_str(), r.bytes / r.seconds / 1e6, r.operations / r.seconds, r.operations, r.seconds,
+                i + 1 < results.size() ? "," : "");
+    }
+    fprintf(out, "  ]\n}\n");
+}
+
+int main(int argc, char **argv) {
+    const char *json_file = NULL;
+    for(int i = 1; i < argc; ++i) {
+        if(strcmp(argv[i], "--json") == 0 && i + 1 < argc) {
+            json_file = argv[++i];
+        } else if(strcmp(argv[i], "--min-time") == 0 && i + 1 < argc) {
+            min_time = atof(argv[++i]);
+        }
+    }
+
+    const size_t corpus_size = 128 * 1024;
+    UText16 latin = repeat(toUText16(latin_lines, LENGTHOF(latin_lines)), corpus_size);
+    UText16 japanese = repeat(toUText16(japanese_lines, LENGTHOF(japanese_lines)), corpus_size);
+    UText16 mixed = latin;
+    mixed.insert(mixed.end(), japanese.begin(), japanese.end());
+    UText16 other = repeat(toUText16(other_lines, LENGTHOF(other_lines)), corpus_size);
+    mixed.insert(mixed.end(), other.begin(), other.end());
+
+    bench_conversion("UTF-8", mixed);
+    bench_conversion("ISO-8859-1", latin);
+#if !UCONFIG_NO_LEGACY_CONVERSION
+    bench_conversion("Shift_JIS", japanese);
+#endif
+
+    // space separated words of the mixed corpus for collation
+    std::vector<UText16> words;
+    UText16 word;
+    for(size_t i = 0; i < mixed.size() && words.size() < 20000; ++i) {
+        if(mixed[i] == 0x20) {
+            if(!word.empty()) {
+                words.push_back(word);
+            }
+            word.clear();
+        } else {
+            word.push_back(mixed[i]);
+        }
+    }
+#if !UCONFIG_NO_COLLATION
+    if(!words.empty()) {
+        bench_collation("en", words);
+        bench_collation("de", words);
+        bench_collation("ja", words);
+    }
+#endif
+
+    UErrorCode status = U_ZERO_ERROR;
+    const UNormalizer2 *nfc = unorm2_getNFCInstance(&status);
+    const UNormalizer2 *nfd = unorm2_getNFDInstance(&status);
+    const UNormalizer2 *nfkc = unorm2_getNFKCInstance(&status);
+    check(status, "unorm2_get*Instance");
+    if(U_SUCCESS(status)) {
+        bench_normalization("NFC", nfc, mixed);
+        bench_normalization("NFD", nfd, mixed);
+        bench_normalization("NFKC", nfkc, mixed);
+    }
+
+#if !UCONFIG_NO_BREAK_ITERATION
+    bench_break("word", UBRK_WORD, mixed);
+    bench_break("line", UBRK_LINE, mixed);
+#endif
+
+    bench_case(mixed);
+
+    write_json(stdout);
+    if(json_file) {
+        FILE *out = fopen(json_file, "w");
+        if(out) {
+            write_json(out);
+            fclose(out);
+        }
+    }
+    return failures == 0 ? 0 : 1;
+}
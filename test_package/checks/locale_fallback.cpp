@@ -0,0 +1,52 @@
+// Locale fallback check: every locale falls back to root, which data_filter builds must keep in each locale
+// tree whatever locales are listed. Opens root, the locale bundle and the collator of the locale given on the
+// command line (de by default) and exits with 1 when one of them doesn't resolve. The collator is left out
+// when the package is linked without i18n (ICU_TEST_WITH_I18N unset).
+
+#include <stdio.h>
+#include "unicode/utypes.h"
+#include "unicode/ures.h"
+#include "unicode/ucol.h"
+
+int main(int argc, char **argv) {
+    const char *locale = argc > 1 ? argv[1] : "de";
+    int failures = 0;
+
+    UErrorCode status = U_ZERO_ERROR;
+    UResourceBundle *root = ures_openDirect(NULL, "root", &status);
+    printf("root bundle: %s\n", u_errorName(status));
+    failures += U_FAILURE(status) ? 1 : 0;
+    ures_close(root);
+
+    status = U_ZERO_ERROR;
+    UResourceBundle *bundle = ures_open(NULL, locale, &status);
+    if(U_SUCCESS(status)) {
+        UErrorCode locale_status = U_ZERO_ERROR;
+        printf("%s bundle: %s, resolved to %s\n", locale, u_errorName(status),
+               ures_getLocaleByType(bundle, ULOC_ACTUAL_LOCALE, &locale_status));
+    } else {
+        printf("%s bundle: %s\n", locale, u_errorName(status));
+        ++failures;
+    }
+    ures_close(bundle);
+
+#if !UCONFIG_NO_COLLATION && defined(ICU_TEST_WITH_I18N)
+    // the collation of de is root's, ucol_open() fails without coll/root.res
+    status = U_ZERO_ERROR;
+    UCollator *coll = ucol_open(locale, &status);
+    if(U_SUCCESS(status)) {
+        UErrorCode locale_status = U_ZERO_ERROR;
+        static const UChar a[] = { 0x61, 0 }, b[] = { 0x62, 0 };
+        UCollationResult order = ucol_strcoll(coll, a, -1, b, -1);
+        printf("%s collator: %s, resolved to %s, a %s b\n", locale, u_errorName(status),
+               ucol_getLocaleByType(coll, ULOC_ACTUAL_LOCALE, &locale_status), order == UCOL_LESS ? "<" : ">=");
+        failures += order == UCOL_LESS ? 0 : 1;
+    } else {
+        printf("%s collator: %s\n", locale, u_errorName(status));
+        ++failures;
+    }
+    ucol_close(coll);
+#endif
+
+    return failures ? 1 : 0;
+}
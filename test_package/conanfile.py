@@ -1,5 +1,34 @@
 from conans import ConanFile, tools, CMake
 import os
+import re
+import ctypes
+import glob
+import json
+import time
+import subprocess
+import shutil
+
+#
+# Set CONAN_ICU_BENCHMARK=1 to also run the throughput benchmark (benchmark/throughput.cpp) against
+# the package. Its JSON results are written to bin/benchmark_throughput.json.
+#
+# Set CONAN_ICU_COLDSTART=<runs> to start benchmark/coldstart.cpp that many times as a fresh process.
+# The samples are written to CONAN_ICU_COLDSTART_JSON (bin/coldstart.json by default), see
+# coldstart_benchmark.py for the comparison of the data_packaging modes.
+#
+# Set CONAN_ICU_SCALABILITY=<threads> to run benchmark/scalability.cpp at 1, 2, 4, ... <threads> threads
+# (0 for one per cpu), each step for CONAN_ICU_SCALABILITY_DURATION seconds (1 by default). The results
+# are written to CONAN_ICU_SCALABILITY_JSON (bin/scalability.json by default), see scalability_benchmark.py.
+#
+# The benchmarks need the i18n library, they are skipped when it isn't among the linked components
+# (i.e. -o icu:components=uc).
+#
+# A runtime_only package has no headers to compile against: nothing is built, the shared libraries are
+# loaded and u_init() opens the data instead.
+#
+# With CONAN_ICU_METRICS_DIR set, the benchmark results are also copied to
+# <metrics dir>/benchmarks/<icu package id>/, where build_history.py picks them up with the build metrics.
+#
 
 class ICUTestConan(ConanFile):
     settings = "os", "compiler", "build_type", "arch"
@@ -8,8 +37,11 @@ class ICUTestConan(ConanFile):
     default_options = "shared=False"
 
     def build(self):
+        if self.runtime_only():
+            return
         cmake = CMake(self)
         cmake.verbose = True
+        cmake.definitions["ICU_WITH_I18N"] = "ON" if self.with_i18n() else "OFF"
         cmake.configure()
         cmake.build()
 
@@ -19,9 +51,111 @@ class ICUTestConan(ConanFile):
         self.copy("*.dylib*", dst="bin", src=lib_dir_src)
         self.copy('*.so*', dst='bin', src=lib_dir_src)
 
+    def runtime_only(self):
+        return not os.path.isdir(os.path.join(self.deps_cpp_info["icu"].rootpath, "include"))
+
+    # Loads icudata and icuuc from bin_dir, data first so that icuuc finds it loaded, and has u_init() open
+    # the data, which ICU_DATA points to unless it is built into the libraries
+    def check_runtime(self, bin_dir):
+        libraries = {}
+        for name in sorted(os.listdir(bin_dir)):
+            m = re.match(r'^(?:lib)?icu(data|dt|uc)[.0-9]*d?\.(?:so|dylib|dll)', name)
+            if m and not os.path.islink(os.path.join(bin_dir, name)):
+                libraries['uc' if m.group(1) == 'uc' else 'data'] = os.path.join(bin_dir, name)
+        if sorted(libraries) != ['data', 'uc']:
+            raise Exception("The runtime package lacks the icudata or icuuc shared library, found {0}".format(
+                ", ".join(sorted(libraries.values())) or "none"))
+
+        mode = getattr(ctypes, 'RTLD_GLOBAL', 0)
+        ctypes.CDLL(libraries['data'], mode=mode)
+        icuuc = ctypes.CDLL(libraries['uc'], mode=mode)
+        # the functions are suffixed with the major version, unless ICU was built with U_DISABLE_RENAMING
+        suffix = "_{0}".format(str(self.deps_cpp_info["icu"].version).split('.')[0])
+        u_init = getattr(icuuc, "u_init" + suffix, None) or icuuc.u_init
+        u_error_name = getattr(icuuc, "u_errorName" + suffix, None) or icuuc.u_errorName
+        u_error_name.restype = ctypes.c_char_p
+
+        status = ctypes.c_int(0)
+        u_init(ctypes.byref(status))
+        self.output.info("u_init: {0}".format(u_error_name(status).decode('utf-8')))
+        # U_FAILURE(): errors are positive, warnings negative
+        if status.value > 0:
+            raise Exception("The runtime package's libraries don't load their data")
+
+    # icui18n on Unix, icuin (s-prefixed when static, d-suffixed in Debug) on Windows
+    def with_i18n(self):
+        return any(re.match(r's?icu(i18n|in)d?$', lib) for lib in self.deps_cpp_info["icu"].libs)
+
+    def icu_data_dir(self):
+        # the archive data packaging is looked up in share/icu/<version>, the files packaging
+        # in its icudt<version><endianness> subdirectory, ICU_DATA takes a list of both
+        data_dirs = glob.glob(os.path.join(self.deps_cpp_info["icu"].rootpath, "share", "icu", "*"))
+        if not data_dirs:
+            return ""
+        return os.pathsep.join([data_dirs[0]] + [path for path in glob.glob(os.path.join(data_dirs[0], "icudt*"))
+                                                 if os.path.isdir(path)])
+
+    def run_coldstart(self, runs):
+        samples = []
+        for _ in range(runs):
+            if os.environ.get("CONAN_ICU_COLDSTART_DROP_CACHES"):
+                subprocess.call("sync && echo 3 > /proc/sys/vm/drop_caches", shell=True)
+            start = time.time()
+            process = subprocess.Popen([os.path.join(os.getcwd(), "icu_coldstart")], stdout=subprocess.PIPE)
+            output, _ = process.communicate()
+            process_ms = (time.time() - start) * 1000.0
+            # a failing run is kept as a sample, coldstart_benchmark.py counts it as a failure
+            try:
+                sample = json.loads(output.decode("utf-8").strip())
+            except ValueError:
+                sample = {}
+            sample["process_ms"] = process_ms
+            sample["returncode"] = process.returncode
+            samples.append(sample)
+
+        results_file = os.environ.get("CONAN_ICU_COLDSTART_JSON", os.path.join(os.getcwd(), "coldstart.json"))
+        with open(results_file, "w") as f:
+            json.dump({"icu_data": os.environ.get("ICU_DATA", ""), "samples": samples}, f, indent=2)
+        self.output.info("Cold start samples of {0} runs written to {1}".format(runs, results_file))
+
     def test(self):
         bin_dir = os.path.join(os.getcwd(), "bin")
         os.chdir(bin_dir)
-        with tools.environment_append({"LD_LIBRARY_PATH": bin_dir, "DYLD_LIBRARY_PATH": bin_dir}):
+        benchmark_results = []
+        with tools.environment_append({"LD_LIBRARY_PATH": bin_dir, "DYLD_LIBRARY_PATH": bin_dir, "ICU_DATA": self.icu_data_dir()}):
+            if self.runtime_only():
+                self.check_runtime(bin_dir)
+                return
+
             self.run(".{0}test_package".format(os.sep))
+            # a data_filter build must still fall back to root (checks/locale_fallback.cpp)
+            self.run(".{0}icu_locale_fallback de".format(os.sep))
+
+            benchmarks = [var for var in ("CONAN_ICU_BENCHMARK", "CONAN_ICU_COLDSTART", "CONAN_ICU_SCALABILITY")
+                          if os.environ.get(var)]
+            if benchmarks and not self.with_i18n():
+                self.output.warn("{0} skipped, the benchmarks need the i18n component".format(", ".join(benchmarks)))
+                benchmarks = []
+
+            if "CONAN_ICU_BENCHMARK" in benchmarks:
+                self.run(".{0}icu_benchmark --json benchmark_throughput.json".format(os.sep))
+                benchmark_results.append(("throughput.json", os.path.join(bin_dir, "benchmark_throughput.json")))
+
+            if "CONAN_ICU_COLDSTART" in benchmarks:
+                self.run_coldstart(int(os.environ["CONAN_ICU_COLDSTART"]))
+
+            if "CONAN_ICU_SCALABILITY" in benchmarks:
+                threads = int(os.environ["CONAN_ICU_SCALABILITY"]) or tools.cpu_count()
+                results_file = os.environ.get("CONAN_ICU_SCALABILITY_JSON", os.path.join(os.getcwd(), "scalability.json"))
+                self.run(".{0}icu_scalability --threads {1} --duration {2} --json \"{3}\"".format(
+                    os.sep, threads, os.environ.get("CONAN_ICU_SCALABILITY_DURATION", "1"), results_file))
+                benchmark_results.append(("scalability.json", results_file))
 
+        if benchmark_results and os.environ.get("CONAN_ICU_METRICS_DIR"):
+            # the package folder is named after the package id, which keys the build metrics as well
+            package_id = os.path.basename(os.path.normpath(self.deps_cpp_info["icu"].rootpath))
+            results_dir = os.path.join(os.environ["CONAN_ICU_METRICS_DIR"], "benchmarks", package_id)
+            if not os.path.isdir(results_dir):
+                os.makedirs(results_dir)
+            for name, results_file in benchmark_results:
+                shutil.copy(results_file, os.path.join(results_dir, name))
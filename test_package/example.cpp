@@ -326,6 +326,7 @@ static void demoCaseMapInC() {
     } else {
         printf("error in u_strToUpper(tr)=%ld error=%s\n", length, u_errorName(errorCode));
     }
+#if !UCONFIG_NO_BREAK_ITERATION
     /* titlecase/English */
     errorCode=U_ZERO_ERROR;
     length=u_strToTitle(buffer, UPRV_LENGTHOF(buffer), input, -1, NULL, "en", &errorCode);
@@ -342,6 +343,7 @@ static void demoCaseMapInC() {
     } else {
         printf("error in u_strToTitle(tr)=%ld error=%s\n", length, u_errorName(errorCode));
     }
+#endif
     /* case-fold/default */
     errorCode=U_ZERO_ERROR;
     length=u_strFoldCase(buffer, UPRV_LENGTHOF(buffer), input, -1, U_FOLD_CASE_DEFAULT, &errorCode);
@@ -399,10 +401,12 @@ static void demoCaseMapInCPlusPlus() {
     printUnicodeString("full-uppercased/en: ", (t=s).toUpper(en));
     /* uppercase/Turkish */
     printUnicodeString("full-uppercased/tr: ", (t=s).toUpper(tr));
+#if !UCONFIG_NO_BREAK_ITERATION
     /* titlecase/English */
     printUnicodeString("full-titlecased/en: ", (t=s).toTitle(NULL, en));
     /* titlecase/Turkish */
     printUnicodeString("full-titlecased/tr: ", (t=s).toTitle(NULL, tr));
+#endif
     /* case-folde/default */
     printUnicodeString("full-case-folded/default: ", (t=s).foldCase(U_FOLD_CASE_DEFAULT));
     /* case-folde/Turkic */